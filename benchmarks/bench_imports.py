@@ -0,0 +1,117 @@
+"""Check the start-up import cost of the service and CLI entry points.
+
+Each entry module is imported in a fresh interpreter under
+``python -X importtime`` and its cumulative import time is compared with
+``benchmarks/import_budget.json``. Heavy dependencies (torch, SciPy, OpenCV,
+...) are meant to be imported on first use, so the budget also lists modules
+that must not be imported at start-up; pulling one in is reported even when
+the time is still within budget, since it is the usual cause of a cold-start
+regression.
+
+Usage::
+
+    python benchmarks/bench_imports.py                # check every entry point
+    python benchmarks/bench_imports.py main --repeat 9
+
+The script exits with status 1 when any entry point breaks its budget.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FLASK_API = os.path.join(HERE, '..', 'photoshop_underwater_plugin_bundle', 'flask_api')
+BUDGET_PATH = os.path.join(HERE, 'import_budget.json')
+
+ENTRY_POINTS = ('main', 'local_cli', 'run_service')
+
+
+def parse_importtime(stderr: str):
+    """Return ``{module: cumulative_seconds}`` from ``-X importtime`` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def measure(module: str, repeat: int = 5):
+    """Import ``module`` ``repeat`` times in fresh interpreters.
+
+    Returns ``{'seconds', 'modules'}``: the best cumulative import time of
+    ``module`` itself (interpreter start-up excluded) and the sorted names
+    of every module imported along the way.
+    """
+    best = float('inf')
+    modules = set()
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=FLASK_API, capture_output=True, text=True)
+        if proc.returncode:
+            raise RuntimeError(f'import {module} failed:\n{proc.stderr}')
+        times = parse_importtime(proc.stderr)
+        best = min(best, times[module])
+        modules.update(times)
+    return {'seconds': best, 'modules': sorted(modules)}
+
+
+def run(entry_points=ENTRY_POINTS, repeat: int = 5):
+    return {module: measure(module, repeat) for module in entry_points}
+
+
+def check(results, budget, timings: bool = True):
+    """Return a list of budget violations.
+
+    ``timings=False`` only checks for forbidden imports, which unlike the
+    times do not depend on how busy the machine is.
+    """
+    violations = []
+    for module, result in results.items():
+        limits = budget.get(module)
+        if limits is None:
+            continue
+        if timings and result['seconds'] * 1000 > limits['max_ms']:
+            violations.append(f"{module}: {result['seconds'] * 1000:.0f} ms to import, "
+                              f"budget {limits['max_ms']} ms")
+        imported = set(result['modules'])
+        for name in limits.get('forbidden', ()):
+            if name in imported:
+                violations.append(f'{module}: imports {name} at start-up')
+    return violations
+
+
+def format_results(results) -> str:
+    return "\n".join(f"{module:<12} {result['seconds'] * 1000:8.1f} ms "
+                     f"{len(result['modules']):5d} modules"
+                     for module, result in results.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('modules', nargs='*', default=list(ENTRY_POINTS),
+                        help='Entry modules to check')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Fresh interpreters per module (best is kept)')
+    parser.add_argument('--budget', default=BUDGET_PATH, help='Budget JSON file')
+    args = parser.parse_args(argv)
+
+    results = run(args.modules, args.repeat)
+    print(format_results(results))
+    with open(args.budget) as f:
+        violations = check(results, json.load(f))
+    for message in violations:
+        print(f"OVER BUDGET {message}")
+    if not violations:
+        print("All entry points within budget")
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
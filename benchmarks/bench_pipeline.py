@@ -0,0 +1,262 @@
+"""Benchmark the correction pipeline on synthetic underwater scenes.
+
+Each scene is rendered from a known depth map and known water properties
+(attenuation and backscatter per channel), so the harness can report how
+well the basic model recovers beta alongside how fast each stage runs.
+Stages are timed the way the pipeline runs them: the coefficient fits on a
+copy downsampled to ``FIT_MAX_SIDE`` and the corrections at full resolution.
+Depth estimation uses a tiny stand-in network so the numbers measure the
+surrounding pre/post-processing rather than MiDaS itself.
+
+Usage::
+
+    python benchmarks/bench_pipeline.py                  # 1, 12 and 45 MP
+    python benchmarks/bench_pipeline.py --sizes 1 12 --repeat 5
+    python benchmarks/bench_pipeline.py --save-baseline  # record new baseline
+
+Results are compared with ``benchmarks/baseline.json``; a stage that is more
+than ``--tolerance`` slower, or uses that much more peak memory, is reported
+as a regression and the script exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'photoshop_underwater_plugin_bundle', 'flask_api'))
+
+import advanced_sea_thru  # noqa: E402
+import image_analysis  # noqa: E402
+import sea_thru  # noqa: E402
+from depth_upsampling import FIT_MAX_SIDE, resize_to, working_shape  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+
+# Water properties of the synthetic scenes, BGR order: red attenuates fastest.
+TRUE_BETA = np.array([0.08, 0.18, 0.45], dtype=np.float32)
+BACKSCATTER = np.array([0.35, 0.25, 0.05], dtype=np.float32)
+BACKSCATTER_BETA = np.array([0.6, 0.5, 0.4], dtype=np.float32)
+
+STAGES = ('depth', 'backscatter', 'illumination', 'beta', 'beta_basic',
+          'correct_basic', 'correct_advanced', 'analysis')
+
+
+def scene_shape(megapixels: float):
+    """Return ``(h, w)`` of a 3:2 frame with about ``megapixels`` pixels."""
+    h = max(8, int(round((megapixels * 1e6 / 1.5) ** 0.5)))
+    return h, max(8, int(round(h * 1.5)))
+
+
+def synthetic_scene(megapixels: float, seed: int = 0, strip: int = 512):
+    """Return ``(img, depth)``: a BGR ``uint8`` underwater scene and its depth.
+
+    Depth runs from 1 m at the bottom to about 10 m at the top with smooth
+    undulations. The unattenuated scene is a textured reef-like albedo; it is
+    attenuated with ``TRUE_BETA`` and veiled with depth-dependent
+    backscatter. Rows are rendered in strips to keep memory flat at 45 MP.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = scene_shape(megapixels)
+    x = np.linspace(0, 1, w, dtype=np.float32)[None, :]
+    albedo_lo = rng.uniform(0.3, 0.9, size=(64, 96, 3)).astype(np.float32)
+    albedo = resize_to(albedo_lo, (h, w))
+    depth = np.empty((h, w), dtype=np.float32)
+    img = np.empty((h, w, 3), dtype=np.uint8)
+    for start in range(0, h, strip):
+        stop = min(start + strip, h)
+        y = np.linspace(start / h, stop / h, stop - start, endpoint=False, dtype=np.float32)[:, None]
+        d = 1.0 + 9.0 * (1.0 - y) + 0.5 * np.sin(6.0 * x) * np.cos(4.0 * y)
+        depth[start:stop] = d
+        d = d[..., None]
+        direct = albedo[start:stop] * np.exp(-TRUE_BETA * d)
+        veil = BACKSCATTER * (1.0 - np.exp(-BACKSCATTER_BETA * d))
+        noise = rng.normal(0, 0.01, size=direct.shape).astype(np.float32)
+        img[start:stop] = np.clip((direct + veil + noise) * 255.0, 0, 255)
+    return img, depth
+
+
+def install_stub_depth_model():
+    """Replace MiDaS with a tiny network; returns the model type to request.
+
+    Returns ``None`` when torch is unavailable, in which case the depth stage
+    is skipped.
+    """
+    try:
+        import torch
+    except ImportError:
+        return None
+    import cv2
+    import depth_estimation
+
+    class StubNet(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.conv = torch.nn.Conv2d(3, 1, 3, padding=1)
+
+        def forward(self, x):
+            return self.conv(x).squeeze(1)
+
+    def transform(img_rgb):
+        small = cv2.resize(img_rgb, (256, 256), interpolation=cv2.INTER_AREA)
+        return torch.from_numpy(small).permute(2, 0, 1).float().unsqueeze(0) / 255.0
+
+    depth_estimation._lazy_imports()
+    depth_estimation._models['MiDaS_small'] = StubNet().eval()
+    depth_estimation._transforms = SimpleNamespace(small_transform=transform, dpt_transform=transform)
+    return 'MiDaS_small'
+
+
+def _stage_functions(img, depth, depth_model):
+    fit_shape = working_shape(img.shape, FIT_MAX_SIDE)
+    fit_img = resize_to(img, fit_shape).astype(np.float32) / 255.0
+    fit_depth = resize_to(depth, fit_shape)
+    B, _ = advanced_sea_thru.estimate_backscatter(fit_depth, fit_img)
+    illum = advanced_sea_thru.estimate_illumination(fit_img, B)
+
+    def correct_advanced():
+        advanced_sea_thru.COEF_CACHE.clear()
+        return sea_thru.apply_sea_thru_array(img, depth, advanced=True)
+
+    stages = {
+        'backscatter': lambda: advanced_sea_thru.estimate_backscatter(fit_depth, fit_img),
+        'illumination': lambda: advanced_sea_thru.estimate_illumination(fit_img, B),
+        'beta': lambda: advanced_sea_thru.estimate_beta(fit_depth, illum, fit_img, B),
+        'beta_basic': lambda: sea_thru.estimate_beta(fit_depth, resize_to(img, fit_shape)),
+        'correct_basic': lambda: sea_thru.apply_sea_thru_array(img, depth),
+        'correct_advanced': correct_advanced,
+        'analysis': lambda: image_analysis.analyze_image_array(img),
+    }
+    if depth_model is not None:
+        import depth_estimation
+
+        stages = {'depth': lambda: depth_estimation.estimate_depth_array(img, model_type=depth_model),
+                  **stages}
+    return stages
+
+
+def _measure(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+
+def run(sizes, repeat: int = 3, seed: int = 0):
+    """Benchmark every stage at each size; return the results dict.
+
+    Times are the best of ``repeat`` runs; peak memory is the largest
+    allocation traced by ``tracemalloc`` during one extra run (inputs
+    excluded). Tensors held by torch's allocator are not traced.
+    """
+    depth_model = install_stub_depth_model()
+    results = {}
+    for megapixels in sizes:
+        img, depth = synthetic_scene(megapixels, seed)
+        fit_shape = working_shape(img.shape, FIT_MAX_SIDE)
+        beta = sea_thru.estimate_beta(resize_to(depth, fit_shape), resize_to(img, fit_shape))
+        entry = {
+            'shape': list(img.shape),
+            'beta_error': float(np.abs(beta - TRUE_BETA).max()),
+            'stages': {},
+        }
+        for stage, fn in _stage_functions(img, depth, depth_model).items():
+            seconds, peak_mb = _measure(fn, repeat)
+            entry['stages'][stage] = {'seconds': seconds, 'peak_mb': peak_mb}
+        results[f'{megapixels:g}MP'] = entry
+        del img, depth
+    return results
+
+
+def compare(results, baseline, tolerance: float = 0.25, min_seconds: float = 0.005):
+    """Return a list of regression messages against ``baseline``.
+
+    Stages faster than ``min_seconds`` in the baseline are not timed
+    against it, since their run-to-run noise exceeds any tolerance.
+    """
+    regressions = []
+    for size, entry in results.items():
+        for stage, now in entry['stages'].items():
+            before = baseline.get(size, {}).get('stages', {}).get(stage)
+            if before is None:
+                continue
+            if (before['seconds'] >= min_seconds
+                    and now['seconds'] > before['seconds'] * (1 + tolerance)):
+                regressions.append(f"{size} {stage}: {now['seconds']:.3f}s vs "
+                                   f"baseline {before['seconds']:.3f}s")
+            if now['peak_mb'] > before['peak_mb'] * (1 + tolerance) + 1:
+                regressions.append(f"{size} {stage}: peak {now['peak_mb']:.0f} MB vs "
+                                   f"baseline {before['peak_mb']:.0f} MB")
+    return regressions
+
+
+def format_results(results) -> str:
+    lines = []
+    for size, entry in results.items():
+        h, w = entry['shape'][:2]
+        lines.append(f"{size} ({w}x{h}), basic beta error {entry['beta_error']:.3f}")
+        megapixels = h * w / 1e6
+        for stage in STAGES:
+            if stage in entry['stages']:
+                r = entry['stages'][stage]
+                lines.append(f"  {stage:<17} {r['seconds'] * 1000:9.1f} ms "
+                             f"{r['seconds'] * 1000 / megapixels:8.1f} ms/MP "
+                             f"{r['peak_mb']:8.1f} MB peak")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1, 12, 45],
+                        help='Scene sizes in megapixels')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage (best is kept)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown / memory growth before flagging (fraction)')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+    print(format_results(results))
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print("No regressions against baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
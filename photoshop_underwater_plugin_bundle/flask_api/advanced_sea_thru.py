@@ -10,52 +10,100 @@ that it can run with minimal dependencies.
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
 import numpy as np
 from scipy import optimize
 from scipy.ndimage import uniform_filter
 
-_cv2 = None
+import metrics
+from coef_cache import COEF_CACHE
+from depth_upsampling import FIT_MAX_SIDE, TILE_ROWS, depth_row_source, resize_to, working_shape
+from image_io import pixel_max, read_image, write_image
+from numeric import get_numexpr
 
-
-def _lazy_cv2():
-    global _cv2
-    if _cv2 is None:
-        import cv2
-        _cv2 = cv2
+# Side of the box filter that estimates the illuminant; strips read this
+# many halo rows on each side.
+ILLUMINATION_FILTER_SIZE = 5
 
 
 # ---------------------------------------------------------------------------
 # Backscatter estimation
 # ---------------------------------------------------------------------------
 
+def _subsample_indices(n: int, max_samples: int | None, sampling: str, seed: int):
+    """Return flat pixel indices to keep, or ``None`` to keep every pixel."""
+    if not max_samples or n <= max_samples:
+        return None
+    if sampling == 'stride':
+        return np.arange(0, n, -(-n // max_samples))
+    if sampling == 'random':
+        rng = np.random.default_rng(seed)
+        return np.sort(rng.choice(n, size=max_samples, replace=False))
+    raise ValueError(f"Unknown sampling mode {sampling!r}; expected 'random' or 'stride'")
+
+
 def _sample_backscatter_points(depth: np.ndarray, img: np.ndarray,
-                               fraction: float = 0.01, bins: int = 10) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """Collect darkest pixels for backscatter fitting in depth bins."""
-    z_min, z_max = depth.min(), depth.max()
-    edges = np.linspace(z_min, z_max, bins + 1)
-    pts = [[], [], []]
-    img_norm = img.mean(axis=2)
-    depth_flat = depth.flatten()
+                               fraction: float = 0.01, bins: int = 10,
+                               max_samples: int | None = None, sampling: str = 'random',
+                               seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Collect darkest pixels for backscatter fitting in depth bins.
+
+    Pixels are assigned to ``bins`` equal-width depth bins in a single pass
+    and the darkest ``fraction`` of each bin is selected with a partial sort.
+    A pixel lying exactly on an interior bin edge belongs to the lower bin.
+    When ``max_samples`` is set, at most that many pixels are considered,
+    chosen at random (``sampling='random'``, seeded by ``seed``) or on a
+    regular stride (``sampling='stride'``).
+    """
+    depth_flat = depth.reshape(-1)
     img_flat = img.reshape(-1, 3)
-    for i in range(bins):
-        mask = (depth_flat >= edges[i]) & (depth_flat <= edges[i + 1])
-        if not np.any(mask):
+    keep = _subsample_indices(depth_flat.size, max_samples, sampling, seed)
+    if keep is not None:
+        depth_flat = depth_flat[keep]
+        img_flat = img_flat[keep]
+
+    z_min, z_max = depth_flat.min(), depth_flat.max()
+    edges = np.linspace(z_min, z_max, bins + 1)
+    bin_idx = np.digitize(depth_flat, edges[1:-1], right=True).astype(np.uint16)
+    norms = (img_flat[:, 0] + img_flat[:, 1] + img_flat[:, 2]) / 3
+
+    # A stable sort on small integer keys is a linear-time radix sort; it
+    # groups pixels by bin while keeping their original order.
+    by_bin = np.argsort(bin_idx, kind='stable')
+    bounds = np.cumsum(np.bincount(bin_idx, minlength=bins))
+
+    selected = []
+    for members in np.split(by_bin, bounds[:-1]):
+        if members.size == 0:
             continue
-        norms = img_norm.flatten()[mask]
-        idx = np.argsort(norms)
-        take = max(1, int(len(idx) * fraction))
-        idx = idx[:take]
-        d = depth_flat[mask][idx]
-        pixels = img_flat[mask][idx]
-        for c in range(3):
-            pts[c].extend(zip(d, pixels[:, c]))
-    return (np.array(pts[0]), np.array(pts[1]), np.array(pts[2]))
+        take = max(1, int(members.size * fraction))
+        if take < members.size:
+            darkest = np.argpartition(norms[members], take - 1)[:take]
+            members = members[darkest]
+        selected.append(members[np.argsort(norms[members])])
 
+    if not selected:
+        return tuple(np.empty((0, 2), dtype=img_flat.dtype) for _ in range(3))
+    selected = np.concatenate(selected)
+    d = depth_flat[selected]
+    pixels = img_flat[selected]
+    return tuple(np.column_stack((d, pixels[:, c])) for c in range(3))
 
-def _fit_backscatter(points: np.ndarray, depth_map: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    """Fit dual‑beta backscatter model for one channel."""
+
+def _backscatter_model(d, B_inf, beta_B, J_p, beta_D_p):
+    return B_inf * (1.0 - np.exp(-beta_B * d)) + J_p * np.exp(-beta_D_p * d)
+
+
+_BACKSCATTER_BOUNDS = (np.array([0, 0, 0, 0]), np.array([1.5, 5, 1.5, 5]))
+
+
+def _fit_backscatter(points: np.ndarray, depth_map: np.ndarray, p0=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Fit dual‑beta backscatter model for one channel.
+
+    ``p0`` warm-starts the fit, e.g. with the previous frame's coefficients.
+    """
 
     if len(points) == 0:
         return np.zeros_like(depth_map), np.zeros(4, dtype=np.float32)
@@ -63,42 +111,80 @@ def _fit_backscatter(points: np.ndarray, depth_map: np.ndarray) -> Tuple[np.ndar
     z = points[:, 0]
     v = points[:, 1]
 
-    def model(d, B_inf, beta_B, J_p, beta_D_p):
-        return B_inf * (1.0 - np.exp(-beta_B * d)) + J_p * np.exp(-beta_D_p * d)
-
-    p0 = np.array([v.max() if len(v) else 0.0, 0.5, 0.1, 0.5])
-    bounds = ([0, 0, 0, 0], [1.5, 5, 1.5, 5])
+    lower, upper = _BACKSCATTER_BOUNDS
+    if p0 is None:
+        p0 = np.array([v.max() if len(v) else 0.0, 0.5, 0.1, 0.5])
+    else:
+        p0 = np.clip(p0, lower, upper)
     try:
-        opt, _ = optimize.curve_fit(model, z, v, p0=p0, bounds=bounds, maxfev=4000)
+        opt, _, info, _, _ = optimize.curve_fit(_backscatter_model, z, v, p0=p0,
+                                                bounds=_BACKSCATTER_BOUNDS, maxfev=4000,
+                                                full_output=True)
+        metrics.count_evaluations('backscatter', info['nfev'])
     except Exception:
         opt = p0
-    fitted = model(depth_map, *opt)
+    fitted = _backscatter_model(depth_map, *opt)
     return fitted, opt
 
 
-def estimate_backscatter(depth_map: np.ndarray, img: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    """Estimate per‑pixel backscatter and coefficients for each channel."""
-    points_r, points_g, points_b = _sample_backscatter_points(depth_map, img)
-    Br, coef_r = _fit_backscatter(points_r, depth_map)
-    Bg, coef_g = _fit_backscatter(points_g, depth_map)
-    Bb, coef_b = _fit_backscatter(points_b, depth_map)
-    B = np.stack([Br, Bg, Bb], axis=2)
-    coefs = np.stack([coef_r, coef_g, coef_b], axis=0)
+def estimate_backscatter(depth_map: np.ndarray, img: np.ndarray,
+                         max_samples: int | None = None,
+                         p0: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Estimate per‑pixel backscatter and coefficients for each channel.
+
+    ``max_samples`` limits how many pixels are searched for dark points and
+    ``p0`` is an optional ``(3, 4)`` array of coefficients to warm-start from.
+    """
+    points = _sample_backscatter_points(depth_map, img, max_samples=max_samples)
+    starts = [None] * 3 if p0 is None else list(p0)
+    fits = [_fit_backscatter(points[c], depth_map, starts[c]) for c in range(3)]
+    B = np.stack([f[0] for f in fits], axis=2)
+    coefs = np.stack([f[1] for f in fits], axis=0)
     return B, coefs
 
+
+def backscatter_from_coefs(depth_map: np.ndarray, coefs: np.ndarray) -> np.ndarray:
+    """Evaluate the backscatter model for ``(3, 4)`` coefficients."""
+    # Python floats keep the result in the depth map's dtype.
+    return np.stack([_backscatter_model(depth_map, *coefs[c].tolist()) for c in range(3)], axis=2)
+
 # ---------------------------------------------------------------------------
 # Illumination and attenuation
 # ---------------------------------------------------------------------------
 
-def estimate_illumination(img: np.ndarray, B: np.ndarray, filter_size: int = 5) -> np.ndarray:
+def estimate_illumination(img: np.ndarray, B: np.ndarray,
+                          filter_size: int = ILLUMINATION_FILTER_SIZE) -> np.ndarray:
     """Estimate spatially varying illuminant by local averaging."""
     D = np.clip(img.astype(np.float32) - B, 0, None)
     illum = uniform_filter(D, size=(filter_size, filter_size, 1))
     return illum
 
 
-def _fit_attenuation(depth: np.ndarray, values: np.ndarray) -> np.ndarray:
-    """Fit dual exponential attenuation to illumination ratio."""
+# Attenuation fitting strategy used by ``estimate_beta``:
+#   'full'       every valid pixel (slowest, the reference result)
+#   'stratified' up to ATTENUATION_SAMPLES pixels spread over depth bins
+#   'binned'     the per-bin median of a stratified pool, one point per bin
+# The sampled strategies keep the fitted beta curve within 0.01 (absolute,
+# over the image's depth range) of the full fit and the coefficients within
+# about 0.1; the dual exponential is weakly identifiable, so the curve is the
+# meaningful quantity to compare.
+ATTENUATION_FIT = 'stratified'
+ATTENUATION_SAMPLES = 20000
+ATTENUATION_BINS = 32
+
+_ATTENUATION_P0 = np.array([0.5, -0.8, 0.5, -0.2])
+_ATTENUATION_BOUNDS = (np.array([0, -5, 0, -5]), np.array([10, 0, 10, 0]))
+
+
+def _attenuation_model(x, a, b, c, d):
+    return a * np.exp(b * x) + c * np.exp(d * x)
+
+
+def _fit_attenuation(depth: np.ndarray, values: np.ndarray, p0=None) -> np.ndarray:
+    """Fit dual exponential attenuation to illumination ratio.
+
+    ``p0`` warm-starts the fit, e.g. with the previous frame's coefficients.
+    """
 
     d = depth.flatten()
     v = values.flatten()
@@ -106,57 +192,262 @@ def _fit_attenuation(depth: np.ndarray, values: np.ndarray) -> np.ndarray:
     d = d[mask]
     v = v[mask]
 
-    def model(x, a, b, c, d):
-        return a * np.exp(b * x) + c * np.exp(d * x)
-
     if len(d) < 4:
         return np.zeros(4, dtype=np.float32)
 
-    p0 = [0.5, -0.8, 0.5, -0.2]
-    bounds = ([0, -5, 0, -5], [10, 0, 10, 0])
+    lower, upper = _ATTENUATION_BOUNDS
+    p0 = _ATTENUATION_P0 if p0 is None else np.clip(p0, lower, upper)
     try:
-        opt, _ = optimize.curve_fit(model, d, v, p0=p0, bounds=bounds, maxfev=4000)
+        opt, _, info, _, _ = optimize.curve_fit(_attenuation_model, d, v, p0=p0,
+                                                bounds=_ATTENUATION_BOUNDS, maxfev=4000,
+                                                full_output=True)
+        metrics.count_evaluations('attenuation', info['nfev'])
     except Exception:
         opt = np.array(p0)
     return opt
 
 
-def estimate_beta(depth_map: np.ndarray, illum: np.ndarray, img: np.ndarray, B: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    """Estimate dual‑beta wideband attenuation map and coefficients."""
+def _stratified_indices(depth_flat: np.ndarray, samples: int, bins: int, seed: int) -> np.ndarray:
+    """Return up to ``samples`` indices of positive-depth pixels, evenly per depth bin.
+
+    A random pool several times larger than ``samples`` is binned by depth
+    and each bin contributes at most ``samples // bins`` pixels, so shallow
+    and deep regions are represented even when one of them dominates.
+    """
+    valid = np.flatnonzero(depth_flat > 0)
+    rng = np.random.default_rng(seed)
+    if valid.size > 8 * samples:
+        valid = rng.choice(valid, size=8 * samples, replace=False)
+    else:
+        valid = rng.permutation(valid)
+    if valid.size == 0:
+        return valid
+    d = depth_flat[valid]
+    edges = np.linspace(d.min(), d.max(), bins + 1)
+    bin_idx = np.digitize(d, edges[1:-1], right=True).astype(np.uint16)
+    order = np.argsort(bin_idx, kind='stable')
+    bounds = np.cumsum(np.bincount(bin_idx, minlength=bins))
+    quota = max(1, samples // bins)
+    return np.concatenate([valid[members[:quota]] for members in np.split(order, bounds[:-1])])
+
+
+def _bin_medians(d: np.ndarray, v: np.ndarray, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce ``(d, v)`` to the per-depth-bin medians, one row of ``v`` per bin."""
+    edges = np.linspace(d.min(), d.max(), bins + 1)
+    bin_idx = np.digitize(d, edges[1:-1], right=True)
+    rows = [i for i in range(bins) if np.any(bin_idx == i)]
+    d_med = np.array([np.median(d[bin_idx == i]) for i in rows])
+    v_med = np.stack([np.median(v[bin_idx == i], axis=0) for i in rows])
+    return d_med, v_med
+
+
+def estimate_beta(depth_map: np.ndarray, illum: np.ndarray, img: np.ndarray, B: np.ndarray,
+                  strategy: str | None = None, p0: np.ndarray | None = None,
+                  parallel: bool = True, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Estimate dual‑beta wideband attenuation map and coefficients.
+
+    ``strategy`` selects the fit inputs (see ``ATTENUATION_FIT``); ``p0`` is
+    an optional ``(3, 4)`` array of per-channel coefficients to warm-start
+    from. With ``parallel`` the three channels are fitted concurrently.
+    """
+    strategy = strategy or ATTENUATION_FIT
     eps = 1e-8
-    residual = np.clip(img.astype(np.float32) - B, eps, None)
-    raw = -np.log(np.clip(illum, eps, None) / residual) / np.maximum(depth_map, eps)[:, :, None]
-    coefs = []
-    beta_map = np.zeros_like(raw)
-    for c in range(3):
-        coef = _fit_attenuation(depth_map, raw[:, :, c])
-        coefs.append(coef)
-        a, b, c2, d2 = coef
+    if strategy == 'full':
+        residual = np.clip(img.astype(np.float32) - B, eps, None)
+        raw = -np.log(np.clip(illum, eps, None) / residual) / np.maximum(depth_map, eps)[:, :, None]
+        d = depth_map.reshape(-1)
+        raw = raw.reshape(-1, 3)
+    elif strategy in ('stratified', 'binned'):
+        d_flat = depth_map.reshape(-1)
+        idx = _stratified_indices(d_flat, ATTENUATION_SAMPLES, ATTENUATION_BINS, seed)
+        d = d_flat[idx]
+        residual = np.clip(img.reshape(-1, 3)[idx].astype(np.float32) - B.reshape(-1, 3)[idx], eps, None)
+        raw = -np.log(np.clip(illum.reshape(-1, 3)[idx], eps, None) / residual) / np.maximum(d, eps)[:, None]
+        if strategy == 'binned' and d.size:
+            d, raw = _bin_medians(d, raw, ATTENUATION_BINS)
+    else:
+        raise ValueError(
+            f"Unknown attenuation fit strategy {strategy!r}; expected 'full', 'stratified' or 'binned'"
+        )
+
+    starts = [None] * 3 if p0 is None else list(p0)
+    if parallel:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            coefs = list(pool.map(metrics.bind(_fit_attenuation), [d] * 3, [raw[:, c] for c in range(3)], starts))
+    else:
+        coefs = [_fit_attenuation(d, raw[:, c], starts[c]) for c in range(3)]
+
+    coefs = np.stack(coefs, axis=0)
+    return beta_from_coefs(depth_map, coefs), coefs
+
+
+def beta_from_coefs(depth_map: np.ndarray, coefs: np.ndarray) -> np.ndarray:
+    """Evaluate the attenuation model for ``(3, 4)`` coefficients."""
+    beta_map = np.empty(depth_map.shape + (3,), dtype=np.float32)
+    for c, (a, b, c2, d2) in enumerate(coefs):
         beta_map[:, :, c] = a * np.exp(b * depth_map) + c2 * np.exp(d2 * depth_map)
-    return beta_map, np.stack(coefs, axis=0)
+    return beta_map
 
 
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
-def apply_advanced_sea_thru(image_path: str, depth_map: np.ndarray) -> str:
-    """Apply the advanced Sea‑Thru model and return path to corrected image."""
-    _lazy_cv2()
-    img = _cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"Could not read {image_path}")
-    img = img.astype(np.float32) / 255.0
-
-    B, _ = estimate_backscatter(depth_map, img)
-    illum = estimate_illumination(img, B)
-    beta_map, _ = estimate_beta(depth_map, illum, img, B)
-
-    corrected = (img - B) * np.exp(beta_map * depth_map[:, :, None])
-    corrected = np.clip(corrected / np.maximum(illum, 1e-6), 0, 1)
-    corrected = (corrected * 255.0).astype(np.uint8)
-
-    out_path = os.path.splitext(image_path)[0] + "_adv_seathru.jpg"
-    _cv2.imwrite(out_path, corrected)
-    return out_path
+def fit_coefficients(img: np.ndarray, depth_map: np.ndarray, *,
+                     session_id: str | None = None,
+                     reuse_coefs: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Return ``(backscatter, beta)`` coefficients for a float image in ``[0, 1]``.
+
+    With ``session_id``, fitted coefficients are kept in
+    ``coef_cache.COEF_CACHE`` and the session's cached entry warm-starts the
+    fits, or with ``reuse_coefs`` replaces them entirely, which suits bursts
+    and video frames of one dive. Without one the fit depends only on the
+    inputs, never on earlier requests.
+    """
+    cached = COEF_CACHE.lookup(session_id) if session_id is not None else None
+    if cached is not None and reuse_coefs:
+        return cached['backscatter'], cached['beta']
+
+    with metrics.stage('backscatter_fit'):
+        B, b_coefs = estimate_backscatter(
+            depth_map, img, p0=None if cached is None else cached['backscatter']
+        )
+    with metrics.stage('illumination'):
+        illum = estimate_illumination(img, B)
+    with metrics.stage('beta_fit'):
+        _, beta_coefs = estimate_beta(
+            depth_map, illum, img, B, p0=None if cached is None else cached['beta']
+        )
+    if session_id is not None:
+        COEF_CACHE.store({'backscatter': b_coefs, 'beta': beta_coefs}, session_id)
+    return b_coefs, beta_coefs
+
+
+def correct_rows(img: np.ndarray, depth_rows, b_coefs: np.ndarray, beta_coefs: np.ndarray,
+                 start: int, stop: int, filter_size: int = ILLUMINATION_FILTER_SIZE,
+                 out: np.ndarray | None = None,
+                 scratch: np.ndarray | None = None) -> np.ndarray:
+    """Return the corrected rows ``start:stop`` of ``img``, in its dtype.
+
+    ``depth_rows(a, b)`` supplies full-resolution depth for rows ``a:b``.
+    The illumination filter needs neighbouring rows, so a halo of
+    ``filter_size`` rows is read on each side and cropped afterwards; this
+    makes the strip result identical to correcting the whole image at once.
+
+    Channels are processed one float32 plane at a time with in-place
+    operations. ``out`` receives the rows if given, and ``scratch`` (at
+    least ``(3, stop - start + 2 * filter_size, width)`` float32) is reused
+    across calls instead of allocating fresh planes.
+    """
+    lo = max(0, start - filter_size)
+    hi = min(img.shape[0], stop + filter_size)
+    rows, width = hi - lo, img.shape[1]
+    if out is None:
+        out = np.empty((stop - start, width, 3), dtype=img.dtype)
+    if scratch is None or scratch.shape[1] < rows:
+        scratch = np.empty((3, rows, width), dtype=np.float32)
+    direct, illum, tmp = (buf[:rows] for buf in scratch)
+    depth = depth_rows(lo, hi)
+    core = slice(start - lo, stop - lo)
+    ne = get_numexpr()
+    peak = np.float32(pixel_max(img.dtype))
 
+    for c in range(3):
+        np.divide(img[lo:hi, :, c], peak, out=direct)
+        _subtract_backscatter(direct, depth, b_coefs[c], tmp, ne)
+        np.maximum(direct, 0, out=tmp)
+        uniform_filter(tmp, size=filter_size, output=illum)
+        _attenuate(direct[core], illum[core], depth[core], beta_coefs[c], tmp[core], ne, peak)
+        out[:, :, c] = direct[core]
+    return out
+
+
+def _subtract_backscatter(plane, depth, coefs, tmp, ne):
+    B_inf, beta_B, J_p, beta_D_p = (np.float32(v) for v in coefs)
+    if ne is not None:
+        ne.evaluate('plane - (B_inf * (1 - exp(-beta_B * depth)) + J_p * exp(-beta_D_p * depth))',
+                    out=plane, casting='same_kind')
+        return
+    np.multiply(depth, -beta_B, out=tmp)
+    np.exp(tmp, out=tmp)
+    np.multiply(tmp, -B_inf, out=tmp)
+    tmp += B_inf
+    plane -= tmp
+    np.multiply(depth, -beta_D_p, out=tmp)
+    np.exp(tmp, out=tmp)
+    tmp *= J_p
+    plane -= tmp
+
+
+def _attenuate(plane, illum, depth, coefs, tmp, ne, peak):
+    """``plane <- clip(plane * exp(beta(depth) * depth) / illum, 0, 1) * peak``."""
+    a, b, c, d = (np.float32(v) for v in coefs)
+    if ne is not None:
+        ne.evaluate('plane * exp((a * exp(b * depth) + c * exp(d * depth)) * depth)'
+                    ' / where(illum > 1e-6, illum, 1e-6)', out=plane, casting='same_kind')
+    else:
+        # exp((a e^{bz} + c e^{dz}) z) as a product of one factor per term.
+        for scale, rate in ((a, b), (c, d)):
+            np.multiply(depth, rate, out=tmp)
+            np.exp(tmp, out=tmp)
+            tmp *= scale
+            tmp *= depth
+            np.exp(tmp, out=tmp)
+            plane *= tmp
+        np.maximum(illum, np.float32(1e-6), out=tmp)
+        plane /= tmp
+    np.clip(plane, 0, 1, out=plane)
+    plane *= peak
+
+
+def apply_advanced_sea_thru_array(img: np.ndarray, depth_map: np.ndarray, *,
+                                  session_id: str | None = None,
+                                  reuse_coefs: bool = False,
+                                  params: dict | None = None,
+                                  out: np.ndarray | None = None) -> np.ndarray:
+    """Apply the advanced Sea‑Thru model to a BGR ``uint8`` or ``uint16`` array.
+
+    The backscatter and attenuation coefficients are fitted on a copy
+    downsampled to ``FIT_MAX_SIDE`` (see :func:`fit_coefficients` for
+    ``session_id`` and ``reuse_coefs``) unless ``{'backscatter', 'beta'}``
+    ``params`` are given. The correction is then applied in
+    ``TILE_ROWS`` strips, so peak memory is bounded by the strip size rather
+    than by the image size. ``depth_map`` may be at a reduced resolution.
+    The result is written to ``out`` (e.g. a memory-mapped output image)
+    when given.
+    """
+    if params is not None:
+        b_coefs, beta_coefs = params['backscatter'], params['beta']
+    else:
+        fit_shape = working_shape(img.shape, FIT_MAX_SIDE)
+        b_coefs, beta_coefs = fit_coefficients(
+            resize_to(img, fit_shape).astype(np.float32) / pixel_max(img.dtype),
+            resize_to(depth_map, fit_shape),
+            session_id=session_id,
+            reuse_coefs=reuse_coefs,
+        )
+
+    depth_rows = depth_row_source(depth_map, img)
+    if out is None:
+        out = np.empty_like(img)
+    # Room for a strip plus the illumination filter's halo rows.
+    halo = 2 * ILLUMINATION_FILTER_SIZE
+    scratch = np.empty((3, min(TILE_ROWS + halo, img.shape[0]), img.shape[1]), dtype=np.float32)
+    with metrics.stage('correct_strips'):
+        for start in range(0, img.shape[0], TILE_ROWS):
+            stop = min(start + TILE_ROWS, img.shape[0])
+            correct_rows(img, depth_rows, b_coefs, beta_coefs, start, stop,
+                         out=out[start:stop], scratch=scratch)
+    return out
+
+
+def apply_advanced_sea_thru(image_path: str, depth_map: np.ndarray,
+                            output_path: str | None = None, **kwargs) -> str:
+    """Apply the advanced Sea‑Thru model and return path to corrected image.
+
+    16-bit inputs stay 16-bit when ``output_path`` is a PNG or TIFF.
+    """
+    corrected = apply_advanced_sea_thru_array(read_image(image_path, keep_depth=True),
+                                              depth_map, **kwargs)
+    out_path = output_path or os.path.splitext(image_path)[0] + "_adv_seathru.jpg"
+    return write_image(out_path, corrected)
@@ -0,0 +1,189 @@
+"""Batch correction of whole directories as an overlapped pipeline.
+
+Decoding and encoding run on I/O threads (OpenCV releases the GIL), depth is
+estimated in batches in the main process with the model loaded once, and the
+correction runs either inline or, with ``jobs > 1``, on a
+:class:`worker_pool.ModelWorkerPool` fed through shared memory. While one
+depth batch runs, the next images are being decoded, earlier images are being
+corrected and finished ones are being written.
+"""
+
+import glob
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+from depth_estimation import estimate_depth_batch
+from image_io import read_image, write_image
+from sea_thru import apply_sea_thru_array
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+STAGES = ('decode', 'depth', 'correct', 'encode')
+
+
+def find_inputs(source: str):
+    """Return the sorted image files in directory ``source`` or matching glob ``source``."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths
+                  if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def is_up_to_date(src: str, dst: str) -> bool:
+    """Return whether ``dst`` exists and is at least as new as ``src``."""
+    return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+def _read(path):
+    # 16-bit inputs stay 16-bit through the correction and in PNG/TIFF outputs.
+    return read_image(path, keep_depth=True)
+
+
+def _decode_ahead(io, items, ahead):
+    """Yield ``(item, img, seconds, error)`` in order, decoding ``ahead`` images early."""
+    items = iter(items)
+    pending = deque((item, io.submit(_timed, _read, item[0])) for item in islice(items, ahead))
+    while pending:
+        item, future = pending.popleft()
+        following = next(items, None)
+        if following is not None:
+            pending.append((following, io.submit(_timed, _read, following[0])))
+        try:
+            img, seconds = future.result()
+        except Exception as exc:
+            yield item, None, 0.0, exc
+        else:
+            yield item, img, seconds, None
+
+
+def _chunks(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        chunk = list(islice(iterable, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(source: str, output_dir: str, *, jobs: int = 1, batch_size: int = 4,
+              io_threads: int = 4, force: bool = False, advanced: bool = False,
+              depth_model: str | None = None, depth_working_size: int | None = None,
+              session_id: str | None = None, reuse_coefs: bool = False):
+    """Correct every image in ``source`` into ``output_dir``.
+
+    Outputs keep the input file name. Inputs whose output is already up to
+    date are skipped unless ``force`` is set, so an interrupted run can be
+    resumed. Returns a report dict with counts, failures, the summed seconds
+    spent in each stage and the overall images per second.
+    """
+    started = time.perf_counter()
+    stages = dict.fromkeys(STAGES, 0.0)
+    report = {'processed': 0, 'skipped': 0, 'failed': [], 'stages': stages}
+
+    todo = []
+    for src in find_inputs(source):
+        dst = os.path.join(output_dir, os.path.basename(src))
+        if not force and is_up_to_date(src, dst):
+            report['skipped'] += 1
+        else:
+            todo.append((src, dst))
+
+    options = {'advanced': advanced, 'session_id': session_id, 'reuse_coefs': reuse_coefs}
+    if jobs > 1:
+        from worker_pool import ModelWorkerPool
+
+        # Workers only correct; depth runs here. Spawned workers start clean
+        # rather than forking a parent that already holds torch threads.
+        pool_context = ModelWorkerPool(jobs, warm=False, mp_context='spawn')
+    else:
+        pool_context = nullcontext()
+
+    with ThreadPoolExecutor(io_threads, thread_name_prefix='batch-io') as io, pool_context as pool:
+        corrections = deque()
+        writes = deque()
+
+        def write(item, corrected):
+            writes.append((item, io.submit(_timed, write_image, item[1], corrected)))
+
+        def drain(limit):
+            while len(corrections) > limit:
+                item, future = corrections.popleft()
+                try:
+                    corrected, adjustments = future.result()
+                except Exception as exc:
+                    report['failed'].append((item[0], str(exc)))
+                    continue
+                stages['correct'] += adjustments['timings']['correct']
+                write(item, corrected)
+
+        def finish_writes(limit):
+            while len(writes) > limit:
+                item, future = writes.popleft()
+                try:
+                    _, seconds = future.result()
+                except Exception as exc:
+                    report['failed'].append((item[0], str(exc)))
+                    continue
+                stages['encode'] += seconds
+                report['processed'] += 1
+
+        decoded = _decode_ahead(io, todo, ahead=max(batch_size * 2, io_threads))
+        for chunk in _chunks(decoded, batch_size):
+            ready = []
+            for item, img, seconds, error in chunk:
+                stages['decode'] += seconds
+                if error is None:
+                    ready.append((item, img))
+                else:
+                    report['failed'].append((item[0], str(error)))
+            if not ready:
+                continue
+
+            depths, seconds = _timed(lambda: estimate_depth_batch(
+                [img for _, img in ready], batch_size=len(ready),
+                model_type=depth_model, working_size=depth_working_size,
+            ))
+            stages['depth'] += seconds
+
+            for (item, img), depth in zip(ready, depths):
+                if pool is None:
+                    corrected, seconds = _timed(lambda: apply_sea_thru_array(
+                        img, depth['depth_map'], **options))
+                    stages['correct'] += seconds
+                    write(item, corrected)
+                else:
+                    corrections.append((item, pool.submit(img, depth['depth_map'], **options)))
+            # Bound the images held in flight so memory stays flat on large cards.
+            drain(limit=2 * jobs)
+            finish_writes(limit=2 * io_threads)
+        drain(limit=0)
+        finish_writes(limit=0)
+
+    report['wall'] = time.perf_counter() - started
+    report['images_per_second'] = report['processed'] / report['wall'] if report['wall'] else 0.0
+    return report
+
+
+def format_report(report) -> str:
+    """Return a human readable summary of :func:`run_batch`'s report."""
+    lines = [
+        f"Processed {report['processed']} image(s), skipped {report['skipped']} up to date, "
+        f"{len(report['failed'])} failed in {report['wall']:.1f}s "
+        f"({report['images_per_second']:.2f} images/s)",
+    ]
+    for stage in STAGES:
+        lines.append(f"  {stage:<8} {report['stages'][stage]:8.2f}s")
+    for path, error in report['failed']:
+        lines.append(f"  FAILED {path}: {error}")
+    return "\n".join(lines)
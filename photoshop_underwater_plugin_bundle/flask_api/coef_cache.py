@@ -0,0 +1,66 @@
+"""Cache of fitted Sea-Thru coefficients shared across frames of one dive.
+
+Consecutive frames from the same dive have near-identical water properties,
+so the backscatter and attenuation coefficients fitted for one frame are a
+good warm start (or a direct substitute) for the next. Entries are keyed by
+a caller supplied session ID, so coefficients are only shared within an
+explicit session. The cache is bounded with LRU eviction and entries expire
+after a TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class CoefficientCache:
+    """Thread-safe LRU cache of fitted coefficients with a TTL."""
+
+    def __init__(self, max_entries: int = 64, ttl: float = 600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def _expire(self):
+        deadline = self._clock() - self.ttl
+        for key in [k for k, (stamp, _) in self._entries.items() if stamp < deadline]:
+            del self._entries[key]
+
+    def lookup(self, session_id):
+        """Return the cached coefficient dict for ``session_id``, or ``None``."""
+        with self._lock:
+            self._expire()
+            if session_id not in self._entries:
+                return None
+            self._entries.move_to_end(session_id)
+            return self._entries[session_id][1]
+
+    def store(self, coefs: dict, session_id):
+        """Record ``coefs`` for ``session_id`` and evict the least recently used entries."""
+        with self._lock:
+            self._entries[session_id] = (self._clock(), coefs)
+            self._entries.move_to_end(session_id)
+            self._expire()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_id):
+        """Remove the entry for ``session_id``, if any."""
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+COEF_CACHE = CoefficientCache(config.COEF_CACHE_SIZE, config.COEF_CACHE_TTL)
@@ -1,3 +1,5 @@
+import os
+
 # Placeholder for Adobe API credentials
 CLIENT_ID = "your_client_id"
 CLIENT_SECRET = "your_client_secret"
@@ -6,3 +8,94 @@ API_KEY = "your_api_key"
 
 # Token endpoint for obtaining OAuth tokens
 TOKEN_URL = "https://ims-na1.adobelogin.com/ims/token/v3"
+
+# Access tokens are refreshed this many seconds before they expire.
+TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+
+# Photoshop actions endpoint, requests in flight at once, and job status
+# polling: first interval, longest interval and give-up time (seconds).
+PHOTOSHOP_ACTIONS_URL = os.environ.get("PHOTOSHOP_ACTIONS_URL", "https://image.adobe.io/photoshop/actions")
+PHOTOSHOP_CONCURRENCY = int(os.environ.get("PHOTOSHOP_CONCURRENCY", "4"))
+PHOTOSHOP_POLL_INTERVAL = float(os.environ.get("PHOTOSHOP_POLL_INTERVAL", "1"))
+PHOTOSHOP_POLL_MAX = float(os.environ.get("PHOTOSHOP_POLL_MAX", "15"))
+PHOTOSHOP_JOB_TIMEOUT = float(os.environ.get("PHOTOSHOP_JOB_TIMEOUT", "600"))
+
+# MiDaS variant used for depth estimation: DPT_Large (best quality),
+# DPT_Hybrid or MiDaS_small (fastest). Can be overridden per request.
+DEPTH_MODEL = os.environ.get("DEPTH_MODEL", "DPT_Large")
+
+# Long edge, in pixels, at which depth maps are kept (0 = full resolution).
+# Reduced depth is upsampled with image guidance during correction.
+DEPTH_WORKING_SIZE = int(os.environ.get("DEPTH_WORKING_SIZE", "0"))
+
+# How MiDaS is executed: eager, quantized, torchscript, compile, onnx or
+# onnx_int8 (see depth_backends). DEPTH_THREADS caps inference threads
+# (0 = one per core), DEPTH_ONNX_DIR keeps ONNX exports between runs (empty =
+# a temporary directory) and warm-up rejects a backend whose output differs
+# from the eager model's by more than DEPTH_PARITY_TOLERANCE of its range
+# (0 skips the check).
+DEPTH_BACKEND = os.environ.get("DEPTH_BACKEND", "eager")
+DEPTH_THREADS = int(os.environ.get("DEPTH_THREADS", "0"))
+DEPTH_ONNX_DIR = os.environ.get("DEPTH_ONNX_DIR", "")
+DEPTH_PARITY_TOLERANCE = float(os.environ.get("DEPTH_PARITY_TOLERANCE", "0.05"))
+
+# Fitted Sea-Thru coefficients are cached per dive session so consecutive
+# frames can warm-start or skip their fits.
+COEF_CACHE_SIZE = int(os.environ.get("COEF_CACHE_SIZE", "64"))
+COEF_CACHE_TTL = float(os.environ.get("COEF_CACHE_TTL", "600"))
+
+# Asynchronous /jobs API: worker pool type ("thread" or "process"), number of
+# workers, and how many jobs may wait beyond them before the service
+# answers 429.
+JOB_EXECUTOR = os.environ.get("JOB_EXECUTOR", "thread")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "16"))
+
+# How "process" job workers are started: "fork", "forkserver", "spawn" or ""
+# for the platform default. With SERVICE_PRELOAD the service imports its
+# deferred modules and loads the depth model before starting the workers, so
+# forked workers (or the fork server) begin warm instead of cold.
+JOB_START_METHOD = os.environ.get("JOB_START_METHOD", "")
+SERVICE_PRELOAD = os.environ.get("SERVICE_PRELOAD", "") not in ("", "0", "false")
+
+# Content-addressed cache of depth maps and corrected images on local disk.
+# Empty disables it; the size cap is enforced with LRU eviction.
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Shared HTTP session: connections kept per host, retries with exponential
+# backoff (seconds), request timeout (seconds) and the largest image
+# download accepted (bytes, 0 = unlimited).
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+MAX_DOWNLOAD_BYTES = int(os.environ.get("MAX_DOWNLOAD_BYTES", str(200 * 1024 ** 2)))
+
+# Parent of the per-request scratch directories (empty = system temp dir).
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", "")
+
+# Long edge, in pixels, of the proxy corrected by the /preview endpoint.
+PREVIEW_MAX_SIDE = int(os.environ.get("PREVIEW_MAX_SIDE", "1024"))
+
+# Elementwise backend for the correction kernels: "auto" uses numexpr when it
+# is installed on a multi-core machine, "numexpr" requires it, "numpy" never
+# uses it.
+ELEMENTWISE_BACKEND = os.environ.get("ELEMENTWISE_BACKEND", "auto")
+
+# Per-stage timing exposed at /metrics. METRICS_TRACE_MEMORY also records each
+# stage's peak traced allocation, which slows allocation-heavy stages.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") not in ("", "0", "false")
+METRICS_TRACE_MEMORY = os.environ.get("METRICS_TRACE_MEMORY", "") not in ("", "0", "false")
+
+# Video correction: MiDaS runs on every VIDEO_KEYFRAME_INTERVAL-th frame (and
+# on scene cuts) at a long edge of VIDEO_DEPTH_SIZE pixels, and depth is
+# carried to the frames in between with optical flow. Parameters are refitted
+# on keyframes only and blended into the running estimate with weight
+# VIDEO_SMOOTHING (1 = no smoothing). Outputs use the VIDEO_CODEC fourcc;
+# downloads may be up to MAX_VIDEO_BYTES (0 = unlimited).
+VIDEO_KEYFRAME_INTERVAL = int(os.environ.get("VIDEO_KEYFRAME_INTERVAL", "12"))
+VIDEO_DEPTH_SIZE = int(os.environ.get("VIDEO_DEPTH_SIZE", "512"))
+VIDEO_SMOOTHING = float(os.environ.get("VIDEO_SMOOTHING", "0.3"))
+VIDEO_CODEC = os.environ.get("VIDEO_CODEC", "mp4v")
+MAX_VIDEO_BYTES = int(os.environ.get("MAX_VIDEO_BYTES", str(4 * 1024 ** 3)))
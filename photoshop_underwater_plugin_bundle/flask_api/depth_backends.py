@@ -0,0 +1,196 @@
+"""CPU inference backends for the MiDaS depth models.
+
+``config.DEPTH_BACKEND`` selects how the eager PyTorch model loaded by
+:mod:`depth_estimation` is executed:
+
+``eager``
+    The hub model as loaded (the reference, and the only GPU path).
+``quantized``
+    int8 dynamic quantisation of the ``Linear`` layers, which dominate the
+    DPT transformers. Needs nothing beyond torch.
+``torchscript``
+    A frozen, inference-optimised trace.
+``compile``
+    ``torch.compile`` with dynamic shapes (needs a C++ toolchain).
+``onnx`` / ``onnx_int8``
+    The model exported to ONNX (optionally with int8 weights) and run by
+    ONNX Runtime. Needs the optional ``onnxruntime`` (plus ``onnx`` and
+    ``onnxscript`` for the export) packages.
+
+Traced and exported graphs are specialised to one input shape. The MiDaS
+transforms keep the aspect ratio, so each shape (in practice one per camera
+orientation) is built on first use and kept; exported ONNX files are also
+stored in ``config.DEPTH_ONNX_DIR`` for later processes. Every runner takes
+and returns torch tensors on the CPU, like the eager model.
+"""
+
+import copy
+import os
+import tempfile
+import threading
+
+import config
+
+BACKENDS = ('eager', 'quantized', 'torchscript', 'compile', 'onnx', 'onnx_int8')
+
+_torch = None
+_onnx_dir = None
+
+
+def _lazy_imports():
+    global _torch
+    if _torch is None:
+        import torch
+        _torch = torch
+
+
+def resolve_backend(backend=None):
+    backend = backend or config.DEPTH_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown depth backend {backend!r}; expected one of {', '.join(BACKENDS)}"
+        )
+    return backend
+
+
+def configure_threads(threads: int | None = None):
+    """Set torch's intra-op thread count (``config.DEPTH_THREADS`` by default).
+
+    ``0`` keeps the library default of one thread per core. Lower it when
+    several job workers share a node so they do not oversubscribe the CPUs.
+    """
+    threads = config.DEPTH_THREADS if threads is None else threads
+    _lazy_imports()
+    if threads > 0 and _torch.get_num_threads() != threads:
+        _torch.set_num_threads(threads)
+
+
+class _PerShape:
+    """Build a runner for each input shape on first use and keep it.
+
+    With ``any_batch`` the runner accepts every batch size, so runners are
+    only told apart by the shape of one image.
+    """
+
+    def __init__(self, build, any_batch: bool = False):
+        self._build = build
+        self._any_batch = any_batch
+        self._runners = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        shape = tuple(batch.shape)[1 if self._any_batch else 0:]
+        runner = self._runners.get(shape)
+        if runner is None:
+            with self._lock:
+                runner = self._runners.get(shape)
+                if runner is None:
+                    runner = self._runners[shape] = self._build(batch)
+        return runner(batch)
+
+
+def build_runner(model, backend: str, model_type: str = 'model'):
+    """Return a callable running ``model`` with ``backend``.
+
+    ``model`` must be an eval-mode MiDaS module; it is not modified.
+    """
+    backend = resolve_backend(backend)
+    if backend == 'eager':
+        return model
+    _lazy_imports()
+    cpu_model = copy.deepcopy(model).cpu().eval()
+    if backend == 'quantized':
+        return _torch.ao.quantization.quantize_dynamic(
+            cpu_model, {_torch.nn.Linear}, dtype=_torch.qint8
+        )
+    if backend == 'torchscript':
+        def trace(example):
+            with _torch.inference_mode(False), _torch.no_grad():
+                traced = _torch.jit.trace(cpu_model, example.clone(), check_trace=False)
+            return _torch.jit.optimize_for_inference(traced.eval())
+        return _PerShape(trace)
+    if backend == 'compile':
+        return _torch.compile(cpu_model, dynamic=True)
+    return _PerShape(lambda example: _onnx_session(cpu_model, example, model_type,
+                                                   quantize=backend == 'onnx_int8'),
+                     any_batch=True)
+
+
+def onnx_path(model_type: str, shape, quantize: bool = False) -> str:
+    """Return where the ONNX export of ``model_type`` for ``shape`` is kept.
+
+    Exports take any batch size, so only the image shape ``shape[1:]`` is
+    part of the name.
+    """
+    global _onnx_dir
+    directory = config.DEPTH_ONNX_DIR
+    if not directory:
+        if _onnx_dir is None:
+            _onnx_dir = tempfile.mkdtemp(prefix='midas-onnx-')
+        directory = _onnx_dir
+    # 'N' marks the dynamic batch axis and keeps older fixed-batch exports
+    # in DEPTH_ONNX_DIR from being picked up.
+    size = 'x'.join(['N'] + [str(n) for n in shape[1:]])
+    suffix = '-int8' if quantize else ''
+    return os.path.join(directory, f'{model_type}-{size}{suffix}.onnx')
+
+
+def export_onnx(model, example, path: str, quantize: bool = False) -> str:
+    """Export ``model`` for inputs shaped like ``example`` to ``path``.
+
+    The batch dimension is left dynamic, so one export serves every batch
+    size.
+
+    With ``quantize`` the weights are additionally converted to int8 with
+    ONNX Runtime's dynamic quantisation. Returns ``path``.
+    """
+    _lazy_imports()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Written next to the destination and renamed, so concurrent processes
+    # never load a partial file.
+    fd, tmp = tempfile.mkstemp(suffix='.onnx', dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        with _torch.inference_mode(False), _torch.no_grad():
+            _torch.onnx.export(model, (example.clone(),), tmp, input_names=['image'],
+                               output_names=['depth'], external_data=False,
+                               dynamic_axes={'image': {0: 'batch'}, 'depth': {0: 'batch'}})
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(tmp, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def _onnx_session(model, example, model_type, quantize):
+    import onnxruntime as ort
+
+    path = onnx_path(model_type, example.shape, quantize)
+    if not os.path.exists(path):
+        export_onnx(model, example, path, quantize)
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if config.DEPTH_THREADS > 0:
+        options.intra_op_num_threads = config.DEPTH_THREADS
+    session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def run(batch):
+        (depth,) = session.run(None, {'image': batch.cpu().numpy()})
+        return _torch.from_numpy(depth)
+
+    return run
+
+
+def parity_error(reference, candidate) -> float:
+    """Return the largest difference between two predictions.
+
+    The difference is relative to the reference's range, since MiDaS
+    predicts relative inverse depth with an arbitrary scale.
+    """
+    reference = reference.float()
+    spread = float(reference.max() - reference.min()) or 1.0
+    return float((candidate.float() - reference).abs().max()) / spread
@@ -5,7 +5,23 @@ functions so that this module can be imported in environments where those
 packages are not available. This also speeds up test startup times.
 """
 
-model = None
+import os
+import threading
+
+import config
+import depth_backends
+import metrics
+from depth_upsampling import resize_to, working_shape
+from image_io import read_image, to_uint8
+from result_cache import content_hash, get_result_cache, make_key
+
+# MiDaS variants exposed as a latency/quality dial, fastest last.
+MODEL_TYPES = ('DPT_Large', 'DPT_Hybrid', 'MiDaS_small')
+
+_models = {}
+_runners = {}
+_transforms = None
+_load_lock = threading.Lock()
 _torch = None
 _cv2 = None
 _np = None
@@ -16,7 +32,8 @@ def _lazy_imports():
     global _torch, _cv2, _np
     if _torch is None:
         import torch
-        torch.hub.set_default_git_env({'GIT_SSL_NO_VERIFY': '1'})
+        if hasattr(torch.hub, 'set_default_git_env'):
+            torch.hub.set_default_git_env({'GIT_SSL_NO_VERIFY': '1'})
         _torch = torch
     if _cv2 is None:
         import cv2
@@ -26,40 +43,232 @@ def _lazy_imports():
         _np = np
 
 
-def load_model():
-    global model
+def _resolve_model_type(model_type):
+    model_type = model_type or config.DEPTH_MODEL
+    if model_type not in MODEL_TYPES:
+        raise ValueError(
+            f"Unknown depth model {model_type!r}; expected one of {', '.join(MODEL_TYPES)}"
+        )
+    return model_type
+
+
+def load_model(model_type: str | None = None):
+    """Return the MiDaS model ``model_type``, loading it on first use.
+
+    Loaded models stay resident so later requests skip the hub lookup.
+    """
+    model_type = _resolve_model_type(model_type)
     _lazy_imports()
+    model = _models.get(model_type)
     if model is None:
-        model = _torch.hub.load('intel-isl/MiDaS', 'DPT_Large')
-        model.eval()
-        device = _torch.device('cuda' if _torch.cuda.is_available() else 'cpu')
-        model.to(device)
+        with _load_lock:
+            model = _models.get(model_type)
+            if model is None:
+                model = _torch.hub.load('intel-isl/MiDaS', model_type)
+                model.eval()
+                device = _torch.device('cuda' if _torch.cuda.is_available() else 'cpu')
+                model.to(device)
+                _models[model_type] = model
     return model
 
 
-def estimate_depth(image_path: str):
-    """Estimate depth map and average depth using MiDaS."""
+def get_runner(model_type: str | None = None, backend: str | None = None):
+    """Return ``model_type`` prepared for ``backend`` (``config.DEPTH_BACKEND``).
+
+    The runner maps a batch tensor to a batch of predictions like the eager
+    model does; see :mod:`depth_backends`.
+    """
+    model_type = _resolve_model_type(model_type)
+    backend = depth_backends.resolve_backend(backend)
+    model = load_model(model_type)
+    if backend == 'eager':
+        return model
+    runner = _runners.get((model_type, backend))
+    if runner is None:
+        with _load_lock:
+            runner = _runners.get((model_type, backend))
+            if runner is None:
+                depth_backends.configure_threads()
+                runner = depth_backends.build_runner(model, backend, model_type)
+                _runners[model_type, backend] = runner
+    return runner
+
+
+def check_parity(model_type: str | None = None, backend: str | None = None, img=None) -> float:
+    """Return how far ``backend``'s prediction strays from the eager model's.
+
+    The error is the largest absolute difference relative to the eager
+    prediction's range, for ``img`` (a BGR array) or a synthetic scene.
+    """
+    model_type = _resolve_model_type(model_type)
     _lazy_imports()
-    model = load_model()
-    device = next(model.parameters()).device
-
-    img = _cv2.imread(image_path)
-    img_rgb = _cv2.cvtColor(img, _cv2.COLOR_BGR2RGB)
-    transform = _torch.hub.load('intel-isl/MiDaS', 'transforms').dpt_transform
-    input_batch = transform(img_rgb).to(device)
-
-    with _torch.no_grad():
-        prediction = model(input_batch)
-        prediction = _torch.nn.functional.interpolate(
-            prediction.unsqueeze(1),
-            size=img_rgb.shape[:2],
-            mode='bilinear',
-            align_corners=False,
-        ).squeeze()
+    if img is None:
+        yy, xx = _np.mgrid[0:384, 0:512]
+        rng = _np.random.default_rng(0)
+        img = _np.stack([xx % 256, yy % 256, (xx + yy) % 256], axis=-1).astype(_np.float32)
+        img = _np.clip(img + rng.normal(0, 20, img.shape), 0, 255).astype(_np.uint8)
+    batch = get_transform(model_type)(_cv2.cvtColor(img, _cv2.COLOR_BGR2RGB))
+    model = load_model(model_type)
+    with _torch.inference_mode():
+        reference = model(batch.to(next(model.parameters()).device)).cpu()
+        candidate = get_runner(model_type, backend)(batch).cpu()
+    return depth_backends.parity_error(reference, candidate)
 
+
+def get_transform(model_type: str | None = None):
+    """Return the MiDaS input transform matching ``model_type``."""
+    global _transforms
+    model_type = _resolve_model_type(model_type)
+    _lazy_imports()
+    if _transforms is None:
+        with _load_lock:
+            if _transforms is None:
+                _transforms = _torch.hub.load('intel-isl/MiDaS', 'transforms')
+    if model_type == 'MiDaS_small':
+        return _transforms.small_transform
+    return _transforms.dpt_transform
+
+
+def warm_up(model_type: str | None = None):
+    """Load the model and transforms and run one small forward pass.
+
+    Called by the service at startup so the first request does not pay for
+    the hub lookup, weight loading and first-call kernel initialisation.
+    A backend other than ``eager`` is first checked with
+    :func:`check_parity`, and a ``RuntimeError`` is raised when its error
+    exceeds ``config.DEPTH_PARITY_TOLERANCE``.
+    """
+    _lazy_imports()
+    backend = depth_backends.resolve_backend()
+    if backend != 'eager' and config.DEPTH_PARITY_TOLERANCE > 0:
+        error = check_parity(model_type, backend)
+        if error > config.DEPTH_PARITY_TOLERANCE:
+            raise RuntimeError(
+                f"Depth backend {backend!r} differs from the eager model by {error:.3f} "
+                f"of the depth range (tolerance {config.DEPTH_PARITY_TOLERANCE})"
+            )
+    estimate_depth_array(_np.zeros((64, 64, 3), dtype=_np.uint8), model_type=model_type)
+
+
+def _depth_result(prediction, size):
+    """Upsample one raw prediction to ``size`` and package the metrics."""
+    prediction = _torch.nn.functional.interpolate(
+        prediction[None, None],
+        size=size,
+        mode='bilinear',
+        align_corners=False,
+    ).squeeze()
     depth_map = prediction.cpu().numpy()
-    avg_depth = float(_np.mean(depth_map))
     return {
-        'average_depth': avg_depth,
+        'average_depth': float(_np.mean(depth_map)),
         'depth_map': depth_map,
     }
+
+
+# Long edge of the 8-bit proxy MiDaS sees for 16-bit and memory-mapped
+# images; the transforms shrink their input to 384 px anyway.
+PROXY_MAX_SIDE = 1536
+
+
+def _model_input(img):
+    """Return the RGB ``uint8`` image handed to the MiDaS transform."""
+    if img.dtype != _np.uint8 or img.strides[2] < 0:
+        img = to_uint8(resize_to(img, working_shape(img.shape, PROXY_MAX_SIDE)))
+    return _cv2.cvtColor(img, _cv2.COLOR_BGR2RGB)
+
+
+def _estimate_chunk(chunk, model_type, max_side):
+    backend = depth_backends.resolve_backend()
+    cache = get_result_cache()
+    images = [read_image(item, keep_depth=True) if isinstance(item, (str, os.PathLike)) else item
+              for item in chunk]
+    results = [None] * len(chunk)
+    keys = [None] * len(chunk)
+    if cache is not None:
+        for i, img in enumerate(images):
+            keys[i] = make_key('depth', content_hash(img), model=model_type, max_side=max_side,
+                               backend=backend)
+            depth_map = cache.get(keys[i])
+            if depth_map is not None:
+                results[i] = {'average_depth': float(_np.mean(depth_map)), 'depth_map': depth_map}
+
+    misses = [i for i, result in enumerate(results) if result is None]
+    if not misses:
+        return results
+
+    runner = get_runner(model_type, backend)
+    transform = get_transform(model_type)
+    # Only the eager model may live on a GPU; the other backends run on the CPU.
+    device = next(load_model(model_type).parameters()).device if backend == 'eager' else 'cpu'
+    inputs = {}
+    sizes = {}
+    for i in misses:
+        inputs[i] = transform(_model_input(images[i]))
+        sizes[i] = working_shape(images[i].shape, max_side)
+
+    # The MiDaS transforms keep the aspect ratio, so only inputs that end up
+    # with the same tensor shape can share a forward pass.
+    groups = {}
+    for i, tensor in inputs.items():
+        groups.setdefault(tuple(tensor.shape[1:]), []).append(i)
+
+    with _torch.inference_mode(), metrics.stage('midas'):
+        for indices in groups.values():
+            batch = _torch.cat([inputs[i] for i in indices]).to(device)
+            prediction = runner(batch)
+            for row, i in zip(prediction, indices):
+                results[i] = _depth_result(row, sizes[i])
+                if cache is not None:
+                    cache.put(keys[i], results[i]['depth_map'])
+    return results
+
+
+def estimate_depth_batch(images, batch_size: int = 8, model_type: str | None = None,
+                         working_size: int | None = None):
+    """Estimate depth for many images with one forward pass per batch.
+
+    ``images`` is an iterable of file paths and/or decoded BGR arrays; it is
+    consumed ``batch_size`` items at a time so only one batch is decoded at
+    once. Each depth map is upsampled back to its own image size and the
+    results are returned in input order.
+
+    ``working_size`` caps the long edge of the returned depth maps (``0``
+    means full resolution, ``None`` uses ``config.DEPTH_WORKING_SIZE``). The
+    correction functions accept such reduced maps and upsample them with
+    guidance from the image only where they are applied.
+
+    When the result cache is enabled, images already seen with the same
+    model, backend and working size are answered from it without running
+    MiDaS.
+    """
+    max_side = config.DEPTH_WORKING_SIZE if working_size is None else working_size
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+    model_type = _resolve_model_type(model_type)
+    _lazy_imports()
+
+    results = []
+    chunk = []
+    for item in images:
+        chunk.append(item)
+        if len(chunk) == batch_size:
+            results.extend(_estimate_chunk(chunk, model_type, max_side))
+            chunk = []
+    if chunk:
+        results.extend(_estimate_chunk(chunk, model_type, max_side))
+    return results
+
+
+def estimate_depth_array(img, model_type: str | None = None, working_size: int | None = None):
+    """Estimate depth map and average depth for a decoded BGR image."""
+    return estimate_depth_batch(
+        [img], batch_size=1, model_type=model_type, working_size=working_size
+    )[0]
+
+
+def estimate_depth(image_path: str, model_type: str | None = None, working_size: int | None = None):
+    """Estimate depth map and average depth using MiDaS."""
+    return estimate_depth_array(
+        read_image(image_path, keep_depth=True), model_type=model_type,
+        working_size=working_size
+    )
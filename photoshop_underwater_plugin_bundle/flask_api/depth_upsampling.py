@@ -0,0 +1,144 @@
+"""Edge-aware upsampling of working-resolution depth maps.
+
+Depth can be kept at a reduced working resolution and brought back to image
+resolution only where a correction needs it. Upsampling uses the fast guided
+filter (He & Sun, 2015): the linear guide-to-depth coefficients are solved at
+working resolution and bilinearly interpolated, so any block of full
+resolution rows can be produced from the RGB guide without materialising the
+full-size depth map.
+"""
+
+_cv2 = None
+_np = None
+
+# Rows processed per strip by the tiled correction paths.
+TILE_ROWS = 512
+
+# Long edge of the downsampled image the global correction parameters are
+# fitted on before the correction is applied strip by strip.
+FIT_MAX_SIDE = 1024
+
+
+def _lazy_imports():
+    global _cv2, _np
+    if _cv2 is None:
+        import cv2
+        _cv2 = cv2
+    if _np is None:
+        import numpy as np
+        _np = np
+
+
+def working_shape(shape, max_side: int | None):
+    """Return ``(h, w)`` scaled so the long edge is at most ``max_side``."""
+    h, w = shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return h, w
+    scale = max_side / max(h, w)
+    return max(1, round(h * scale)), max(1, round(w * scale))
+
+
+def _guide(img):
+    """Return a float32 luminance guide in ``[0, 1]`` for a BGR image."""
+    if img.ndim == 3:
+        img = _cv2.cvtColor(img, _cv2.COLOR_BGR2GRAY)
+    scale = 1.0 / _np.iinfo(img.dtype).max if img.dtype.kind in 'ui' else 1.0
+    return img.astype(_np.float32) * _np.float32(scale)
+
+
+def resize_to(img, shape):
+    """Resize ``img`` to ``shape`` (``(h, w)``), area-averaging when shrinking."""
+    _lazy_imports()
+    h, w = shape[:2]
+    if img.shape[:2] == (h, w):
+        return img
+    if img.ndim == 3 and img.strides[2] < 0:
+        # A channel-reversed view (e.g. a memory-mapped RGB TIFF): resize the
+        # underlying array rather than letting OpenCV copy it whole.
+        return _np.ascontiguousarray(resize_to(img[..., ::-1], shape)[..., ::-1])
+    shrinking = h <= img.shape[0] and w <= img.shape[1]
+    interpolation = _cv2.INTER_AREA if shrinking else _cv2.INTER_LINEAR
+    return _cv2.resize(img, (w, h), interpolation=interpolation)
+
+
+class GuidedDepthUpsampler:
+    """Upsample a low-resolution depth map guided by the full-resolution image.
+
+    ``radius`` is the guided filter window radius in working-resolution pixels
+    and ``eps`` the regularisation on the guide variance; larger values give
+    smoother depth with fewer transferred edges.
+    """
+
+    def __init__(self, depth_map, img, radius: int = 4, eps: float = 1e-3):
+        _lazy_imports()
+        self.img = img
+        self.shape = img.shape[:2]
+        h_lo, w_lo = depth_map.shape[:2]
+        p = depth_map.astype(_np.float32, copy=False)
+        guide_lo = _guide(resize_to(img, (h_lo, w_lo)))
+
+        ksize = (2 * radius + 1, 2 * radius + 1)
+
+        def box(x):
+            return _cv2.boxFilter(x, -1, ksize, borderType=_cv2.BORDER_REFLECT)
+
+        mean_i = box(guide_lo)
+        mean_p = box(p)
+        cov_ip = box(guide_lo * p) - mean_i * mean_p
+        var_i = box(guide_lo * guide_lo) - mean_i * mean_i
+        a = cov_ip / (var_i + _np.float32(eps))
+        b = mean_p - a * mean_i
+        self._a = box(a)
+        self._b = box(b)
+
+        self._y_scale = h_lo / self.shape[0]
+        self._h_lo = h_lo
+
+    def _interp_rows(self, coef, start, stop):
+        y = (_np.arange(start, stop, dtype=_np.float32) + 0.5) * self._y_scale - 0.5
+        y = _np.clip(y, 0, self._h_lo - 1)
+        y0 = _np.floor(y).astype(_np.intp)
+        y1 = _np.minimum(y0 + 1, self._h_lo - 1)
+        wy = (y - y0).astype(_np.float32)[:, None]
+        # Widen only the working-resolution rows this strip needs (OpenCV's
+        # bilinear resize uses the same pixel-centre mapping), then blend
+        # them vertically; gathering whole rows is far cheaper than gathering
+        # columns.
+        lo, hi = y0[0], y1[-1] + 1
+        band = _cv2.resize(coef[lo:hi], (self.shape[1], hi - lo), interpolation=_cv2.INTER_LINEAR)
+        top = band[y0 - lo]
+        bottom = band[y1 - lo]
+        bottom -= top
+        bottom *= wy
+        top += bottom
+        return top
+
+    def rows(self, start: int, stop: int):
+        """Return full-resolution depth for image rows ``start:stop``."""
+        guide = _guide(self.img[start:stop])
+        depth = self._interp_rows(self._a, start, stop)
+        depth *= guide
+        depth += self._interp_rows(self._b, start, stop)
+        return depth
+
+    def full(self):
+        """Return the whole full-resolution depth map."""
+        return self.rows(0, self.shape[0])
+
+
+def depth_row_source(depth_map, img):
+    """Return ``rows(start, stop)`` yielding full-resolution depth for image rows.
+
+    Full-resolution depth maps are sliced directly; reduced ones are
+    guided-upsampled on demand.
+    """
+    if depth_map.shape[:2] == img.shape[:2]:
+        return lambda start, stop: depth_map[start:stop]
+    return GuidedDepthUpsampler(depth_map, img).rows
+
+
+def upsample_depth(depth_map, img, radius: int = 4, eps: float = 1e-3):
+    """Return ``depth_map`` guided-upsampled to the resolution of ``img``."""
+    if depth_map.shape[:2] == img.shape[:2]:
+        return depth_map
+    return GuidedDepthUpsampler(depth_map, img, radius, eps).full()
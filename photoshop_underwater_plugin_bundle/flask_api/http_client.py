@@ -0,0 +1,135 @@
+"""Shared HTTP session for image transfers and Adobe API calls.
+
+One ``requests.Session`` per process keeps connections to S3 and the Adobe
+endpoints alive between jobs instead of paying a TCP and TLS handshake for
+every request. Transient failures (connection errors and 429/5xx answers)
+are retried with exponential backoff. POST requests are only retried when
+the connection failed before anything was sent, so a job is never submitted
+twice.
+"""
+
+import os
+import tempfile
+import threading
+
+import config
+
+_requests = None
+
+_session = None
+_session_lock = threading.Lock()
+
+# Bytes read from the socket per iteration while streaming a download.
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadTooLargeError(ValueError):
+    """Raised when a download exceeds the allowed size."""
+
+
+def _lazy_imports():
+    global _requests
+    if _requests is None:
+        import requests
+        _requests = requests
+
+
+def _retry():
+    from urllib3.util.retry import Retry
+
+    return Retry(
+        total=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+
+
+def new_session():
+    """Return a ``requests.Session`` with pooled, retrying adapters."""
+    _lazy_imports()
+    from requests.adapters import HTTPAdapter
+
+    session = _requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_SIZE,
+        pool_maxsize=config.HTTP_POOL_SIZE,
+        max_retries=_retry(),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+        return _session
+
+
+def _stream(url, write, max_bytes):
+    session = get_session()
+    with session.get(url, stream=True, timeout=config.HTTP_TIMEOUT) as response:
+        response.raise_for_status()
+        length = response.headers.get('Content-Length')
+        if max_bytes and length and length.isdigit() and int(length) > max_bytes:
+            raise DownloadTooLargeError(f'{url} is {length} bytes; the limit is {max_bytes}')
+        received = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            if max_bytes and received > max_bytes:
+                raise DownloadTooLargeError(f'{url} exceeds the {max_bytes} byte limit')
+            write(chunk)
+    return received
+
+
+def download_to_file(url: str, local_path: str, max_bytes: int | None = None) -> int:
+    """Stream ``url`` into ``local_path`` and return the number of bytes written.
+
+    The body is written in ``CHUNK_SIZE`` pieces to a temporary file that
+    replaces ``local_path`` only once complete, so a failed or oversized
+    download never leaves a partial image behind. ``max_bytes`` defaults to
+    ``config.MAX_DOWNLOAD_BYTES`` (``0`` disables the limit).
+    """
+    if max_bytes is None:
+        max_bytes = config.MAX_DOWNLOAD_BYTES
+    directory = os.path.dirname(os.path.abspath(local_path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            received = _stream(url, f.write, max_bytes)
+        os.replace(tmp, local_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return received
+
+
+def download_bytes(url: str, max_bytes: int | None = None) -> bytearray:
+    """Stream ``url`` into memory and return its body, subject to ``max_bytes``.
+
+    The buffer is returned as received rather than copied into ``bytes``;
+    :func:`image_io.decode_image` accepts it as is.
+    """
+    if max_bytes is None:
+        max_bytes = config.MAX_DOWNLOAD_BYTES
+    body = bytearray()
+    _stream(url, body.extend, max_bytes)
+    return body
+
+
+def upload_file(url: str, local_path: str, content_type: str = 'application/octet-stream'):
+    """Stream ``local_path`` to ``url`` with a PUT, e.g. to a presigned S3 URL."""
+    session = get_session()
+    with open(local_path, 'rb') as f:
+        response = session.put(url, data=f, timeout=config.HTTP_TIMEOUT,
+                               headers={'Content-Type': content_type,
+                                        'Content-Length': str(os.path.getsize(local_path))})
+    response.raise_for_status()
+    return response
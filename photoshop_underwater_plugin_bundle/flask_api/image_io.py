@@ -0,0 +1,218 @@
+"""Image decode/encode helpers shared by the processing pipeline.
+
+Every stage of the pipeline works on BGR arrays; these helpers are the only
+places that touch the filesystem so an image is decoded once on the way in
+and encoded once on the way out.
+
+Arrays are ``uint8`` by default. With ``keep_depth`` 16-bit images (e.g.
+TIFFs developed from RAW) keep their precision through the pipeline, and
+PNG/TIFF outputs are written at the array's bit depth; formats that only
+hold 8 bits are converted on the way out. With the optional ``tifffile``
+package, uncompressed TIFFs can be memory-mapped on both sides
+(:func:`read_image` with ``mmap``, :func:`create_output_image`), so the
+strip-wise correction streams through the files instead of holding them in
+RAM. Memory-mapped images are channel-reversed views of the RGB file data.
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import config
+
+_cv2 = None
+_np = None
+
+# Formats written at 16 bits per channel when given a 16-bit array.
+HIGH_BIT_DEPTH_EXTENSIONS = ('.png', '.tif', '.tiff')
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+
+def _lazy_imports():
+    global _cv2, _np
+    if _cv2 is None:
+        import cv2
+        _cv2 = cv2
+    if _np is None:
+        import numpy as np
+        _np = np
+
+
+def pixel_max(dtype) -> float:
+    """Return the value of full intensity for images of ``dtype``."""
+    _lazy_imports()
+    dtype = _np.dtype(dtype)
+    return float(_np.iinfo(dtype).max) if dtype.kind in 'ui' else 1.0
+
+
+def to_uint8(img):
+    """Return ``img`` scaled to ``uint8`` (``img`` itself if it already is)."""
+    _lazy_imports()
+    if img.dtype == _np.uint8:
+        return img
+    return _cv2.convertScaleAbs(img, alpha=255.0 / pixel_max(img.dtype))
+
+
+def _imread_flags(keep_depth):
+    # ANYDEPTH rather than UNCHANGED: keep 16 bits but still get three BGR
+    # channels for greyscale and alpha images.
+    return _cv2.IMREAD_COLOR | _cv2.IMREAD_ANYDEPTH if keep_depth else _cv2.IMREAD_COLOR
+
+
+def read_image(image_path: str, *, keep_depth: bool = False, mmap: bool = False):
+    """Decode ``image_path`` into a BGR array.
+
+    The array is ``uint8`` unless ``keep_depth`` is set, in which case 16-bit
+    images stay ``uint16``. With ``mmap`` an uncompressed 8 or 16-bit RGB
+    TIFF is memory-mapped read-only instead of decoded (see
+    :func:`map_image`); other files are decoded as usual.
+    """
+    _lazy_imports()
+    if mmap:
+        img = map_image(image_path)
+        if img is not None and (keep_depth or img.dtype == _np.uint8):
+            return img
+    img = _cv2.imread(image_path, _imread_flags(keep_depth))
+    if img is None:
+        raise FileNotFoundError(f"Could not read {image_path}")
+    return img
+
+
+def map_image(image_path: str, mode: str = 'r'):
+    """Return a memory-mapped BGR view of an RGB TIFF, or ``None``.
+
+    ``None`` is returned when ``tifffile`` is not installed or the file is
+    not an uncompressed, contiguous 3-channel TIFF.
+    """
+    if not image_path.lower().endswith(TIFF_EXTENSIONS):
+        return None
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    try:
+        mapped = tifffile.memmap(image_path, mode=mode)
+    except (ValueError, OSError):
+        return None
+    if mapped.ndim != 3 or mapped.shape[2] != 3 or mapped.dtype.kind != 'u':
+        return None
+    return mapped[..., ::-1]
+
+
+def create_output_image(image_path: str, shape, dtype):
+    """Return a writable BGR array backed by a new memory-mapped TIFF, or ``None``.
+
+    Pass the array as the correction's ``out`` and then to
+    :func:`write_image`, which only flushes it. ``None`` is returned for
+    other formats or without ``tifffile``; the caller then keeps the result
+    in memory.
+    """
+    if not image_path.lower().endswith(TIFF_EXTENSIONS):
+        return None
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    directory = os.path.dirname(image_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    mapped = tifffile.memmap(image_path, shape=tuple(shape), dtype=dtype, photometric='rgb')
+    return mapped[..., ::-1]
+
+
+def _mapped_file(img):
+    base = img
+    while base is not None and not isinstance(base, _np.memmap):
+        base = base.base
+    return base
+
+
+def is_memory_mapped(img) -> bool:
+    """Return whether ``img`` is (a view of) a memory-mapped file."""
+    _lazy_imports()
+    return _mapped_file(img) is not None
+
+
+def decode_image(data, *, keep_depth: bool = False):
+    """Decode encoded image bytes (or any buffer) into a BGR array.
+
+    The buffer is wrapped rather than copied, so uploads and downloads held
+    in memory never touch the disk. ``keep_depth`` is as for
+    :func:`read_image`.
+    """
+    _lazy_imports()
+    img = _cv2.imdecode(_np.frombuffer(data, dtype=_np.uint8), _imread_flags(keep_depth))
+    if img is None:
+        raise ValueError('Could not decode image data')
+    return img
+
+
+def _for_format(img, ext):
+    if img.dtype != _np.uint8 and ext.lower() not in HIGH_BIT_DEPTH_EXTENSIONS:
+        return to_uint8(img)
+    return img
+
+
+def encode_image(img, ext: str = '.jpg', quality: int = 90) -> bytes:
+    """Encode ``img`` in the format given by ``ext`` and return the bytes.
+
+    High bit depth arrays are reduced to 8 bits for formats that need it.
+    """
+    _lazy_imports()
+    ok, buf = _cv2.imencode(ext, _for_format(img, ext), [_cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f'Could not encode image as {ext}')
+    return buf.tobytes()
+
+
+def read_upload(file_storage, *, keep_depth: bool = False):
+    """Decode an uploaded ``FileStorage`` straight from its stream."""
+    stream = getattr(file_storage, 'stream', file_storage)
+    getbuffer = getattr(stream, 'getbuffer', None)
+    # Small uploads are spooled in a BytesIO whose buffer can be used as is.
+    data = getbuffer() if getbuffer is not None else stream.read()
+    return decode_image(data, keep_depth=keep_depth)
+
+
+def make_scratch_dir(prefix: str = 'job-') -> str:
+    """Create a private temporary directory; the caller removes it.
+
+    Directories are created under ``config.SCRATCH_DIR`` (the system temp
+    directory when unset), so concurrent requests never share files.
+    """
+    root = config.SCRATCH_DIR or None
+    if root:
+        os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+
+@contextmanager
+def scratch_dir(prefix: str = 'job-'):
+    """Yield a private temporary directory (see :func:`make_scratch_dir`) that is removed afterwards."""
+    path = make_scratch_dir(prefix)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def write_image(image_path: str, img) -> str:
+    """Encode ``img`` to ``image_path`` and return the path.
+
+    PNG and TIFF keep the array's bit depth; other formats get 8 bits. An
+    array from :func:`create_output_image` for ``image_path`` is already the
+    file's contents and is only flushed.
+    """
+    _lazy_imports()
+    mapped = _mapped_file(img)
+    if mapped is not None and mapped.filename and os.path.exists(image_path) \
+            and os.path.samefile(mapped.filename, image_path):
+        mapped.flush()
+        return image_path
+    directory = os.path.dirname(image_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if not _cv2.imwrite(image_path, _for_format(img, os.path.splitext(image_path)[1])):
+        raise IOError(f"Could not write {image_path}")
+    return image_path
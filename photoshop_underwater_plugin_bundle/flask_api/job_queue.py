@@ -0,0 +1,142 @@
+"""In-process job queue backing the asynchronous ``/jobs`` API.
+
+Jobs run on a ``concurrent.futures`` executor, so no external broker is
+needed. The pool is pluggable: ``'thread'``, ``'process'`` or any
+``Executor`` instance. At most ``workers + max_queued`` jobs may be in
+flight; further submissions raise :class:`QueueFullError` so the service can
+apply backpressure instead of queueing without bound. An ``initializer``
+runs once per worker, e.g. to load the depth model at process start-up.
+
+Process workers use the ``start_method`` given (``'fork'``, ``'forkserver'``
+or ``'spawn'``). A fork server first imports ``preload`` modules, so each
+worker it forks starts with them already imported.
+"""
+
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue has no free slot."""
+
+
+def _ready():
+    return True
+
+
+def _copy_outcome(source, target):
+    error = source.exception()
+    if error is None:
+        target.set_result(source.result())
+    else:
+        target.set_exception(error)
+
+
+class JobQueue:
+    """Bounded queue of jobs executed on a thread or process pool."""
+
+    def __init__(self, workers: int = 2, max_queued: int = 16, executor='thread',
+                 keep_finished: int = 256, initializer=None, start_method: str | None = None,
+                 preload=()):
+        if isinstance(executor, Executor):
+            self._executor = executor
+        elif executor == 'thread':
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix='job',
+                                                initializer=initializer)
+        elif executor == 'process':
+            context = multiprocessing.get_context(start_method or None)
+            if context.get_start_method() == 'forkserver' and preload:
+                context.set_forkserver_preload(list(preload))
+            self._executor = ProcessPoolExecutor(workers, mp_context=context,
+                                                 initializer=initializer)
+        else:
+            raise ValueError(f"Unknown executor {executor!r}; expected 'thread' or 'process'")
+        self._workers = workers
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._keep_finished = keep_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_workers(self):
+        """Start every worker now rather than on the first jobs.
+
+        Workers are created from the current state of this process, so call
+        it once the state they should inherit (e.g. a loaded model) is ready,
+        and before this process does anything unsafe to fork, such as
+        running multi-threaded inference.
+        """
+        for future in [self._executor.submit(_ready) for _ in range(self._workers)]:
+            future.result()
+
+    def submit(self, fn, *args, then=None, **kwargs) -> str:
+        """Schedule ``fn(*args, **kwargs)`` and return its job ID.
+
+        ``then``, if given, is called in this process with ``fn``'s result
+        once it has run and must return a future for the job's final result.
+        The worker and its queue slot are free again while that future is
+        pending, so waiting on external services (e.g. a Photoshop job) does
+        not hold up compute; the job reports ``running`` until it resolves.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError('Job queue is full')
+        job_id = uuid.uuid4().hex
+        try:
+            compute = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        job = {'submitted': time.time(), 'finished': None, 'compute': compute, 'future': Future()}
+        with self._lock:
+            self._jobs[job_id] = job
+        compute.add_done_callback(lambda _: self._computed(job_id, job, then))
+        return job_id
+
+    def _computed(self, job_id, job, then):
+        self._slots.release()
+        future = job['future']
+        future.add_done_callback(lambda _: self._finished(job_id))
+        try:
+            result = job['compute'].result()
+            if then is None:
+                future.set_result(result)
+                return
+            follow = then(result)
+        except BaseException as exc:
+            future.set_exception(exc)
+            return
+        follow.add_done_callback(lambda done: _copy_outcome(done, future))
+
+    def _finished(self, job_id: str):
+        with self._lock:
+            self._jobs[job_id]['finished'] = time.time()
+            done = [k for k, job in self._jobs.items() if job['finished'] is not None]
+            for key in done[:max(0, len(done) - self._keep_finished)]:
+                del self._jobs[key]
+
+    def status(self, job_id: str):
+        """Return a JSON-ready status dict for ``job_id``, or ``None`` if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job['future']
+        info = {'id': job_id, 'submitted': job['submitted']}
+        if future.done():
+            info['finished'] = job['finished']
+            error = future.exception()
+            if error is None:
+                info.update(status='succeeded', result=future.result())
+            else:
+                info.update(status='failed', error=str(error))
+        elif job['compute'].running() or job['compute'].done():
+            info['status'] = 'running'
+        else:
+            info['status'] = 'queued'
+        return info
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -1,22 +1,95 @@
 import argparse
+import glob
 import os
 
+from depth_estimation import MODEL_TYPES
 from main import process_image
+from video import is_video
+
+
+def summarize(adjustments, histograms: bool = False):
+    """Return ``adjustments`` for printing.
+
+    The analysis histograms (768 counts) are left out unless ``histograms``
+    is set.
+    """
+    analysis = adjustments.get("analysis")
+    if histograms or not analysis or "histograms" not in analysis:
+        return adjustments
+    analysis = {k: v for k, v in analysis.items() if k != "histograms"}
+    return {**adjustments, "analysis": analysis}
 
 
 def main():
     parser = argparse.ArgumentParser(description="Run underwater correction locally")
-    parser.add_argument("image_path", help="Path to the input image")
-    parser.add_argument("output_path", help="Path for the corrected output image")
+    parser.add_argument("image_path",
+                        help="Path to the input image or video, or a directory or glob for "
+                             "batch mode")
+    parser.add_argument("output_path",
+                        help="Path for the corrected output image or video (a directory in "
+                             "batch mode)")
     parser.add_argument("--advanced", action="store_true", help="Use advanced Sea-Thru")
+    parser.add_argument("--depth-model", choices=MODEL_TYPES, default=None,
+                        help="MiDaS variant (defaults to config.DEPTH_MODEL)")
+    parser.add_argument("--depth-size", type=int, default=None,
+                        help="Long edge of the working depth map in pixels, 0 for full "
+                             "resolution (defaults to config.DEPTH_WORKING_SIZE)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Batch mode: number of correction worker processes")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="Batch mode: images per depth forward pass")
+    parser.add_argument("--force", action="store_true",
+                        help="Batch mode: reprocess images whose output is up to date")
+    parser.add_argument("--keyframe-interval", type=int, default=None,
+                        help="Video mode: frames between depth estimates "
+                             "(defaults to config.VIDEO_KEYFRAME_INTERVAL)")
+    parser.add_argument("--histograms", action="store_true",
+                        help="Also print the corrected image's channel histograms")
     args = parser.parse_args()
 
+    if is_video(args.image_path):
+        from video import correct_video, format_report
+
+        report = correct_video(
+            args.image_path,
+            args.output_path,
+            advanced=args.advanced,
+            depth_model=args.depth_model,
+            depth_working_size=args.depth_size,
+            keyframe_interval=args.keyframe_interval,
+        )
+        print(format_report(report))
+        return
+
+    if os.path.isdir(args.image_path) or glob.has_magic(args.image_path):
+        from batch import format_report, run_batch
+
+        report = run_batch(
+            args.image_path,
+            args.output_path,
+            jobs=args.jobs,
+            batch_size=args.batch_size,
+            force=args.force,
+            advanced=args.advanced,
+            depth_model=args.depth_model,
+            depth_working_size=args.depth_size,
+        )
+        print(format_report(report))
+        if report['failed']:
+            raise SystemExit(1)
+        return
+
     if args.advanced:
         os.environ["ADVANCED_SEATHRU"] = "1"
 
-    result = process_image(image_path=args.image_path, output_path=args.output_path)
+    result = process_image(
+        image_path=args.image_path,
+        output_path=args.output_path,
+        depth_model=args.depth_model,
+        depth_working_size=args.depth_size,
+    )
     print(f"Saved corrected image to {args.output_path}")
-    print(result["adjustments"])
+    print(summarize(result["adjustments"], histograms=args.histograms))
 
 
 if __name__ == "__main__":
@@ -1,17 +1,23 @@
 import os
-import requests
-
-from depth_estimation import estimate_depth
-from image_analysis import analyze_image
-from photoshop_api import submit_photoshop_job
-from sea_thru import apply_sea_thru
 import shutil
+import uuid
+
+import config
+import metrics
+from depth_estimation import estimate_depth_array
+from depth_upsampling import resize_to, working_shape
+from http_client import download_bytes, download_to_file, upload_file
+from image_analysis import analyze_image_array
+from image_io import (TIFF_EXTENSIONS, create_output_image, decode_image, encode_image, read_image,
+                      make_scratch_dir, read_upload, scratch_dir, write_image)
+from photoshop_api import submit_photoshop_job, track_photoshop_job
+from sea_thru import apply_sea_thru_array
+from video import correct_video
+
 
-def download_image(url, local_path):
-    response = requests.get(url)
-    response.raise_for_status()
-    with open(local_path, 'wb') as f:
-        f.write(response.content)
+def download_image(url, local_path, max_bytes=None):
+    """Stream ``url`` to ``local_path`` over the shared pooled session."""
+    download_to_file(url, local_path, max_bytes)
 
 
 def process_image(
@@ -19,44 +25,212 @@ def process_image(
     output_url: str | None = None,
     image_file=None,
     *,
+    image_bytes: bytes | None = None,
     image_path: str | None = None,
     output_path: str | None = None,
+    depth_model: str | None = None,
+    depth_working_size: int | None = None,
+    session_id: str | None = None,
+    reuse_coefs: bool = False,
+    wait_for_photoshop: bool = False,
+    preview_id: str | None = None,
+    include_timings: bool = False,
+    track_photoshop: bool = True,
 ):
-    """Process an image from a URL, uploaded file, or local path.
+    """Process an image from a URL, uploaded file, encoded bytes or local path.
 
     ``output_url`` triggers a Photoshop API job, while ``output_path`` simply
     writes the corrected file locally. One of these must be provided.
+    ``depth_model`` selects the MiDaS variant and defaults to
+    ``config.DEPTH_MODEL``; ``depth_working_size`` caps the depth map's long
+    edge and defaults to ``config.DEPTH_WORKING_SIZE``. Frames sharing a
+    ``session_id`` (e.g. one dive) reuse each other's advanced Sea-Thru fits
+    as warm starts, or outright with ``reuse_coefs``. With
+    ``wait_for_photoshop`` the call returns only once the Photoshop job has
+    finished, with its final status under ``'photoshop'``. ``preview_id``
+    (from :func:`preview_image`) renders with the parameters fitted for that
+    preview instead of fitting them again. ``include_timings`` adds a
+    per-stage ``'timings'`` breakdown (see :mod:`metrics`) to the result.
+    With ``track_photoshop`` off (and without ``wait_for_photoshop``) the
+    caller follows the Photoshop job instead: the result holds its
+    submission response under ``'photoshop'`` and the scratch directory to
+    remove once it has finished under ``'scratch_dir'``.
+
+    The input is decoded once, straight from memory for uploads, bytes and
+    downloads; depth estimation, correction and analysis all share the
+    in-memory arrays and the result is encoded once at the output. The file
+    handed to Photoshop lives in a private scratch directory, so concurrent
+    calls never share paths; it is removed once the Photoshop job has
+    finished, which is tracked in the background without
+    ``wait_for_photoshop``.
+
+    16-bit inputs are corrected at 16 bits and stay 16-bit when
+    ``output_path`` is a PNG or TIFF. Uncompressed TIFF inputs at
+    ``image_path`` and TIFF outputs at ``output_path`` are memory-mapped
+    when ``tifffile`` is installed, so large files are streamed strip by
+    strip instead of held in memory.
+    """
+    if not output_url and not output_path:
+        raise ValueError('Either output_url or output_path must be provided')
+    if preview_id:
+        session_id, reuse_coefs = preview_id, True
+
+    with metrics.trace() as trace:
+        img = _load_input(image_url, image_file, image_bytes, image_path)
+        out = None if output_url else _output_array(output_path, img, image_path)
+        corrected, adjustments = _correct(img, depth_model, depth_working_size,
+                                          session_id, reuse_coefs, out)
+
+        result = {'status': 'submitted', 'adjustments': adjustments}
+        if output_url:
+            # Photoshop reads the file after submission, so the scratch
+            # directory lives until the job has finished.
+            scratch = make_scratch_dir()
+            try:
+                with metrics.stage('encode'):
+                    corrected_path = write_image(os.path.join(scratch, 'image_seathru.jpg'), corrected)
+                with metrics.stage('photoshop_submit'):
+                    photoshop = submit_photoshop_job(corrected_path, output_url, adjustments,
+                                                     wait=wait_for_photoshop)
+            except BaseException:
+                shutil.rmtree(scratch, ignore_errors=True)
+                raise
+            if wait_for_photoshop:
+                shutil.rmtree(scratch, ignore_errors=True)
+                result = {'status': 'completed', 'adjustments': adjustments, 'photoshop': photoshop}
+            elif track_photoshop:
+                _remove_when_finished(track_photoshop_job(photoshop), scratch)
+            else:
+                result.update(photoshop=photoshop, scratch_dir=scratch)
+        else:
+            with metrics.stage('encode'):
+                write_image(output_path, corrected)
+
+    if include_timings:
+        result['timings'] = metrics.breakdown(trace)
+    return result
+
+
+def preview_image(
+    image_url: str | None = None,
+    image_file=None,
+    *,
+    image_bytes: bytes | None = None,
+    image_path: str | None = None,
+    depth_model: str | None = None,
+    max_side: int | None = None,
+    preview_id: str | None = None,
+):
+    """Correct a downscaled proxy of an image for interactive feedback.
+
+    The proxy's long edge is ``max_side`` (``config.PREVIEW_MAX_SIDE`` by
+    default). Returns ``{'preview_id', 'image', 'adjustments'}`` where
+    ``image`` holds JPEG bytes. The fitted correction parameters are cached
+    under ``preview_id`` so the full-resolution render can reuse them (pass
+    it to :func:`process_image`); repeating a preview with the same ID
+    refits and replaces them.
+    """
+    img = _load_input(image_url, image_file, image_bytes, image_path)
+    proxy = resize_to(img, working_shape(img.shape, max_side or config.PREVIEW_MAX_SIDE))
+    preview_id = preview_id or uuid.uuid4().hex
+    corrected, adjustments = _correct(proxy, depth_model, 0, preview_id, False)
+    with metrics.stage('encode'):
+        encoded = encode_image(corrected)
+    return {'preview_id': preview_id, 'image': encoded, 'adjustments': adjustments}
+
+
+def process_video(
+    video_url: str | None = None,
+    output_url: str | None = None,
+    *,
+    video_path: str | None = None,
+    output_path: str | None = None,
+    depth_model: str | None = None,
+    keyframe_interval: int | None = None,
+):
+    """Correct a video from a URL or local path, streaming it frame by frame.
+
+    ``output_url`` receives the corrected clip with an HTTP PUT (e.g. a
+    presigned S3 URL); ``output_path`` writes it locally. Downloads and the
+    corrected file live in a private scratch directory. Returns
+    ``{'status': 'completed', 'video': report}`` with the report from
+    :func:`video.correct_video`, including the frames per second.
     """
-    if image_file is not None:
-        local_path = os.path.join('images', 'input', image_file.filename or 'upload.jpg')
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        image_file.save(local_path)
-    elif image_path is not None:
-        local_path = image_path
-    else:
-        local_path = os.path.join('images', 'input', 'input.jpg')
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        download_image(image_url, local_path)
-
-    depth_metrics = estimate_depth(local_path)
+    if not output_url and not output_path:
+        raise ValueError('Either output_url or output_path must be provided')
+    use_adv = bool(os.environ.get('ADVANCED_SEATHRU'))
+    with scratch_dir('video-') as scratch:
+        if video_path is None:
+            if not video_url:
+                raise ValueError('No video provided')
+            video_path = os.path.join(scratch, 'input' + _extension(video_url, '.mp4'))
+            download_to_file(video_url, video_path, config.MAX_VIDEO_BYTES)
+        target = output_path or os.path.join(scratch, 'corrected.mp4')
+        report = correct_video(video_path, target, advanced=use_adv, depth_model=depth_model,
+                               keyframe_interval=keyframe_interval)
+        if output_url:
+            upload_file(output_url, target, 'video/mp4')
+    return {'status': 'completed', 'video': report}
+
+
+def _extension(url, default):
+    ext = os.path.splitext(url.split('?', 1)[0])[1]
+    return ext if ext else default
+
+
+def _load_input(image_url, image_file, image_bytes, image_path):
+    if image_file is None and image_bytes is None and image_path is None:
+        if not image_url:
+            raise ValueError('No image provided')
+        with metrics.stage('download'):
+            image_bytes = download_bytes(image_url)
+    with metrics.stage('decode') as timer:
+        if image_file is not None:
+            img = read_upload(image_file, keep_depth=True)
+        elif image_bytes is not None:
+            img = decode_image(image_bytes, keep_depth=True)
+        else:
+            img = read_image(image_path, keep_depth=True, mmap=True)
+        timer.megapixels = _megapixels(img)
+    return img
+
+
+def _remove_when_finished(future, path):
+    future.add_done_callback(lambda _: shutil.rmtree(path, ignore_errors=True))
+
+
+def _output_array(output_path, img, image_path):
+    """Return a memory-mapped array to correct into for TIFF outputs, else ``None``."""
+    if not output_path.lower().endswith(TIFF_EXTENSIONS):
+        return None
+    if image_path and os.path.exists(output_path) and os.path.samefile(image_path, output_path):
+        # The input may be mapped from the very file that would be truncated.
+        return None
+    return create_output_image(output_path, img.shape, img.dtype)
+
+
+def _megapixels(img):
+    shape = getattr(img, 'shape', None)
+    return shape[0] * shape[1] / 1e6 if shape else None
+
+
+def _correct(img, depth_model, depth_working_size, session_id, reuse_coefs, out=None):
+    megapixels = _megapixels(img)
+    with metrics.stage('depth', megapixels):
+        depth_metrics = estimate_depth_array(
+            img, model_type=depth_model, working_size=depth_working_size
+        )
     use_adv = bool(os.environ.get('ADVANCED_SEATHRU'))
-    corrected_path = apply_sea_thru(local_path, depth_metrics['depth_map'], advanced=use_adv)
-    analysis = analyze_image(corrected_path)
+    with metrics.stage('correct', megapixels):
+        corrected = apply_sea_thru_array(
+            img, depth_metrics['depth_map'], advanced=use_adv,
+            session_id=session_id, reuse_coefs=reuse_coefs, out=out,
+        )
+    with metrics.stage('analysis', megapixels):
+        analysis = analyze_image_array(corrected)
 
     adjustments = {
         'depth': depth_metrics,
         'analysis': analysis,
     }
-
-    if output_url:
-        submit_photoshop_job(corrected_path, output_url, adjustments)
-    elif output_path:
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        shutil.copy(corrected_path, output_path)
-    else:
-        raise ValueError('Either output_url or output_path must be provided')
-
-    return {
-        'status': 'submitted',
-        'adjustments': adjustments,
-    }
+    return corrected, adjustments
@@ -0,0 +1,216 @@
+"""Per-stage instrumentation of the processing pipeline.
+
+Code wraps each stage in :func:`stage`, which records wall and CPU time (and
+optionally megapixels and peak traced memory) into process-wide Prometheus
+style histograms and counters, and into the per-request breakdown opened by
+:func:`trace` when there is one. :func:`render` produces the text exposition
+format served at ``/metrics``.
+
+With ``config.METRICS_ENABLED`` off, :func:`stage` returns a shared no-op
+context manager, so instrumented code pays one attribute lookup and call.
+``config.METRICS_TRACE_MEMORY`` additionally records each stage's peak
+``tracemalloc`` usage; this slows allocation-heavy code and, with concurrent
+requests, attributes overlapping allocations to whichever stage is open.
+"""
+
+import contextvars
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import config
+
+# Upper bounds (seconds) of the stage and request duration histograms.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_current = contextvars.ContextVar('metrics_trace', default=None)
+
+
+class _NoOp:
+    megapixels = None
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoOp()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    """Add ``value`` to histogram ``name``."""
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist['buckets'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def inc(name: str, amount: float = 1.0, **labels):
+    """Increase counter ``name`` by ``amount``."""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+class _Stage:
+    def __init__(self, name, megapixels):
+        self.name = name
+        self.megapixels = megapixels
+
+    def __enter__(self):
+        self._trace_memory = config.METRICS_TRACE_MEMORY and tracemalloc.is_tracing()
+        if self._trace_memory:
+            tracemalloc.reset_peak()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        observe('underwater_stage_seconds', wall, stage=self.name)
+        inc('underwater_stage_cpu_seconds_total', cpu, stage=self.name)
+        if self.megapixels:
+            inc('underwater_stage_megapixels_total', self.megapixels, stage=self.name)
+        record = {'wall': wall, 'cpu': cpu}
+        if self.megapixels:
+            record['megapixels'] = self.megapixels
+        if self._trace_memory:
+            record['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        current = _current.get()
+        if current is not None:
+            with current['lock']:
+                previous = current['stages'].get(self.name)
+                if previous is not None:
+                    # Repeated stages (e.g. per-channel fits) accumulate.
+                    record = {k: previous.get(k, 0) + v for k, v in record.items()}
+                current['stages'][self.name] = record
+        return False
+
+
+def stage(name: str, megapixels: float | None = None):
+    """Return a context manager timing the pipeline stage ``name``.
+
+    ``megapixels`` may also be set on the returned object inside the block,
+    e.g. once the image has been decoded.
+    """
+    if not config.METRICS_ENABLED:
+        return _NOOP
+    return _Stage(name, megapixels)
+
+
+def count_evaluations(model: str, nfev: int):
+    """Record ``nfev`` model evaluations made by a ``curve_fit`` call."""
+    if not config.METRICS_ENABLED:
+        return
+    inc('underwater_curve_fit_evaluations_total', nfev, model=model)
+    current = _current.get()
+    if current is not None:
+        with current['lock']:
+            evaluations = current['curve_fit_evaluations']
+            evaluations[model] = evaluations.get(model, 0) + nfev
+
+
+def bind(fn):
+    """Wrap ``fn`` to record into the current trace from a worker thread."""
+    current = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+@contextmanager
+def trace():
+    """Collect a per-request breakdown of the stages run inside the block.
+
+    Yields a dict that is filled in as stages finish; use :func:`breakdown`
+    for a JSON-ready copy. Work handed to other threads joins the trace when
+    wrapped with :func:`bind`.
+    """
+    current = {'lock': threading.Lock(), 'stages': {}, 'curve_fit_evaluations': {}}
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+def breakdown(current):
+    """Return the stages and ``curve_fit`` counts recorded in a trace."""
+    with current['lock']:
+        return {
+            'stages': {name: dict(record) for name, record in current['stages'].items()},
+            'curve_fit_evaluations': dict(current['curve_fit_evaluations']),
+        }
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+def render() -> str:
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    seen = set()
+    for (name, labels), hist in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        for bound, count in zip(BUCKETS, hist['buckets']):
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {hist["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {hist["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {hist["count"]}')
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    # ru_maxrss is in kilobytes on Linux.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    lines.append('# TYPE process_max_resident_memory_bytes gauge')
+    lines.append(f'process_max_resident_memory_bytes {max_rss}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Forget all recorded metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+if config.METRICS_TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
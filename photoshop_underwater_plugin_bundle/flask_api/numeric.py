@@ -0,0 +1,33 @@
+"""Optional accelerated backend for the correction's elementwise kernels.
+
+When ``numexpr`` is installed the Sea-Thru kernels evaluate each fused
+expression in a single multi-threaded, cache-blocked pass instead of one
+NumPy call (and one temporary) per operator. ``config.ELEMENTWISE_BACKEND``
+selects ``'numexpr'``, ``'numpy'`` or ``'auto'``: numexpr if it is installed
+and there is more than one core, since on a single core its blocked
+evaluation is slower than NumPy's in-place operations.
+"""
+
+import os
+
+import config
+
+_ne = None
+_checked = False
+
+
+def get_numexpr():
+    """Return the ``numexpr`` module if it should be used, else ``None``."""
+    global _ne, _checked
+    backend = config.ELEMENTWISE_BACKEND
+    if backend == 'numpy' or (backend == 'auto' and (os.cpu_count() or 1) < 2):
+        return None
+    if not _checked:
+        try:
+            import numexpr
+        except ImportError:
+            numexpr = None
+        _ne, _checked = numexpr, True
+    if _ne is None and backend == 'numexpr':
+        raise ImportError("ELEMENTWISE_BACKEND is 'numexpr' but numexpr is not installed")
+    return _ne
@@ -1,15 +1,70 @@
-import requests
+import heapq
+import itertools
 import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict
 import config
+from http_client import get_session
 
-TOKEN_CACHE = None
+# Used when the token endpoint does not report ``expires_in``.
+DEFAULT_TOKEN_LIFETIME = 3600
 
 
-def get_access_token() -> str:
-    global TOKEN_CACHE
-    if TOKEN_CACHE:
-        return TOKEN_CACHE
+class TokenManager:
+    """Thread-safe cache of the Adobe access token.
+
+    The token is refreshed ``refresh_margin`` seconds before it expires.
+    Refreshes are single-flight: one caller fetches a new token while the
+    others wait for it, or keep using the current token if it is still
+    valid. ``fetch`` returns ``(token, expires_in_seconds)``.
+    """
+
+    def __init__(self, fetch=None, refresh_margin: float | None = None, clock=time.monotonic):
+        self._fetch = fetch or _fetch_access_token
+        self.refresh_margin = config.TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self._clock = clock
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _valid(self, margin: float) -> bool:
+        return self._token is not None and self._clock() < self._expires_at - margin
+
+    def get(self) -> str:
+        """Return a valid access token, refreshing it if needed."""
+        if self._valid(self.refresh_margin):
+            return self._token
+        # Inside the refresh margin the current token still works, so callers
+        # that find a refresh in progress carry on with it instead of waiting.
+        if not self._lock.acquire(blocking=not self._valid(0)):
+            token = self._token
+            if token is not None:
+                return token
+            self._lock.acquire()
+        try:
+            if not self._valid(self.refresh_margin):
+                token, expires_in = self._fetch()
+                self._token = token
+                self._expires_at = self._clock() + float(expires_in)
+            return self._token
+        finally:
+            self._lock.release()
+
+    def invalidate(self, token: str | None = None):
+        """Drop the cached token, unless it has already been replaced.
+
+        Passing the rejected ``token`` lets concurrent callers that all saw a
+        401 for it trigger only one refresh between them.
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+
+
+def _fetch_access_token():
     data = {
         'grant_type': 'refresh_token',
         'client_id': config.CLIENT_ID,
@@ -19,22 +74,23 @@ def get_access_token() -> str:
     headers = {
         'Content-Type': 'application/x-www-form-urlencoded'
     }
-    resp = requests.post(config.TOKEN_URL, data=data, headers=headers)
+    resp = get_session().post(config.TOKEN_URL, data=data, headers=headers,
+                              timeout=config.HTTP_TIMEOUT)
     resp.raise_for_status()
-    TOKEN_CACHE = resp.json()['access_token']
-    return TOKEN_CACHE
+    body = resp.json()
+    return body['access_token'], body.get('expires_in', DEFAULT_TOKEN_LIFETIME)
 
 
-def submit_photoshop_job(local_path: str, output_url: str, adjustments: Dict):
-    token = get_access_token()
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'x-api-key': config.API_KEY,
-        'Content-Type': 'application/json'
-    }
+TOKENS = TokenManager()
+
 
+def get_access_token() -> str:
+    return TOKENS.get()
+
+
+def _job_payload(local_path: str, output_url: str, adjustments: Dict):
     # Example payload with basic adjustments
-    payload = {
+    return {
         'inputs': [
             {
                 'href': f'file://{local_path}',
@@ -53,10 +109,197 @@ def submit_photoshop_job(local_path: str, output_url: str, adjustments: Dict):
         ]
     }
 
-    response = requests.post(
-        'https://image.adobe.io/photoshop/actions',
-        headers=headers,
-        data=json.dumps(payload)
+
+def submit_photoshop_job(local_path: str, output_url: str, adjustments: Dict, *, wait: bool = False):
+    """Submit a Photoshop actions job.
+
+    Returns the API's initial response, or with ``wait`` blocks until the
+    job has finished and returns its final status (see
+    :class:`PhotoshopJobTracker`).
+    """
+    if wait:
+        return get_job_tracker().submit(local_path, output_url, adjustments).result()
+    response = _request_authorized(
+        'POST', config.PHOTOSHOP_ACTIONS_URL, json.dumps(_job_payload(local_path, output_url, adjustments))
     )
     response.raise_for_status()
     return response.json()
+
+
+def _request_authorized(method: str, url: str, body: str | None = None):
+    """Send a request with the current token, refreshing and retrying once on 401."""
+    for attempt in range(2):
+        token = TOKENS.get()
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'x-api-key': config.API_KEY,
+            'Content-Type': 'application/json'
+        }
+        response = get_session().request(method, url, headers=headers, data=body,
+                                         timeout=config.HTTP_TIMEOUT)
+        if response.status_code != 401 or attempt:
+            return response
+        TOKENS.invalidate(token)
+
+
+def status_link(response: Dict | None):
+    """Return the status URL of a submitted job, or ``None`` if it has none."""
+    return (response or {}).get('_links', {}).get('self', {}).get('href')
+
+
+def track_photoshop_job(response: Dict | None) -> Future:
+    """Return a future for the final status of a job submitted without waiting.
+
+    ``response`` is what :func:`submit_photoshop_job` returned. A response
+    without a status link resolves to itself straight away.
+    """
+    if status_link(response) is None:
+        future = Future()
+        future.set_result(response)
+        return future
+    return get_job_tracker().track(status_link(response))
+
+
+class PhotoshopJobError(RuntimeError):
+    """Raised through a job's future when Photoshop reports it failed."""
+
+
+def job_state(status: Dict) -> str:
+    """Reduce a Photoshop status response to ``'succeeded'``, ``'failed'`` or ``'pending'``."""
+    states = [output.get('status') for output in status.get('outputs', [])]
+    if not states and 'status' in status:
+        states = [status['status']]
+    if any(state == 'failed' for state in states):
+        return 'failed'
+    if states and all(state == 'succeeded' for state in states):
+        return 'succeeded'
+    return 'pending'
+
+
+class PhotoshopJobTracker:
+    """Submit Photoshop jobs concurrently and poll them to completion.
+
+    :meth:`submit` returns a ``concurrent.futures.Future`` that resolves to
+    the job's final status response. At most ``max_concurrency`` requests
+    (submissions and status polls together) are in flight at once. A single
+    scheduler thread polls each job's status link, starting at
+    ``poll_interval`` seconds and backing off by half each time up to
+    ``max_poll_interval``, or as asked by a ``Retry-After`` header. Jobs not
+    finished within ``timeout`` seconds fail with ``TimeoutError``.
+    """
+
+    def __init__(self, max_concurrency: int | None = None, poll_interval: float | None = None,
+                 max_poll_interval: float | None = None, timeout: float | None = None):
+        self.max_concurrency = max_concurrency or config.PHOTOSHOP_CONCURRENCY
+        self.poll_interval = config.PHOTOSHOP_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.max_poll_interval = (config.PHOTOSHOP_POLL_MAX if max_poll_interval is None
+                                  else max_poll_interval)
+        self.timeout = config.PHOTOSHOP_JOB_TIMEOUT if timeout is None else timeout
+        self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='photoshop')
+        self._schedule = []
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition()
+        self._closed = False
+        self._scheduler = threading.Thread(target=self._run_scheduler, daemon=True,
+                                           name='photoshop-poller')
+        self._scheduler.start()
+
+    def submit(self, local_path: str, output_url: str, adjustments: Dict) -> Future:
+        """Submit one job and return a future for its final status."""
+        job = self._job(payload=json.dumps(_job_payload(local_path, output_url, adjustments)))
+        self._executor.submit(self._guarded, self._start, job)
+        return job['future']
+
+    def track(self, status_url: str) -> Future:
+        """Poll a job that was already submitted; return a future for its final status."""
+        job = self._job(status_url=status_url)
+        self._reschedule(job, job['interval'])
+        return job['future']
+
+    def _job(self, **fields):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        return {'future': future, 'deadline': time.monotonic() + self.timeout,
+                'interval': self.poll_interval, **fields}
+
+    def submit_many(self, jobs) -> list:
+        """Submit ``(local_path, output_url, adjustments)`` tuples; return their futures."""
+        return [self.submit(*job) for job in jobs]
+
+    def _guarded(self, step, job):
+        try:
+            step(job)
+        except BaseException as exc:
+            if not job['future'].done():
+                job['future'].set_exception(exc)
+
+    def _start(self, job):
+        response = _request_authorized('POST', config.PHOTOSHOP_ACTIONS_URL, job['payload'])
+        response.raise_for_status()
+        body = response.json()
+        job['status_url'] = status_link(body)
+        if job['status_url'] is None:
+            # Nothing to poll; the submission response is all there is.
+            job['future'].set_result(body)
+            return
+        self._reschedule(job, job['interval'])
+
+    def _poll(self, job):
+        response = _request_authorized('GET', job['status_url'])
+        response.raise_for_status()
+        status = response.json()
+        state = job_state(status)
+        if state == 'succeeded':
+            job['future'].set_result(status)
+        elif state == 'failed':
+            job['future'].set_exception(PhotoshopJobError(json.dumps(status)))
+        elif time.monotonic() >= job['deadline']:
+            job['future'].set_exception(TimeoutError(f"Photoshop job {job['status_url']} timed out"))
+        else:
+            job['interval'] = min(job['interval'] * 1.5, self.max_poll_interval)
+            retry_after = response.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else job['interval']
+            self._reschedule(job, delay)
+
+    def _reschedule(self, job, delay):
+        with self._wakeup:
+            heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._counter), job))
+            self._wakeup.notify()
+
+    def _run_scheduler(self):
+        while True:
+            with self._wakeup:
+                while not self._closed and (
+                    not self._schedule or self._schedule[0][0] > time.monotonic()
+                ):
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule else None
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._schedule)
+            self._executor.submit(self._guarded, self._poll, job)
+
+    def shutdown(self, wait: bool = True):
+        """Stop polling; jobs still pending fail with ``RuntimeError``."""
+        with self._wakeup:
+            self._closed = True
+            pending = [job for _, _, job in self._schedule]
+            self._schedule.clear()
+            self._wakeup.notify()
+        for job in pending:
+            if not job['future'].done():
+                job['future'].set_exception(RuntimeError('Photoshop job tracker shut down'))
+        self._executor.shutdown(wait=wait)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_job_tracker() -> PhotoshopJobTracker:
+    """Return the process-wide job tracker, creating it on first use."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = PhotoshopJobTracker()
+        return _tracker
@@ -0,0 +1,170 @@
+"""Content-addressed on-disk cache for depth maps and corrected images.
+
+Entries are keyed by a SHA-256 of the input pixels plus the model and
+correction parameters, so re-submitting the same photo (as the UXP panel
+does while users tweak settings) skips MiDaS and the Sea-Thru fit. Arrays
+are stored as uncompressed ``.npy`` files and loaded memory-mapped, which
+makes a hit cost milliseconds. The directory is capped at a total size and
+the least recently used entries are evicted first.
+
+The cache is disabled unless ``config.RESULT_CACHE_DIR`` is set.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import weakref
+
+import config
+
+_np = None
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def _lazy_imports():
+    global _np
+    if _np is None:
+        import numpy as np
+        _np = np
+
+
+def content_hash(arr) -> str:
+    """Return the SHA-256 of an array's shape, dtype and pixels.
+
+    Hashes are memoised per array object for the array's lifetime, so the
+    pipeline stages that each consult the cache hash an image only once.
+    Arrays are therefore assumed not to be modified in place once hashed.
+    """
+    _lazy_imports()
+    key = id(arr)
+    with _hashes_lock:
+        cached = _hashes.get(key)
+    if cached is not None and cached[0]() is arr:
+        return cached[1]
+
+    digest = hashlib.sha256(f"{arr.shape}|{arr.dtype.str}|".encode())
+    if arr.flags.c_contiguous:
+        digest.update(memoryview(arr).cast('B'))
+    else:
+        # Views such as memory-mapped images are hashed a band of rows at a
+        # time rather than copied whole; the digest is the same either way.
+        rows = max(1, (64 << 20) // max(1, arr[:1].nbytes))
+        for start in range(0, arr.shape[0], rows):
+            digest.update(memoryview(_np.ascontiguousarray(arr[start:start + rows])).cast('B'))
+    value = digest.hexdigest()
+    try:
+        ref = weakref.ref(arr, lambda _, key=key: _forget(key))
+    except TypeError:
+        return value
+    with _hashes_lock:
+        _hashes[key] = (ref, value)
+    return value
+
+
+def _forget(key):
+    with _hashes_lock:
+        _hashes.pop(key, None)
+
+
+def make_key(kind: str, *hashes: str, **params) -> str:
+    """Combine content hashes and parameters into a cache key."""
+    payload = json.dumps([kind, hashes, params], sort_keys=True, default=str)
+    return f"{kind}-{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+class ResultCache:
+    """Size-capped directory of ``.npy`` arrays with LRU eviction.
+
+    Recency is tracked with file modification times, so several processes
+    can share one directory; writes go through a temporary file and an
+    atomic rename.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + '.npy')
+
+    def get(self, key: str):
+        """Return the cached array for ``key`` (read-only, memory-mapped) or ``None``."""
+        _lazy_imports()
+        path = self._path(key)
+        try:
+            arr = _np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return arr
+
+    def put(self, key: str, arr):
+        """Store ``arr`` under ``key`` and evict old entries beyond ``max_bytes``."""
+        _lazy_imports()
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                _np.save(f, _np.ascontiguousarray(arr))
+            size = os.path.getsize(tmp)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.npy'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide cache, or ``None`` when caching is disabled."""
+    global _cache
+    if not config.RESULT_CACHE_DIR:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.root != config.RESULT_CACHE_DIR:
+            _cache = ResultCache(config.RESULT_CACHE_DIR, config.RESULT_CACHE_MAX_BYTES)
+        return _cache
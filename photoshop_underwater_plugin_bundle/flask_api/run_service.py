@@ -1,22 +1,280 @@
-from flask import Flask, request, jsonify
-from main import process_image
+import functools
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+
+from flask import Flask, Response, request, jsonify
+
+import config
+import metrics
+from depth_estimation import get_transform, load_model, warm_up
+from job_queue import JobQueue, QueueFullError
+from main import preview_image, process_image, process_video
+from photoshop_api import track_photoshop_job
 
 app = Flask(__name__)
 
-@app.route('/process', methods=['POST'])
-def process():
+_job_queue = None
+
+# Imported by the fork server before it forks job workers (see preload()).
+PRELOAD_MODULES = ('main', 'advanced_sea_thru', 'depth_estimation', 'torch')
+
+
+def get_job_queue():
+    """Return the service's job queue, creating it on first use."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            workers=config.JOB_WORKERS,
+            max_queued=config.JOB_QUEUE_SIZE,
+            executor=config.JOB_EXECUTOR,
+            initializer=warm_up,
+            start_method=config.JOB_START_METHOD,
+            preload=PRELOAD_MODULES,
+        )
+    return _job_queue
+
+
+def preload():
+    """Warm this process up and start the job workers from it.
+
+    Imports the modules the service otherwise defers (the advanced Sea-Thru
+    model's SciPy dependencies) and loads the depth model's weights, then
+    starts every job worker, so workers forked from this process inherit
+    them instead of loading their own. No inference runs before the fork:
+    forking after torch has started its thread pool can deadlock the
+    children. With ``JOB_START_METHOD=forkserver`` the workers come from a
+    fork server that has imported :data:`PRELOAD_MODULES` instead.
+    """
+    import advanced_sea_thru  # noqa: F401
+
+    load_model()
+    get_transform()
+    get_job_queue().start_workers()
+
+
+def _json_result(result):
+    """Drop the full-resolution depth map, which is not JSON serialisable."""
+    depth = {k: v for k, v in result['adjustments'].get('depth', {}).items() if k != 'depth_map'}
+    return {**result, 'adjustments': {**result['adjustments'], 'depth': depth}}
+
+
+def run_job(kwargs):
+    """Worker entry point for queued jobs; must stay picklable for process pools.
+
+    Only the encoded upload is pickled to a process worker, which decodes,
+    corrects and encodes the image itself, so unlike the batch pipeline's
+    :class:`worker_pool.ModelWorkerPool` no pixels cross the process boundary.
+
+    Returns once the Photoshop job is submitted; :func:`finish_job` follows
+    it from the service process so the worker is free for the next image.
+    """
+    return _json_result(process_image(**kwargs, track_photoshop=False))
+
+
+def finish_job(result):
+    """Return a future for a submitted job's final result (see :func:`run_job`)."""
+    scratch = result.pop('scratch_dir')
+    tracked = track_photoshop_job(result.pop('photoshop'))
+    tracked.add_done_callback(lambda _: shutil.rmtree(scratch, ignore_errors=True))
+    final = Future()
+
+    def completed(done):
+        error = done.exception()
+        if error is None:
+            final.set_result({**result, 'status': 'completed', 'photoshop': done.result()})
+        else:
+            final.set_exception(error)
+
+    tracked.add_done_callback(completed)
+    return final
+
+
+def run_video_job(kwargs):
+    """Worker entry point for queued videos; removes the upload afterwards."""
+    upload_dir = kwargs.pop('upload_dir', None)
+    try:
+        return process_video(**kwargs)
+    finally:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+def _timed(endpoint):
+    """Count requests to ``endpoint`` by status and record their latency."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not config.METRICS_ENABLED:
+                return view(*args, **kwargs)
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = view(*args, **kwargs)
+                if isinstance(response, tuple):
+                    status = response[1]
+                else:
+                    status = getattr(response, 'status_code', 200)
+                return response
+            finally:
+                metrics.observe('underwater_request_seconds', time.perf_counter() - started,
+                                endpoint=endpoint)
+                metrics.inc('underwater_requests_total', endpoint=endpoint, status=status)
+        return wrapper
+    return decorator
+
+
+def _flag(options, name):
+    return str(options.get(name, '')).lower() in ('1', 'true', 'yes')
+
+
+def _parse_request(detach_upload: bool = False):
+    """Return ``process_image`` keyword arguments for the current request.
+
+    Returns ``None`` when a multipart request has no image. With
+    ``detach_upload`` the upload is read into bytes so it outlives the
+    request without being written to disk.
+    """
     if request.content_type and request.content_type.startswith('multipart/form-data'):
         image_file = request.files.get('image')
-        output_url = request.form.get('output_url')
         if not image_file:
-            return jsonify({'error': 'No image uploaded'}), 400
-        result = process_image(output_url=output_url, image_file=image_file)
+            return None
+        options = request.form
+        kwargs = {'output_url': options.get('output_url')}
+        if detach_upload:
+            kwargs['image_bytes'] = image_file.read()
+        else:
+            kwargs['image_file'] = image_file
     else:
-        data = request.json or {}
-        image_url = data.get('image_url')
-        output_url = data.get('output_url')
-        result = process_image(image_url=image_url, output_url=output_url)
-    return jsonify(result)
+        options = request.json or {}
+        kwargs = {'image_url': options.get('image_url'), 'output_url': options.get('output_url')}
+    kwargs.update(
+        depth_model=options.get('depth_model'),
+        session_id=options.get('session_id'),
+        reuse_coefs=_flag(options, 'reuse_coefs'),
+        wait_for_photoshop=_flag(options, 'wait_for_photoshop'),
+        preview_id=options.get('preview_id'),
+        include_timings=_flag(options, 'timings'),
+    )
+    return kwargs
+
+
+@app.route('/process', methods=['POST'])
+@_timed('process')
+def process():
+    kwargs = _parse_request()
+    if kwargs is None:
+        return jsonify({'error': 'No image uploaded'}), 400
+    try:
+        result = process_image(**kwargs)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify(_json_result(result))
+
+
+@app.route('/preview', methods=['POST'])
+@_timed('preview')
+def preview():
+    # The X-Preview-Id header can be passed back as ``preview_id`` to
+    # /process or /jobs so the full render reuses the preview's fit.
+    kwargs = _parse_request()
+    if kwargs is None:
+        return jsonify({'error': 'No image uploaded'}), 400
+    try:
+        result = preview_image(
+            image_url=kwargs.get('image_url'), image_file=kwargs.get('image_file'),
+            depth_model=kwargs['depth_model'], preview_id=kwargs['preview_id'],
+        )
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return Response(result['image'], mimetype='image/jpeg',
+                    headers={'X-Preview-Id': result['preview_id']})
+
+
+@app.route('/jobs', methods=['POST'])
+@_timed('jobs')
+def submit_job():
+    kwargs = _parse_request(detach_upload=True)
+    if kwargs is None:
+        return jsonify({'error': 'No image uploaded'}), 400
+    if not kwargs.get('output_url'):
+        return jsonify({'error': 'output_url must be provided'}), 400
+    # Queued jobs report the finished Photoshop result rather than just the
+    # submission, but the Photoshop job is followed outside the workers.
+    kwargs['wait_for_photoshop'] = False
+    try:
+        job_id = get_job_queue().submit(run_job, kwargs, then=finish_job)
+    except QueueFullError as exc:
+        return jsonify({'error': str(exc)}), 429
+    return jsonify({'id': job_id, 'status': 'queued'}), 202
+
+
+@app.route('/video', methods=['POST'])
+@_timed('video')
+def submit_video():
+    # Clips are too large to hold in memory or correct within a request, so
+    # uploads are spooled to disk and the correction is queued like /jobs.
+    multipart = bool(request.content_type and request.content_type.startswith('multipart/form-data'))
+    options = request.form if multipart else (request.json or {})
+    video_file = request.files.get('video') if multipart else None
+    if multipart and not video_file:
+        return jsonify({'error': 'No video uploaded'}), 400
+    if not multipart and not options.get('video_url'):
+        return jsonify({'error': 'video_url must be provided'}), 400
+    if not options.get('output_url'):
+        return jsonify({'error': 'output_url must be provided'}), 400
+
+    keyframe_interval = options.get('keyframe_interval') or None
+    if keyframe_interval is not None:
+        try:
+            keyframe_interval = int(keyframe_interval)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'keyframe_interval must be an integer'}), 400
+        if keyframe_interval < 1:
+            return jsonify({'error': 'keyframe_interval must be at least 1'}), 400
+
+    kwargs = {
+        'video_url': options.get('video_url'),
+        'output_url': options['output_url'],
+        'depth_model': options.get('depth_model'),
+        'keyframe_interval': keyframe_interval,
+    }
+    if video_file:
+        root = config.SCRATCH_DIR or None
+        if root:
+            os.makedirs(root, exist_ok=True)
+        kwargs['upload_dir'] = tempfile.mkdtemp(prefix='upload-', dir=root)
+        ext = os.path.splitext(video_file.filename or '')[1] or '.mp4'
+        kwargs['video_path'] = os.path.join(kwargs['upload_dir'], 'input' + ext)
+        video_file.save(kwargs['video_path'])
+    try:
+        job_id = get_job_queue().submit(run_video_job, kwargs)
+    except QueueFullError as exc:
+        if video_file:
+            shutil.rmtree(kwargs['upload_dir'], ignore_errors=True)
+        return jsonify({'error': str(exc)}), 429
+    return jsonify({'id': job_id, 'status': 'queued'}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    info = get_job_queue().status(job_id)
+    if info is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(info)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Stages run by a process-pool JOB_EXECUTOR are recorded in the worker
+    # processes and do not appear here.
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 
 if __name__ == '__main__':
+    if config.SERVICE_PRELOAD:
+        preload()
+    warm_up()
     app.run(port=5000)
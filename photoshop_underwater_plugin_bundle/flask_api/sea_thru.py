@@ -1,57 +1,254 @@
-"""Simplified Sea-Thru color correction algorithm."""
+"""Simplified Sea-Thru color correction algorithm.
+
+The advanced model lives in :mod:`advanced_sea_thru`, which needs SciPy's
+optimisers and filters; it is imported on first use so the basic mode and
+everything importing this module start without them.
+"""
 
 import os
 
-from advanced_sea_thru import apply_advanced_sea_thru
+import metrics
+from coef_cache import COEF_CACHE
+from depth_upsampling import FIT_MAX_SIDE, TILE_ROWS, depth_row_source, resize_to, working_shape
+from image_io import is_memory_mapped, pixel_max, read_image, write_image
+from numeric import get_numexpr
+from result_cache import content_hash, get_result_cache, make_key
 
-_cv2 = None
 _np = None
 
 
 def _lazy_imports():
-    global _cv2, _np
-    if _cv2 is None:
-        import cv2
-        _cv2 = cv2
+    global _np
     if _np is None:
         import numpy as np
         _np = np
 
 
-def estimate_beta(depth_map, img):
-    """Estimate per-channel beta from depth/intensity relationship."""
+# Pixels sampled for the beta regression; the slope of a least-squares line
+# converges long before every pixel of the fit image is used.
+BETA_SAMPLES = 65536
+
+
+def estimate_beta(depth_map, img, max_samples: int | None = BETA_SAMPLES, seed: int = 0):
+    """Estimate per-channel beta from depth/intensity relationship.
+
+    Beta is minus the slope of the least-squares line of ``log(intensity)``
+    against depth, solved in closed form on up to ``max_samples`` randomly
+    sampled pixels (``None`` uses all of them). For ``uint8`` images the
+    logarithm comes from a 256-entry lookup table.
+    """
     _lazy_imports()
-    depth = depth_map.flatten().astype(_np.float32)
-    colors = img.reshape(-1, 3).astype(_np.float32) + 1e-6
-    beta = []
-    for c in range(3):
-        y = _np.log(colors[:, c])
-        slope, _ = _np.polyfit(depth, y, 1)
-        beta.append(max(-slope, 0.0))
-    return _np.array(beta, dtype=_np.float32)
+    depth = depth_map.reshape(-1)
+    colors = img.reshape(-1, 3)
+    if max_samples and depth.size > max_samples:
+        idx = _np.random.default_rng(seed).integers(0, depth.size, max_samples)
+        depth, colors = depth[idx], colors[idx]
+    if colors.dtype == _np.uint8:
+        y = _log_lut()[colors]
+    else:
+        y = _np.log(colors.astype(_np.float32) + _np.float32(1e-6))
 
+    d = depth.astype(_np.float64)
+    d -= d.mean()
+    var = d @ d
+    if var == 0:
+        return _np.zeros(3, dtype=_np.float32)
+    slopes = d @ (y - y.mean(axis=0)) / var
+    return _np.maximum(-slopes, 0.0).astype(_np.float32)
 
-def apply_sea_thru(image_path: str, depth_map, *, advanced: bool = False) -> str:
-    """Return path to a color corrected image using a depth-aware model.
+
+_LOG_LUT = None
+
+
+def _log_lut():
+    global _LOG_LUT
+    if _LOG_LUT is None:
+        _LOG_LUT = _np.log(_np.arange(256, dtype=_np.float32) + _np.float32(1e-6))
+    return _LOG_LUT
+
+
+def _coef_key(session_id, advanced):
+    # Kept apart from the advanced model's coefficients for the same session.
+    if session_id is None or advanced:
+        return session_id
+    return ('basic', session_id)
+
+
+def fit_parameters(img, depth_map, *, advanced: bool = False, session_id: str | None = None):
+    """Fit the correction parameters for ``img`` without applying them.
+
+    Returns ``{'backscatter', 'beta'}`` coefficient arrays for the advanced
+    model or ``{'beta'}`` for the basic one, fitted on a copy downsampled to
+    ``FIT_MAX_SIDE``. Advanced fits warm-start from the parameters cached
+    for ``session_id``. Pass the result, possibly blended with earlier fits,
+    as ``params`` to :func:`apply_sea_thru_array` to correct later frames
+    with it.
+    """
+    _lazy_imports()
+    fit_shape = working_shape(img.shape, FIT_MAX_SIDE)
+    if advanced:
+        from advanced_sea_thru import fit_coefficients
+
+        b_coefs, beta_coefs = fit_coefficients(
+            resize_to(img, fit_shape).astype(_np.float32) / pixel_max(img.dtype),
+            resize_to(depth_map, fit_shape),
+            session_id=session_id,
+        )
+        return {'backscatter': b_coefs, 'beta': beta_coefs}
+    with metrics.stage('beta_fit'):
+        return {'beta': estimate_beta(resize_to(depth_map, fit_shape), resize_to(img, fit_shape))}
+
+
+def store_parameters(params: dict, session_id: str, *, advanced: bool = False):
+    """Cache ``params`` for ``session_id``, for calls made with ``reuse_coefs``."""
+    COEF_CACHE.store(params, _coef_key(session_id, advanced))
+
+
+def discard_parameters(session_id: str, *, advanced: bool = False):
+    """Drop the parameters cached for ``session_id``, e.g. once a video is done."""
+    COEF_CACHE.discard(_coef_key(session_id, advanced))
+
+
+def apply_sea_thru_array(img, depth_map, *, advanced: bool = False,
+                         session_id: str | None = None, reuse_coefs: bool = False,
+                         params: dict | None = None, out=None):
+    """Return a color corrected copy of the BGR array ``img``.
 
     When ``advanced`` is ``True``, this function runs a simplified
     version of the full Sea-Thru atmospheric model with spatially varying
     illuminant and dual-β backscatter recovery. The basic mode retains the
     original lightweight implementation.
+
+    ``session_id`` and ``reuse_coefs`` control how fitted parameters are
+    shared between frames of one dive, or between a preview and the full
+    render: with both set, the parameters cached for the session are used
+    instead of fitting again. ``params`` from :func:`fit_parameters` are
+    used as they are, without fitting or touching the cache.
+
+    ``depth_map`` may be smaller than ``img`` (see
+    ``config.DEPTH_WORKING_SIZE``). Beta is fitted on a copy downsampled to
+    ``FIT_MAX_SIDE`` and the correction is applied in ``TILE_ROWS`` strips,
+    upsampling depth with guidance from the image where needed, so peak
+    memory is bounded by the strip size rather than the image size.
+
+    ``img`` may be ``uint8`` or ``uint16``; the result has the same dtype.
+    It is written to ``out`` (e.g. a memory-mapped output image from
+    ``image_io.create_output_image``) when given.
+
+    Results are served from the content-addressed result cache when it is
+    enabled (see ``config.RESULT_CACHE_DIR``).
     """
+    # Reused coefficients, and advanced fits warm-started from a session's
+    # earlier fit, depend on earlier requests, not just on the inputs.
+    warm_start = advanced and session_id is not None and COEF_CACHE.lookup(session_id) is not None
+    cache = None if reuse_coefs or warm_start or params is not None else get_result_cache()
+    if cache is not None:
+        key = make_key('corrected', content_hash(img), content_hash(depth_map),
+                       advanced=advanced, fit_max_side=FIT_MAX_SIDE)
+        corrected = cache.get(key)
+        params = None
+        if corrected is not None and session_id is not None:
+            # A hit must leave the session's parameters behind just like a
+            # fit would, e.g. for the full render of a cached preview.
+            params = _load_parameters(cache, key, advanced)
+        if corrected is not None and (session_id is None or params is not None):
+            if params is not None:
+                store_parameters(params, session_id, advanced=advanced)
+            if out is None:
+                return corrected
+            out[...] = corrected
+            return out
+
+    corrected = _correct(img, depth_map, advanced, session_id, reuse_coefs, params, out)
+    if cache is not None:
+        # A memory-mapped result is not read back into memory to be cached.
+        if not is_memory_mapped(corrected):
+            cache.put(key, corrected)
+        if session_id is not None:
+            _save_parameters(cache, key, COEF_CACHE.lookup(_coef_key(session_id, advanced)))
+    return corrected
+
+
+def _parameter_key(key, name):
+    return make_key('parameters', key, name=name)
+
+
+def _save_parameters(cache, key, params):
+    for name, value in (params or {}).items():
+        cache.put(_parameter_key(key, name), value)
+
+
+def _load_parameters(cache, key, advanced):
+    _lazy_imports()
+    names = ('backscatter', 'beta') if advanced else ('beta',)
+    params = {name: cache.get(_parameter_key(key, name)) for name in names}
+    if any(value is None for value in params.values()):
+        return None
+    return {name: _np.array(value) for name, value in params.items()}
+
+
+def _correct(img, depth_map, advanced, session_id, reuse_coefs, params, out):
     if advanced:
-        return apply_advanced_sea_thru(image_path, depth_map)
+        from advanced_sea_thru import apply_advanced_sea_thru_array
+
+        return apply_advanced_sea_thru_array(
+            img, depth_map, session_id=session_id, reuse_coefs=reuse_coefs,
+            params=params, out=out
+        )
 
     _lazy_imports()
-    img = _cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"Could not read {image_path}")
-
-    beta = estimate_beta(depth_map, img)
-    scale_map = _np.exp(depth_map[..., None] * beta[None, None, :])
-    corrected = img.astype(_np.float32) * scale_map
-    corrected = _np.clip(corrected, 0, 255).astype(_np.uint8)
-
-    out_path = os.path.splitext(image_path)[0] + "_seathru.jpg"
-    _cv2.imwrite(out_path, corrected)
-    return out_path
+    key = _coef_key(session_id, advanced)
+    cached = COEF_CACHE.lookup(key) if key is not None and reuse_coefs else None
+    if params is not None:
+        beta = params['beta']
+    elif cached is not None:
+        beta = cached['beta']
+    else:
+        beta = fit_parameters(img, depth_map)['beta']
+        if key is not None:
+            store_parameters({'beta': beta}, session_id)
+    depth_rows = depth_row_source(depth_map, img)
+    if out is None:
+        out = _np.empty_like(img)
+    peak = pixel_max(img.dtype)
+    # One float32 plane reused for every channel of every strip.
+    buf = _np.empty((min(TILE_ROWS, img.shape[0]), img.shape[1]), dtype=_np.float32)
+    ne = get_numexpr()
+    with metrics.stage('correct_strips'):
+        for start in range(0, img.shape[0], TILE_ROWS):
+            stop = min(start + TILE_ROWS, img.shape[0])
+            depth = depth_rows(start, stop)
+            plane = buf[:stop - start]
+            for c in range(3):
+                b = _np.float32(beta[c])
+                plane[...] = img[start:stop, :, c]
+                if ne is not None:
+                    ne.evaluate('plane * exp(depth * b)', out=plane, casting='same_kind')
+                else:
+                    scale = _np.multiply(depth, b, dtype=_np.float32)
+                    _np.exp(scale, out=scale)
+                    plane *= scale
+                _np.clip(plane, 0, peak, out=plane)
+                out[start:stop, :, c] = plane
+    return out
+
+
+def apply_sea_thru(image_path: str, depth_map, *, advanced: bool = False,
+                   session_id: str | None = None, reuse_coefs: bool = False,
+                   output_path: str | None = None) -> str:
+    """Return path to a color corrected image using a depth-aware model.
+
+    Thin file-based wrapper around :func:`apply_sea_thru_array`. 16-bit
+    inputs stay 16-bit when ``output_path`` is a PNG or TIFF.
+    """
+    if advanced:
+        from advanced_sea_thru import apply_advanced_sea_thru
+
+        return apply_advanced_sea_thru(
+            image_path, depth_map, output_path, session_id=session_id, reuse_coefs=reuse_coefs
+        )
+
+    corrected = apply_sea_thru_array(read_image(image_path, keep_depth=True), depth_map,
+                                     session_id=session_id, reuse_coefs=reuse_coefs)
+    out_path = output_path or os.path.splitext(image_path)[0] + "_seathru.jpg"
+    return write_image(out_path, corrected)
@@ -0,0 +1,177 @@
+"""Process pool for correction jobs with one model load per worker.
+
+Each worker process loads the MiDaS model once, in the pool initializer, and
+then serves any number of correction jobs. Image pixels travel through
+``multiprocessing.shared_memory`` blocks rather than being pickled: the
+parent copies the decoded image into a block, the worker reads it in place
+and writes the corrected image into a second block owned by the parent.
+This gives true multi-core throughput for NumPy/SciPy-heavy correction,
+which otherwise holds the GIL for long stretches.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from depth_estimation import estimate_depth_array, warm_up
+from image_analysis import analyze_image_array
+from sea_thru import apply_sea_thru_array
+
+_np = None
+
+
+def _lazy_imports():
+    global _np
+    if _np is None:
+        import numpy as np
+        _np = np
+
+
+def _share(arr):
+    """Copy ``arr`` into a new shared memory block and return ``(shm, spec)``."""
+    _lazy_imports()
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    view = _np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _attach(spec):
+    """Map the shared block described by ``spec`` as an array."""
+    _lazy_imports()
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, _np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(model_type, warm):
+    if warm:
+        warm_up(model_type)
+
+
+def _correct_shared(in_spec, out_spec, depth_spec, options):
+    """Worker side: depth, correction and analysis on shared pixels.
+
+    When ``depth_spec`` is given the depth map was computed by the parent
+    (e.g. in a batched forward pass) and is read from shared memory instead.
+    """
+    blocks = []
+    try:
+        in_shm, img = _attach(in_spec)
+        blocks.append(in_shm)
+        out_shm, out = _attach(out_spec)
+        blocks.append(out_shm)
+        started = time.perf_counter()
+        if depth_spec is None:
+            depth = estimate_depth_array(
+                img, model_type=options.get('depth_model'),
+                working_size=options.get('depth_working_size'),
+            )
+            depth_map, average_depth = depth['depth_map'], depth['average_depth']
+        else:
+            depth_shm, depth_map = _attach(depth_spec)
+            blocks.append(depth_shm)
+            average_depth = float(depth_map.mean())
+        depth_done = time.perf_counter()
+        apply_sea_thru_array(
+            img, depth_map, advanced=options.get('advanced', False),
+            session_id=options.get('session_id'),
+            reuse_coefs=options.get('reuse_coefs', False), out=out,
+        )
+        correct_done = time.perf_counter()
+        analysis = analyze_image_array(out)
+        timings = {
+            'depth': depth_done - started,
+            'correct': correct_done - depth_done,
+            'analysis': time.perf_counter() - correct_done,
+        }
+    finally:
+        img = out = depth_map = None
+        for shm in blocks:
+            shm.close()
+    return {'depth': {'average_depth': average_depth}, 'analysis': analysis, 'timings': timings}
+
+
+class ModelWorkerPool:
+    """Pool of worker processes that each keep a warm depth model.
+
+    ``warm=False`` skips the start-up model load (the model is then loaded
+    by the first job in each worker).
+    """
+
+    def __init__(self, workers: int = 2, model_type: str | None = None,
+                 warm: bool = True, mp_context: str | None = None):
+        context = multiprocessing.get_context(mp_context)
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=context,
+            initializer=_init_worker, initargs=(model_type, warm),
+        )
+
+    def correct(self, img, depth_map=None, **options):
+        """Correct the BGR array ``img`` in a worker.
+
+        ``options`` are ``advanced``, ``depth_model``, ``depth_working_size``,
+        ``session_id`` and ``reuse_coefs``. Returns ``(corrected, adjustments)``
+        once the worker is done; ``adjustments['timings']`` holds the
+        worker's per-stage seconds.
+        """
+        return self.submit(img, depth_map, **options).result()
+
+    def submit(self, img, depth_map=None, **options) -> Future:
+        """Like :meth:`correct` but return a future immediately.
+
+        A precomputed ``depth_map`` is shared with the worker, which then
+        skips depth estimation. The shared blocks are released as soon as the
+        worker finishes, whether or not the caller ever collects the result.
+        """
+        _lazy_imports()
+        blocks = []
+        try:
+            in_shm, in_spec = _share(img)
+            blocks.append(in_shm)
+            out_shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+            blocks.append(out_shm)
+            shape, dtype = img.shape, img.dtype
+            out_spec = (out_shm.name, shape, dtype.str)
+            depth_spec = None
+            if depth_map is not None:
+                depth_shm, depth_spec = _share(depth_map)
+                blocks.append(depth_shm)
+            future = self._executor.submit(_correct_shared, in_spec, out_spec, depth_spec, options)
+        except BaseException:
+            _release(*blocks)
+            raise
+
+        outer = Future()
+
+        def collect(done):
+            try:
+                adjustments = done.result()
+                view = _np.ndarray(shape, dtype=dtype, buffer=out_shm.buf)
+                corrected = view.copy()
+                del view
+            except BaseException as exc:
+                outer.set_exception(exc)
+            else:
+                outer.set_result((corrected, adjustments))
+            finally:
+                _release(*blocks)
+
+        future.add_done_callback(collect)
+        return outer
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def _release(*blocks):
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
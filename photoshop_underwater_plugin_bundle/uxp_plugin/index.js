@@ -1,19 +1,29 @@
 const form = document.getElementById('correctionForm');
 const resultDiv = document.getElementById('result');
 const fileInput = document.getElementById('imageFile');
+const imageUrlInput = document.getElementById('imageUrl');
+const previewButton = document.getElementById('previewButton');
 const beforeImage = document.getElementById('beforeImage');
 const afterImage = document.getElementById('afterImage');
 const preview = document.getElementById('preview');
 
+const API = 'http://localhost:5000';
+// How often a queued job's status is checked.
+const POLL_INTERVAL_MS = 2000;
+
 let selectedFile = null;
+// Set by /preview; lets the full render reuse the preview's fitted parameters.
+let previewId = null;
 
 function handleFile(file) {
   if (!file) return;
   selectedFile = file;
+  previewId = null;
   beforeImage.src = URL.createObjectURL(file);
 }
 
 fileInput.addEventListener('change', () => handleFile(fileInput.files[0]));
+imageUrlInput.addEventListener('change', () => { previewId = null; });
 
 preview.addEventListener('dragover', e => e.preventDefault());
 preview.addEventListener('drop', e => {
@@ -23,30 +33,74 @@ preview.addEventListener('drop', e => {
   }
 });
 
+function post(path, fields) {
+  if (selectedFile) {
+    const formData = new FormData();
+    formData.append('image', selectedFile);
+    for (const [key, value] of Object.entries(fields)) {
+      if (value !== null) formData.append(key, value);
+    }
+    return fetch(API + path, { method: 'POST', body: formData });
+  }
+  return fetch(API + path, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ image_url: imageUrlInput.value, ...fields })
+  });
+}
+
+previewButton.addEventListener('click', async () => {
+  resultDiv.textContent = 'Rendering preview...';
+  try {
+    const response = await post('/preview', { preview_id: previewId });
+    if (!response.ok) {
+      throw new Error((await response.json()).error || response.statusText);
+    }
+    previewId = response.headers.get('X-Preview-Id');
+    afterImage.src = URL.createObjectURL(await response.blob());
+    resultDiv.textContent = 'Preview ready. Process Image renders the full resolution.';
+  } catch (err) {
+    resultDiv.textContent = 'Error: ' + err;
+  }
+});
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+// Poll /jobs/<id> until the job, including its Photoshop job, has finished.
+async function waitForJob(jobId) {
+  for (;;) {
+    const response = await fetch(`${API}/jobs/${jobId}`);
+    const info = await response.json();
+    if (!response.ok) {
+      throw new Error(info.error || response.statusText);
+    }
+    if (info.status === 'succeeded') return info.result;
+    if (info.status === 'failed') throw new Error(info.error);
+    resultDiv.textContent = info.status === 'queued' ? 'Queued...' : 'Processing...';
+    await sleep(POLL_INTERVAL_MS);
+  }
+}
+
 form.addEventListener('submit', async (e) => {
   e.preventDefault();
-  const imageUrl = document.getElementById('imageUrl').value;
   const outputUrl = document.getElementById('outputUrl').value;
 
+  resultDiv.textContent = 'Submitting...';
   try {
-    let response;
-    if (selectedFile) {
-      const formData = new FormData();
-      formData.append('image', selectedFile);
-      formData.append('output_url', outputUrl);
-      response = await fetch('http://localhost:5000/process', {
-        method: 'POST',
-        body: formData
-      });
-    } else {
-      response = await fetch('http://localhost:5000/process', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ image_url: imageUrl, output_url: outputUrl })
-      });
-    }
+    const response = await post('/jobs', {
+      output_url: outputUrl,
+      preview_id: previewId
+    });
     const data = await response.json();
-    resultDiv.textContent = `Submitted. Params: ${JSON.stringify(data.adjustments)}`;
+    if (!response.ok) {
+      throw new Error(data.error || response.statusText);
+    }
+    const result = await waitForJob(data.id);
+    // Jobs succeed only once the Photoshop job has, so the output now exists.
+    // The 256-bin histograms are too long to show.
+    const params = JSON.stringify(result.adjustments,
+      (key, value) => (key === 'histograms' ? undefined : value));
+    resultDiv.textContent = `Completed. Params: ${params}`;
     afterImage.src = outputUrl;
   } catch (err) {
     resultDiv.textContent = 'Error: ' + err;
@@ -0,0 +1,214 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+
+
+@pytest.fixture
+def adv(monkeypatch):
+    """Import the real module, bypassing the stub installed by test_main."""
+    monkeypatch.delitem(sys.modules, 'advanced_sea_thru', raising=False)
+    import advanced_sea_thru as module
+    return module
+
+
+def _reference_backscatter_points(depth, img, fraction=0.01, bins=10):
+    """Original per-bin loop, kept as the behavioural reference."""
+    edges = np.linspace(depth.min(), depth.max(), bins + 1)
+    pts = [[], [], []]
+    img_norm = img.mean(axis=2).flatten()
+    depth_flat = depth.flatten()
+    img_flat = img.reshape(-1, 3)
+    for i in range(bins):
+        mask = (depth_flat >= edges[i]) & (depth_flat <= edges[i + 1])
+        if not np.any(mask):
+            continue
+        idx = np.argsort(img_norm[mask])[:max(1, int(mask.sum() * fraction))]
+        d = depth_flat[mask][idx]
+        pixels = img_flat[mask][idx]
+        for c in range(3):
+            pts[c].extend(zip(d, pixels[:, c]))
+    return tuple(np.array(p) for p in pts)
+
+
+@pytest.mark.parametrize('shape', [(30, 40), (120, 90)])
+def test_backscatter_points_match_reference(adv, shape):
+    rng = np.random.default_rng(3)
+    depth = (rng.random(shape) * 5).astype(np.float32)
+    img = rng.random(shape + (3,)).astype(np.float32)
+    expected = _reference_backscatter_points(depth, img)
+    for got, want in zip(adv._sample_backscatter_points(depth, img), expected):
+        np.testing.assert_array_equal(got, want)
+
+
+@pytest.mark.parametrize('sampling', ['random', 'stride'])
+def test_backscatter_points_subsampling(adv, sampling):
+    rng = np.random.default_rng(4)
+    depth = (rng.random((200, 300)) * 5).astype(np.float32)
+    img = rng.random((200, 300, 3)).astype(np.float32)
+    points = adv._sample_backscatter_points(depth, img, max_samples=6000, sampling=sampling)
+    assert all(p.shape == points[0].shape for p in points)
+    assert 50 <= len(points[0]) <= 70
+    again = adv._sample_backscatter_points(depth, img, max_samples=6000, sampling=sampling)
+    np.testing.assert_array_equal(points[0], again[0])
+
+
+def test_backscatter_points_rejects_unknown_sampling(adv):
+    depth = np.ones((10, 10), dtype=np.float32)
+    img = np.ones((10, 10, 3), dtype=np.float32)
+    with pytest.raises(ValueError):
+        adv._sample_backscatter_points(depth, img, max_samples=10, sampling='bogus')
+
+
+_TRUE_ATTENUATION = [(0.4, -0.3, 0.2, -0.05), (0.6, -0.5, 0.1, -0.02), (1.2, -0.8, 0.3, -0.1)]
+
+
+def _attenuation_scene(adv, h=240, w=320):
+    """Inputs whose raw attenuation ratio follows known dual exponentials."""
+    rng = np.random.default_rng(5)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    depth = (0.5 + 8 * (yy / h) ** 2 + 0.3 * np.sin(xx / 40)).astype(np.float32)
+    ratio = np.stack([adv._attenuation_model(depth, *t) for t in _TRUE_ATTENUATION], axis=-1)
+    ratio += rng.normal(0, 0.05, ratio.shape)
+    img = np.full((h, w, 3), 0.5, dtype=np.float32)
+    B = np.zeros_like(img)
+    illum = (0.5 * np.exp(-ratio * depth[..., None])).astype(np.float32)
+    return depth, illum, img, B
+
+
+def _curves(adv, depth, coefs):
+    z = np.linspace(depth.min(), depth.max(), 100)
+    return np.array([adv._attenuation_model(z, *c) for c in coefs])
+
+
+@pytest.mark.parametrize('strategy', ['stratified', 'binned'])
+def test_sampled_attenuation_fit_matches_full_fit(adv, strategy):
+    depth, illum, img, B = _attenuation_scene(adv)
+    _, full = adv.estimate_beta(depth, illum, img, B, strategy='full')
+    beta_map, sampled = adv.estimate_beta(depth, illum, img, B, strategy=strategy)
+    assert beta_map.shape == img.shape
+    assert np.abs(_curves(adv, depth, sampled) - _curves(adv, depth, full)).max() < 0.01
+
+
+def test_attenuation_fit_warm_start_and_parallel(adv):
+    depth, illum, img, B = _attenuation_scene(adv)
+    _, serial = adv.estimate_beta(depth, illum, img, B, parallel=False)
+    _, parallel = adv.estimate_beta(depth, illum, img, B, parallel=True)
+    np.testing.assert_allclose(parallel, serial)
+    _, warm = adv.estimate_beta(depth, illum, img, B, p0=serial)
+    assert np.abs(_curves(adv, depth, warm) - _curves(adv, depth, serial)).max() < 1e-3
+
+
+def test_parallel_attenuation_fits_are_counted_in_the_request_trace(adv):
+    import metrics
+
+    depth, illum, img, B = _attenuation_scene(adv)
+    with metrics.trace() as trace:
+        with metrics.stage('beta_fit'):
+            adv.estimate_beta(depth, illum, img, B, parallel=True)
+    timings = metrics.breakdown(trace)
+    assert timings['curve_fit_evaluations']['attenuation'] >= 3
+    assert timings['stages']['beta_fit']['wall'] > 0
+
+
+def test_attenuation_fit_rejects_unknown_strategy(adv):
+    depth, illum, img, B = _attenuation_scene(adv, 8, 8)
+    with pytest.raises(ValueError):
+        adv.estimate_beta(depth, illum, img, B, strategy='bogus')
+
+
+def test_session_coefficients_are_reused_across_frames(adv, monkeypatch):
+    rng = np.random.default_rng(6)
+    depth = np.tile(np.linspace(1, 5, 64, dtype=np.float32), (48, 1))
+    frame = rng.integers(30, 200, size=(48, 64, 3), dtype=np.uint8)
+    adv.COEF_CACHE.clear()
+
+    calls = []
+    real_fit = adv.optimize.curve_fit
+
+    def counting_fit(*args, **kwargs):
+        calls.append(kwargs.get('p0'))
+        return real_fit(*args, **kwargs)
+
+    monkeypatch.setattr(adv.optimize, 'curve_fit', counting_fit)
+    first = adv.apply_advanced_sea_thru_array(frame, depth, session_id='dive-1')
+    assert len(calls) == 6
+    cached = adv.COEF_CACHE.lookup('dive-1')
+
+    calls.clear()
+    adv.apply_advanced_sea_thru_array(frame, depth, session_id='dive-1')
+    assert len(calls) == 6  # warm-started from the cached fit
+    np.testing.assert_allclose(calls[0], np.clip(cached['backscatter'][0], *adv._BACKSCATTER_BOUNDS))
+
+    calls.clear()
+    reused = adv.apply_advanced_sea_thru_array(frame, depth, session_id='dive-1', reuse_coefs=True)
+    assert calls == []
+    assert np.abs(reused.astype(int) - first.astype(int)).max() <= 2
+
+
+def test_frames_without_session_are_fitted_from_scratch(adv, monkeypatch):
+    rng = np.random.default_rng(6)
+    depth = np.tile(np.linspace(1, 5, 64, dtype=np.float32), (48, 1))
+    frame = rng.integers(30, 200, size=(48, 64, 3), dtype=np.uint8)
+    adv.COEF_CACHE.clear()
+    first = adv.apply_advanced_sea_thru_array(frame, depth)
+    assert len(adv.COEF_CACHE) == 0
+
+    calls = []
+    real_fit = adv.optimize.curve_fit
+
+    def counting_fit(*args, **kwargs):
+        calls.append(kwargs.get('p0'))
+        return real_fit(*args, **kwargs)
+
+    monkeypatch.setattr(adv.optimize, 'curve_fit', counting_fit)
+    adv.apply_advanced_sea_thru_array(frame, depth, session_id='other-dive')
+    again = adv.apply_advanced_sea_thru_array(frame, depth)
+    np.testing.assert_array_equal(again, first)
+    assert len(calls) == 12
+    for cold, fresh in zip(calls[:6], calls[6:]):  # same starting points as a cold fit
+        np.testing.assert_array_equal(fresh, cold)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numexpr'])
+def test_strip_correction_matches_whole_image(adv, monkeypatch, backend):
+    if backend == 'numexpr':
+        pytest.importorskip('numexpr')
+    import numeric
+    monkeypatch.setattr(numeric.config, 'ELEMENTWISE_BACKEND', backend)
+    rng = np.random.default_rng(7)
+    h, w = 150, 90
+    depth = np.tile(np.linspace(1, 5, h, dtype=np.float32)[:, None], (1, w))
+    frame = rng.integers(30, 200, size=(h, w, 3), dtype=np.uint8)
+    b_coefs, beta_coefs = adv.fit_coefficients(frame.astype(np.float32) / 255.0, depth)
+
+    img = frame.astype(np.float32) / 255.0
+    B = adv.backscatter_from_coefs(depth, b_coefs)
+    illum = adv.estimate_illumination(img, B)
+    expected = (img - B) * np.exp(adv.beta_from_coefs(depth, beta_coefs) * depth[:, :, None])
+    expected = (np.clip(expected / np.maximum(illum, 1e-6), 0, 1) * 255.0).astype(np.uint8)
+
+    monkeypatch.setattr(adv, 'TILE_ROWS', 32)
+    tiled = adv.apply_advanced_sea_thru_array(frame, depth)
+    assert np.abs(tiled.astype(int) - expected.astype(int)).max() <= 1
+
+
+def test_strip_scratch_fits_the_illumination_halo(adv, monkeypatch):
+    depth = np.tile(np.linspace(1, 5, 100, dtype=np.float32)[:, None], (1, 40))
+    frame = np.random.default_rng(8).integers(30, 200, size=(100, 40, 3), dtype=np.uint8)
+    monkeypatch.setattr(adv, 'TILE_ROWS', 32)
+    real_correct_rows = adv.correct_rows
+    spare = []
+
+    def checking_correct_rows(img, depth_rows, b, beta, start, stop, **kwargs):
+        spare.append(kwargs['scratch'].shape[1] - (stop - start))
+        return real_correct_rows(img, depth_rows, b, beta, start, stop, **kwargs)
+
+    monkeypatch.setattr(adv, 'correct_rows', checking_correct_rows)
+    adv.apply_advanced_sea_thru_array(frame, depth)
+    assert spare and min(spare) >= 2 * adv.ILLUMINATION_FILTER_SIZE
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('scipy')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+
+
+def _fake_depth_batch(images, batch_size=8, model_type=None, working_size=None):
+    results = []
+    for img in images:
+        depth = np.tile(np.linspace(1, 3, img.shape[1], dtype=np.float32), (img.shape[0], 1))
+        results.append({'average_depth': float(depth.mean()), 'depth_map': depth})
+    return results
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    for name in ('advanced_sea_thru', 'sea_thru', 'batch'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import batch as module
+    calls = []
+
+    def depth_batch(images, **kwargs):
+        calls.append(len(images))
+        return _fake_depth_batch(images, **kwargs)
+
+    monkeypatch.setattr(module, 'estimate_depth_batch', depth_batch)
+    module.depth_calls = calls
+    return module
+
+
+def _card(tmp_path, count=5):
+    card = tmp_path / 'card'
+    card.mkdir()
+    rng = np.random.default_rng(10)
+    for i in range(count):
+        cv2.imwrite(str(card / f'frame{i:03d}.png'), rng.integers(20, 200, size=(24, 32, 3), dtype=np.uint8))
+    (card / 'notes.txt').write_text('not an image')
+    return card
+
+
+def test_batch_processes_directory_in_depth_batches(batch, tmp_path):
+    card = _card(tmp_path)
+    out = tmp_path / 'out'
+    report = batch.run_batch(str(card), str(out), batch_size=2)
+    assert report['processed'] == 5
+    assert report['failed'] == []
+    assert batch.depth_calls == [2, 2, 1]
+    assert sorted(os.listdir(out)) == [f'frame{i:03d}.png' for i in range(5)]
+    assert report['images_per_second'] > 0
+    assert 'images/s' in batch.format_report(report)
+
+
+def test_batch_resumes_and_skips_up_to_date_outputs(batch, tmp_path):
+    card = _card(tmp_path, count=3)
+    out = tmp_path / 'out'
+    batch.run_batch(str(card / '*.png'), str(out))
+    stale = card / 'frame001.png'
+    later = time.time() + 10
+    os.utime(stale, (later, later))
+
+    report = batch.run_batch(str(card / '*.png'), str(out))
+    assert (report['processed'], report['skipped']) == (1, 2)
+    assert batch.run_batch(str(card), str(out), force=True)['processed'] == 3
+
+
+def test_batch_reports_undecodable_inputs(batch, tmp_path):
+    card = _card(tmp_path, count=2)
+    (card / 'broken.jpg').write_bytes(b'not a jpeg')
+    report = batch.run_batch(str(card), str(tmp_path / 'out'))
+    assert report['processed'] == 2
+    assert [os.path.basename(p) for p, _ in report['failed']] == ['broken.jpg']
+
+
+def test_batch_with_worker_processes(batch, tmp_path):
+    card = _card(tmp_path, count=4)
+    out = tmp_path / 'out'
+    report = batch.run_batch(str(card), str(out), jobs=2, batch_size=2)
+    assert report['processed'] == 4
+    import sea_thru
+    src = cv2.imread(str(card / 'frame002.png'))
+    expected = sea_thru.apply_sea_thru_array(src, _fake_depth_batch([src])[0]['depth_map'])
+    np.testing.assert_array_equal(cv2.imread(str(out / 'frame002.png')), expected)
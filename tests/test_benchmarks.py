@@ -0,0 +1,80 @@
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('scipy')
+
+BENCH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    # Real correction modules, not the stand-ins installed by test_main.
+    for name in ('advanced_sea_thru', 'sea_thru', 'image_analysis', 'bench_pipeline'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.syspath_prepend(BENCH_DIR)
+    import bench_pipeline
+    return bench_pipeline
+
+
+def test_synthetic_scene_has_known_depth(bench):
+    img, depth = bench.synthetic_scene(0.05)
+    assert img.shape[:2] == depth.shape == bench.scene_shape(0.05)
+    assert img.dtype == np.uint8
+    assert 0.5 < depth.min() and depth.max() < 11
+    # Red is attenuated most, so it darkens fastest with depth.
+    near, far = img[-10:].mean(axis=(0, 1)), img[:10].mean(axis=(0, 1))
+    assert (near - far)[2] > (near - far)[0]
+
+
+def test_run_times_every_stage_and_flags_regressions(bench):
+    results = bench.run([0.02], repeat=1)
+    stages = results['0.02MP']['stages']
+    expected = set(bench.STAGES) - ({'depth'} if 'depth' not in stages else set())
+    assert set(stages) == expected
+    assert all(r['seconds'] > 0 and r['peak_mb'] >= 0 for r in stages.values())
+    assert 'analysis' in bench.format_results(results)
+
+    assert bench.compare(results, results) == []
+    baseline = {'0.02MP': {'stages': {'analysis': {'seconds': 1e-9, 'peak_mb': -10.0}}}}
+    messages = bench.compare(results, baseline, min_seconds=0)
+    assert len(messages) == 2 and all(m.startswith('0.02MP analysis') for m in messages)
+    assert bench.compare(results, baseline) == [messages[1]]  # too fast to time reliably
+
+
+@pytest.fixture
+def bench_imports(monkeypatch):
+    monkeypatch.syspath_prepend(BENCH_DIR)
+    import bench_imports
+    return bench_imports
+
+
+def test_importtime_output_is_parsed(bench_imports):
+    stderr = ('import time: self [us] | cumulative | imported package\n'
+              'import time:       120 |        120 |   config\n'
+              'import time:       300 |       2500 | main\n')
+    assert bench_imports.parse_importtime(stderr) == {'config': 0.00012, 'main': 0.0025}
+
+
+def test_budget_flags_slow_and_heavy_imports(bench_imports):
+    results = {'main': {'seconds': 0.2, 'modules': ['config', 'main', 'scipy']}}
+    budget = {'main': {'max_ms': 100, 'forbidden': ['scipy', 'torch']}}
+    assert bench_imports.check(results, budget) == [
+        'main: 200 ms to import, budget 100 ms', 'main: imports scipy at start-up']
+    assert bench_imports.check(results, budget, timings=False) == ['main: imports scipy at start-up']
+
+
+def test_entry_points_defer_heavy_imports(bench_imports):
+    with open(bench_imports.BUDGET_PATH) as f:
+        budget = json.load(f)
+    # Checked without importing flask here, which would replace test_main's stand-in.
+    if importlib.util.find_spec('flask') is None:
+        pytest.skip('flask is not installed')
+    results = bench_imports.run(repeat=1)
+    assert set(results) == set(budget)
+    assert bench_imports.check(results, budget, timings=False) == []
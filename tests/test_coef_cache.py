@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import coef_cache  # type: ignore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_session_lookup_and_lru_eviction():
+    cache = coef_cache.CoefficientCache(max_entries=2, ttl=60, clock=FakeClock())
+    cache.store({'beta': 1}, session_id='a')
+    cache.store({'beta': 2}, session_id='b')
+    assert cache.lookup('a') == {'beta': 1}  # 'a' becomes most recently used
+    cache.store({'beta': 3}, session_id='c')
+    assert cache.lookup('b') is None
+    assert cache.lookup('a') == {'beta': 1}
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = coef_cache.CoefficientCache(max_entries=4, ttl=10, clock=clock)
+    cache.store({'beta': 1}, session_id='dive')
+    clock.now = 9
+    assert cache.lookup('dive') is not None
+    clock.now = 11
+    assert cache.lookup('dive') is None
+    assert len(cache) == 0
+
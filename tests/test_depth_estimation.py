@@ -0,0 +1,195 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+torch = pytest.importorskip('torch')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import depth_estimation  # type: ignore
+
+
+class TinyDepthNet(torch.nn.Module):
+    """Stand-in for MiDaS: (N, 3, H, W) -> (N, H, W)."""
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 1, 1)
+
+    def forward(self, x):
+        return self.conv(x).squeeze(1)
+
+
+def _transform(img_rgb):
+    x = torch.from_numpy(img_rgb).permute(2, 0, 1).float().unsqueeze(0) / 255.0
+    return torch.nn.functional.interpolate(x, size=(32, 32), mode='bilinear', align_corners=False)
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    calls = []
+
+    def load(repo, name):
+        calls.append(name)
+        if name == 'transforms':
+            return SimpleNamespace(dpt_transform=_transform, small_transform=_transform)
+        return TinyDepthNet()
+
+    monkeypatch.setattr(depth_estimation, '_models', {})
+    monkeypatch.setattr(depth_estimation, '_transforms', None)
+    depth_estimation._lazy_imports()
+    monkeypatch.setattr(depth_estimation._torch.hub, 'load', load)
+    return calls
+
+
+def test_transforms_and_models_are_resolved_once(hub):
+    img = np.zeros((40, 50, 3), dtype=np.uint8)
+    for _ in range(3):
+        result = depth_estimation.estimate_depth_array(img, model_type='MiDaS_small')
+    assert result['depth_map'].shape == (40, 50)
+    assert hub == ['MiDaS_small', 'transforms']
+
+
+def test_model_choice_loads_each_variant(hub):
+    img = np.zeros((16, 16, 3), dtype=np.uint8)
+    depth_estimation.estimate_depth_array(img, model_type='DPT_Hybrid')
+    depth_estimation.estimate_depth_array(img, model_type='MiDaS_small')
+    assert sorted(depth_estimation._models) == ['DPT_Hybrid', 'MiDaS_small']
+
+
+def test_warm_up_uses_configured_model(hub, monkeypatch):
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_MODEL', 'DPT_Hybrid')
+    depth_estimation.warm_up()
+    assert 'DPT_Hybrid' in depth_estimation._models
+
+
+def test_unknown_model_is_rejected(hub):
+    with pytest.raises(ValueError):
+        depth_estimation.load_model('DPT_Huge')
+
+
+def test_batch_matches_single_image_results(hub):
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, size=(24 + 8 * i, 40, 3), dtype=np.uint8) for i in range(5)]
+    model = depth_estimation.load_model('DPT_Large')
+    forward_calls = []
+    model.register_forward_hook(lambda m, inp, out: forward_calls.append(inp[0].shape[0]))
+
+    batched = depth_estimation.estimate_depth_batch(images, batch_size=2, model_type='DPT_Large')
+    assert forward_calls == [2, 2, 1]
+
+    for img, result in zip(images, batched):
+        single = depth_estimation.estimate_depth_array(img, model_type='DPT_Large')
+        assert result['depth_map'].shape == img.shape[:2]
+        np.testing.assert_allclose(result['depth_map'], single['depth_map'], rtol=1e-5, atol=1e-5)
+
+
+def test_batch_accepts_paths(hub, tmp_path):
+    import cv2
+
+    img = np.full((20, 30, 3), 128, dtype=np.uint8)
+    path = str(tmp_path / 'frame.png')
+    cv2.imwrite(path, img)
+    results = depth_estimation.estimate_depth_batch([path, img], batch_size=4)
+    assert [r['depth_map'].shape for r in results] == [(20, 30), (20, 30)]
+    np.testing.assert_allclose(results[0]['depth_map'], results[1]['depth_map'])
+
+
+def test_working_size_caps_depth_resolution(hub):
+    img = np.zeros((300, 400, 3), dtype=np.uint8)
+    result = depth_estimation.estimate_depth_array(img, working_size=100)
+    assert result['depth_map'].shape == (75, 100)
+
+
+def test_result_cache_skips_the_model(hub, monkeypatch, tmp_path):
+    monkeypatch.setattr(depth_estimation.config, 'RESULT_CACHE_DIR', str(tmp_path))
+    img = np.random.default_rng(1).integers(0, 255, size=(20, 30, 3), dtype=np.uint8)
+    first = depth_estimation.estimate_depth_array(img, model_type='MiDaS_small')
+    model = depth_estimation.load_model('MiDaS_small')
+    forward_calls = []
+    model.register_forward_hook(lambda m, inp, out: forward_calls.append(1))
+
+    again = depth_estimation.estimate_depth_array(img.copy(), model_type='MiDaS_small')
+    assert forward_calls == []
+    np.testing.assert_allclose(again['depth_map'], first['depth_map'])
+
+    depth_estimation.estimate_depth_array(img, model_type='MiDaS_small', working_size=10)
+    assert forward_calls == [1]
+
+
+class LinearDepthNet(torch.nn.Module):
+    """Stand-in with Linear layers, which dynamic quantisation targets."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.mix = torch.nn.Linear(3, 8)
+        self.out = torch.nn.Linear(8, 1)
+
+    def forward(self, x):
+        return self.out(torch.relu(self.mix(x.permute(0, 2, 3, 1)))).squeeze(-1)
+
+
+@pytest.fixture
+def linear_hub(hub, monkeypatch):
+    monkeypatch.setattr(depth_estimation, '_runners', {})
+    depth_estimation._models['MiDaS_small'] = LinearDepthNet().eval()
+    return hub
+
+
+@pytest.mark.parametrize('backend', ['quantized', 'torchscript'])
+def test_backends_match_the_eager_model(linear_hub, monkeypatch, backend):
+    assert depth_estimation.check_parity('MiDaS_small', backend) < 0.05
+    img = np.random.default_rng(2).integers(0, 255, size=(32, 48, 3), dtype=np.uint8)
+    eager = depth_estimation.estimate_depth_array(img, model_type='MiDaS_small')
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_BACKEND', backend)
+    result = depth_estimation.estimate_depth_array(img, model_type='MiDaS_small')
+    spread = np.ptp(eager['depth_map'])
+    assert np.abs(result['depth_map'] - eager['depth_map']).max() < 0.05 * spread
+    assert depth_estimation.get_runner('MiDaS_small') is depth_estimation.get_runner('MiDaS_small')
+
+
+def test_onnx_backend_exports_once_per_shape(linear_hub, monkeypatch, tmp_path):
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('onnxscript')
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_ONNX_DIR', str(tmp_path))
+    assert depth_estimation.check_parity('MiDaS_small', 'onnx') < 1e-4
+    assert [p.name for p in tmp_path.iterdir()] == ['MiDaS_small-Nx3x32x32.onnx']
+
+    runner = depth_estimation.depth_backends.build_runner(
+        depth_estimation.load_model('MiDaS_small'), 'onnx', 'MiDaS_small')
+    for size in (1, 4, 3):
+        assert runner(torch.rand(size, 3, 32, 32)).shape[0] == size
+    assert [p.name for p in tmp_path.iterdir()] == ['MiDaS_small-Nx3x32x32.onnx']
+
+
+def test_warm_up_rejects_a_backend_that_fails_parity(linear_hub, monkeypatch):
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_MODEL', 'MiDaS_small')
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_BACKEND', 'quantized')
+    monkeypatch.setattr(depth_estimation.depth_backends, 'parity_error', lambda ref, out: 0.5)
+    with pytest.raises(RuntimeError):
+        depth_estimation.warm_up()
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_PARITY_TOLERANCE', 0)
+    depth_estimation.warm_up()
+
+
+def test_unknown_backend_is_rejected(hub, monkeypatch):
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_BACKEND', 'tensorrt')
+    with pytest.raises(ValueError):
+        depth_estimation.estimate_depth_array(np.zeros((8, 8, 3), dtype=np.uint8))
+
+
+def test_depth_threads_are_applied(hub, monkeypatch):
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_THREADS', 1)
+    monkeypatch.setattr(depth_estimation, '_runners', {})
+    monkeypatch.setattr(depth_estimation.config, 'DEPTH_BACKEND', 'quantized')
+    previous = torch.get_num_threads()
+    try:
+        torch.set_num_threads(2)
+        depth_estimation.get_runner('MiDaS_small')
+        assert torch.get_num_threads() == 1
+    finally:
+        torch.set_num_threads(previous)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import depth_upsampling  # type: ignore
+
+
+def _scene(h=300, w=400):
+    """Two planes at different depths separated by a sharp vertical edge."""
+    depth = np.where(np.arange(w)[None, :] < w // 2, 2.0, 6.0).astype(np.float32)
+    depth = np.repeat(depth, h, axis=0)
+    img = np.empty((h, w, 3), dtype=np.uint8)
+    img[:, : w // 2] = (40, 120, 60)
+    img[:, w // 2:] = (160, 90, 20)
+    return img, depth
+
+
+def test_working_shape_caps_long_edge():
+    assert depth_upsampling.working_shape((3000, 4000), 1000) == (750, 1000)
+    assert depth_upsampling.working_shape((300, 400), 1000) == (300, 400)
+    assert depth_upsampling.working_shape((300, 400), 0) == (300, 400)
+
+
+def test_rows_match_full_upsample():
+    img, depth = _scene()
+    low = cv2.resize(depth, (100, 75), interpolation=cv2.INTER_AREA)
+    up = depth_upsampling.GuidedDepthUpsampler(low, img)
+    full = up.full()
+    assert full.shape == depth.shape
+    np.testing.assert_allclose(np.vstack([up.rows(0, 128), up.rows(128, 300)]), full, rtol=1e-6)
+
+
+def test_guided_upsampling_preserves_edges_better_than_bilinear():
+    img, depth = _scene()
+    low = cv2.resize(depth, (50, 38), interpolation=cv2.INTER_AREA)
+    guided = depth_upsampling.upsample_depth(low, img, radius=2, eps=1e-4)
+    bilinear = cv2.resize(low, (400, 300), interpolation=cv2.INTER_LINEAR)
+    assert np.abs(guided - depth).mean() < np.abs(bilinear - depth).mean()
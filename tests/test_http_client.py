@@ -0,0 +1,126 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import http_client  # type: ignore
+
+BODY = bytes(range(256)) * 4096  # 1 MiB
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    failures = {}
+    clients = set()
+    posts = []
+    puts = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _fail_first(self):
+        remaining = self.failures.get(self.path, 0)
+        if remaining:
+            self.failures[self.path] = remaining - 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return True
+        return False
+
+    def do_GET(self):
+        self.clients.add(self.client_address)
+        if self._fail_first():
+            return
+        self.send_response(200)
+        if self.path == '/chunked':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(BODY), 65536):
+                piece = BODY[start:start + 65536]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+    def do_POST(self):
+        self.posts.append(self.path)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self._fail_first():
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self._fail_first():
+            return
+        self.puts[self.path] = body
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    Handler.failures = {}
+    Handler.clients = set()
+    Handler.posts = []
+    Handler.puts = {}
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(http_client.config, 'HTTP_BACKOFF', 0)
+    monkeypatch.setattr(http_client, '_session', None)
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    http_client.get_session().close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_streams_to_file(server, tmp_path):
+    path = tmp_path / 'image.jpg'
+    assert http_client.download_to_file(server + '/image.jpg', str(path)) == len(BODY)
+    assert path.read_bytes() == BODY
+    assert http_client.download_bytes(server + '/chunked') == BODY
+
+
+def test_oversized_downloads_are_rejected(server, tmp_path):
+    path = tmp_path / 'image.jpg'
+    with pytest.raises(http_client.DownloadTooLargeError):
+        http_client.download_to_file(server + '/image.jpg', str(path), max_bytes=1000)
+    # Without Content-Length the limit is enforced while streaming.
+    with pytest.raises(http_client.DownloadTooLargeError):
+        http_client.download_to_file(server + '/chunked', str(path), max_bytes=100000)
+    assert os.listdir(tmp_path) == []
+
+
+def test_connections_are_reused(server):
+    for _ in range(5):
+        http_client.download_bytes(server + '/image.jpg')
+    assert len(Handler.clients) == 1
+
+
+def test_transient_errors_are_retried_for_get_only(server):
+    Handler.failures = {'/flaky': 2, '/submit': 1}
+    assert http_client.download_bytes(server + '/flaky') == BODY
+    response = http_client.get_session().post(server + '/submit', data=b'{}')
+    assert response.status_code == 503
+    assert Handler.posts == ['/submit']
+
+
+def test_upload_streams_file_and_retries(server, tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(BODY)
+    Handler.failures['/out.mp4'] = 1
+    http_client.upload_file(f'{server}/out.mp4', str(path))
+    assert Handler.puts['/out.mp4'] == BODY
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+
+
+@pytest.fixture
+def image_analysis(monkeypatch):
+    # test_main installs lightweight stand-ins; import the real module.
+    monkeypatch.delitem(sys.modules, 'image_analysis', raising=False)
+    import image_analysis
+    return image_analysis
+
+
+def test_matches_reference_statistics(image_analysis):
+    img = np.random.default_rng(0).integers(0, 256, size=(90, 120, 3), dtype=np.uint8)
+    result = image_analysis.analyze_image_array(img)
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    assert result['brightness'] == pytest.approx(hsv[:, :, 2].mean())
+    assert result['contrast'] == pytest.approx(img.std())
+    assert result['avg_red'] == pytest.approx(img[:, :, 2].mean())
+    assert result['avg_b'] == pytest.approx(img[:, :, 0].mean())
+    for i, c in enumerate('bgr'):
+        assert result['histograms'][c] == np.bincount(img[:, :, i].ravel(), minlength=256).tolist()
+
+
+def test_red_loss_and_clipping(image_analysis):
+    img = np.zeros((10, 10, 3), dtype=np.uint8)
+    img[..., 0] = 200   # blue
+    img[..., 1] = 100   # green
+    img[:5, :, 0] = 255
+    result = image_analysis.analyze_image_array(img)
+    assert result['red_loss'] == 1.0
+    assert result['clipped_shadows'] == {'b': 0.0, 'g': 0.0, 'r': 100.0}
+    assert result['clipped_highlights']['b'] == 50.0
+
+
+def test_stride_samples_the_image(image_analysis):
+    img = np.random.default_rng(1).integers(0, 256, size=(400, 600, 3), dtype=np.uint8)
+    full = image_analysis.analyze_image_array(img)
+    sampled = image_analysis.analyze_image_array(img, stride=4)
+    assert sum(sampled['histograms']['r']) == 100 * 150
+    assert sampled['brightness'] == pytest.approx(full['brightness'], rel=0.01)
+    assert sampled['contrast'] == pytest.approx(full['contrast'], rel=0.01)
+
+
+def test_sixteen_bit_images_match_their_eight_bit_version(image_analysis, monkeypatch):
+    monkeypatch.setattr(image_analysis, 'TILE_ROWS', 16)
+    img = np.random.default_rng(2).integers(0, 256, size=(50, 40, 3), dtype=np.uint8)
+    wide = image_analysis.analyze_image_array(img.astype(np.uint16) * 257)
+    assert wide == image_analysis.analyze_image_array(img)
@@ -0,0 +1,97 @@
+import io
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import image_io  # type: ignore
+
+
+def _png(img):
+    ok, buf = cv2.imencode('.png', img)
+    assert ok
+    return buf.tobytes()
+
+
+class Upload:
+    """Stand-in for werkzeug's ``FileStorage``."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+
+def test_uploads_decode_from_memory(tmp_path):
+    img = np.random.default_rng(0).integers(0, 255, size=(12, 16, 3), dtype=np.uint8)
+    data = _png(img)
+    np.testing.assert_array_equal(image_io.decode_image(data), img)
+    np.testing.assert_array_equal(image_io.read_upload(Upload(io.BytesIO(data))), img)
+    spooled = tmp_path / 'spooled'
+    spooled.write_bytes(data)
+    with open(spooled, 'rb') as f:
+        np.testing.assert_array_equal(image_io.read_upload(Upload(f)), img)
+
+
+def test_undecodable_data_is_rejected():
+    with pytest.raises(ValueError):
+        image_io.decode_image(b'not an image')
+
+
+def test_scratch_dirs_are_private_and_removed(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_io.config, 'SCRATCH_DIR', str(tmp_path / 'scratch'))
+    with image_io.scratch_dir() as first, image_io.scratch_dir() as second:
+        assert first != second
+        image_io.write_image(os.path.join(first, 'out.png'), np.zeros((2, 2, 3), np.uint8))
+    assert not os.path.exists(first) and not os.path.exists(second)
+    assert os.listdir(tmp_path / 'scratch') == []
+
+
+def _image16(h=20, w=24):
+    return np.random.default_rng(1).integers(0, 65536, size=(h, w, 3), dtype=np.uint16)
+
+
+@pytest.mark.parametrize('ext', ['.png', '.tif'])
+def test_sixteen_bit_round_trip(tmp_path, ext):
+    img = _image16()
+    path = image_io.write_image(str(tmp_path / f'img{ext}'), img)
+    np.testing.assert_array_equal(image_io.read_image(path, keep_depth=True), img)
+    assert image_io.read_image(path).dtype == np.uint8
+    np.testing.assert_array_equal(
+        image_io.decode_image(image_io.encode_image(img, ext), keep_depth=True), img)
+
+
+def test_eight_bit_formats_get_scaled_sixteen_bit_data(tmp_path):
+    img = np.full((8, 8, 3), 65535, dtype=np.uint16)
+    img[:4] = 0
+    written = image_io.read_image(image_io.write_image(str(tmp_path / 'img.jpg'), img))
+    assert written.dtype == np.uint8
+    assert written[:4].max() <= 2 and written[4:].min() >= 253
+    np.testing.assert_array_equal(image_io.to_uint8(img), np.where(img, 255, 0).astype(np.uint8))
+
+
+def test_tiffs_are_memory_mapped_both_ways(tmp_path):
+    pytest.importorskip('tifffile')
+    img = _image16()
+    src = str(tmp_path / 'in.tif')
+    cv2.imwrite(src, img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    mapped = image_io.read_image(src, keep_depth=True, mmap=True)
+    assert isinstance(mapped.base, np.memmap)
+    np.testing.assert_array_equal(mapped, img)
+
+    dst = str(tmp_path / 'out.tif')
+    out = image_io.create_output_image(dst, img.shape, img.dtype)
+    out[...] = mapped
+    assert image_io.write_image(dst, out) == dst
+    del out
+    np.testing.assert_array_equal(image_io.read_image(dst, keep_depth=True), img)
+    assert image_io.create_output_image(str(tmp_path / 'out.png'), img.shape, img.dtype) is None
+
+
+def test_compressed_tiffs_fall_back_to_decoding(tmp_path):
+    img = _image16()
+    path = str(tmp_path / 'packed.tif')
+    cv2.imwrite(path, img, [cv2.IMWRITE_TIFF_COMPRESSION, 5])
+    np.testing.assert_array_equal(image_io.read_image(path, keep_depth=True, mmap=True), img)
@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+from job_queue import JobQueue, QueueFullError  # type: ignore
+
+
+def _wait(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = queue.status(job_id)
+        if info['status'] in ('succeeded', 'failed'):
+            return info
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_thread_pool_runs_jobs_and_reports_results():
+    queue = JobQueue(workers=2, max_queued=2)
+    job_id = queue.submit(lambda x, y: x + y, 2, y=3)
+    info = _wait(queue, job_id)
+    assert info['status'] == 'succeeded'
+    assert info['result'] == 5
+    assert queue.status('missing') is None
+    queue.shutdown()
+
+
+def test_failed_jobs_report_the_error():
+    def boom():
+        raise RuntimeError('no depth')
+
+    queue = JobQueue(workers=1, max_queued=0)
+    info = _wait(queue, queue.submit(boom))
+    assert info == {**info, 'status': 'failed', 'error': 'no depth'}
+    queue.shutdown()
+
+
+def test_full_queue_applies_backpressure():
+    release = threading.Event()
+    queue = JobQueue(workers=1, max_queued=1)
+    running = queue.submit(release.wait)
+    queued = queue.submit(release.wait)
+    with pytest.raises(QueueFullError):
+        queue.submit(release.wait)
+    assert queue.status(queued)['status'] == 'queued'
+
+    release.set()
+    _wait(queue, running)
+    _wait(queue, queued)
+    _wait(queue, queue.submit(release.wait))  # slots are released on completion
+    queue.shutdown()
+
+
+def test_process_pool_executor():
+    queue = JobQueue(workers=1, max_queued=1, executor='process')
+    info = _wait(queue, queue.submit(pow, 2, 10), timeout=60)
+    assert info['result'] == 1024
+    queue.shutdown()
+
+
+def test_follow_up_runs_after_the_worker_is_released():
+    from concurrent.futures import Future
+
+    external = Future()
+    queue = JobQueue(workers=1, max_queued=0)
+    job_id = queue.submit(lambda: 'submitted', then=lambda result: external)
+    # The only slot is free again while the follow-up is pending.
+    deadline = time.time() + 10
+    while True:
+        try:
+            second = queue.submit(lambda: 2)
+            break
+        except QueueFullError:
+            assert time.time() < deadline
+            time.sleep(0.01)
+    assert _wait(queue, second)['result'] == 2
+    assert queue.status(job_id)['status'] == 'running'
+    external.set_result('finished')
+    assert _wait(queue, job_id)['result'] == 'finished'
+    queue.shutdown()
+
+
+def test_failed_follow_up_fails_the_job():
+    queue = JobQueue(workers=1, max_queued=0)
+
+    def follow_up(result):
+        raise RuntimeError(f'cannot track {result}')
+
+    info = _wait(queue, queue.submit(lambda: 'job', then=follow_up))
+    assert info['status'] == 'failed' and info['error'] == 'cannot track job'
+    queue.shutdown()
+
+
+def test_unknown_executor_is_rejected():
+    with pytest.raises(ValueError):
+        JobQueue(executor='celery')
+
+
+_inherited = 'cold'
+
+
+def _read_inherited():
+    return _inherited
+
+
+def test_started_workers_inherit_the_parent_state(monkeypatch):
+    monkeypatch.setattr(sys.modules[__name__], '_inherited', 'warm')
+    queue = JobQueue(workers=2, max_queued=2, executor='process', start_method='fork')
+    queue.start_workers()
+    # Forked before this change, so workers still see the preloaded state.
+    monkeypatch.setattr(sys.modules[__name__], '_inherited', 'late')
+    info = _wait(queue, queue.submit(_read_inherited), timeout=60)
+    assert info['result'] == 'warm'
+    queue.shutdown()
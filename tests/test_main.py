@@ -14,7 +14,10 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 if 'requests' not in sys.modules:
     sys.modules['requests'] = SimpleNamespace(get=lambda *a, **k: None, post=lambda *a, **k: None)
 if 'advanced_sea_thru' not in sys.modules:
-    sys.modules['advanced_sea_thru'] = SimpleNamespace(apply_advanced_sea_thru=lambda p, d: p)
+    sys.modules['advanced_sea_thru'] = SimpleNamespace(
+        apply_advanced_sea_thru=lambda p, d, **_: p,
+        apply_advanced_sea_thru_array=lambda img, d, **_: img,
+    )
 import main  # type: ignore
 
 
@@ -22,35 +25,38 @@ import main  # type: ignore
 def _patch_defaults():
     """Patch heavy dependencies for each test."""
     with (
+        patch('main.read_image', return_value=[[0]]),
+        patch('main.read_upload', return_value=[[0]]),
+        patch('main.decode_image', return_value=[[0]]),
+        patch('main.write_image', side_effect=lambda path, img: path),
         patch(
-            'main.estimate_depth',
+            'main.estimate_depth_array',
             return_value={'average_depth': 1.0, 'depth_map': [[1.0]]},
         ),
         patch(
-            'main.apply_sea_thru',
-            side_effect=lambda path, d, **_: path,
+            'main.apply_sea_thru_array',
+            side_effect=lambda img, d, **_: img,
         ),
         patch(
-            'main.analyze_image',
+            'main.analyze_image_array',
             return_value={'brightness': 0.5, 'contrast': 0.1, 'avg_red': 50},
         ),
         patch(
             'main.submit_photoshop_job',
             return_value=None,
         ),
-        patch('requests.get') as mget,
+        patch('main.download_bytes', return_value=b'data'),
     ):
-        mget.return_value = SimpleNamespace(content=b'data', raise_for_status=lambda: None)
         yield
 
 
 def test_process_image_url(tmp_path):
     image_url = 'http://example.com/test.jpg'
     output_url = 'http://example.com/out.jpg'
-    with patch('main.download_image') as dl:
-        dl.side_effect = lambda url, path: open(path, 'wb').write(b'data')
-        result = main.process_image(image_url=image_url, output_url=output_url)
+    result = main.process_image(image_url=image_url, output_url=output_url)
     assert result['status'] == 'submitted'
+    main.download_bytes.assert_called_once_with(image_url)
+    main.decode_image.assert_called_once_with(b'data', keep_depth=True)
     assert 'depth' in result['adjustments']
     assert 'analysis' in result['adjustments']
 
@@ -72,6 +78,65 @@ def test_process_image_file(tmp_path):
     assert result['status'] == 'submitted'
 
 
+def test_process_image_decodes_and_encodes_once(tmp_path):
+    out = str(tmp_path / 'out.jpg')
+    main.process_image(image_path='in.jpg', output_path=out)
+    main.read_image.assert_called_once_with('in.jpg', keep_depth=True, mmap=True)
+    main.write_image.assert_called_once_with(out, [[0]])
+    main.analyze_image_array.assert_called_once_with([[0]])
+
+
+def test_process_image_uses_private_scratch_space():
+    paths = []
+    main.submit_photoshop_job.side_effect = lambda path, *a, **k: paths.append(path)
+    for _ in range(2):
+        main.process_image(image_bytes=b'data', output_url='http://example.com/out.jpg')
+    assert paths[0] != paths[1]
+    assert not any(os.path.exists(os.path.dirname(p)) for p in paths)
+    main.decode_image.assert_called_with(b'data', keep_depth=True)
+
+
+def test_scratch_file_outlives_submission_until_photoshop_finishes():
+    from concurrent.futures import Future
+
+    paths = []
+    finished = Future()
+    main.submit_photoshop_job.side_effect = lambda path, *a, **k: paths.append(path) or {}
+    with patch('main.track_photoshop_job', return_value=finished):
+        main.process_image(image_bytes=b'data', output_url='http://example.com/out.jpg')
+    scratch = os.path.dirname(paths[0])
+    assert os.path.isdir(scratch)
+    finished.set_result({'outputs': [{'status': 'succeeded'}]})
+    assert not os.path.exists(scratch)
+
+
+def test_process_image_reports_stage_timings():
+    main.decode_image.return_value = SimpleNamespace(shape=(2000, 3000, 3))
+    result = main.process_image(image_url='http://example.com/in.jpg', output_path='out.jpg',
+                                include_timings=True)
+    stages = result['timings']['stages']
+    assert set(stages) == {'download', 'decode', 'depth', 'correct', 'analysis', 'encode'}
+    assert stages['decode']['megapixels'] == 6.0
+    assert all(stage['wall'] >= 0 and stage['cpu'] >= 0 for stage in stages.values())
+    assert 'timings' not in main.process_image(image_path='in.jpg', output_path='out.jpg')
+
+
+def test_process_image_requires_output():
+    with pytest.raises(ValueError):
+        main.process_image(image_path='in.jpg')
+    main.read_image.assert_not_called()
+
+
+class DummyResponse:
+    def __init__(self, data, mimetype=None, headers=None):
+        self.data = data
+        self.mimetype = mimetype
+        self.headers = headers or {}
+
+    def get_data(self):
+        return self.data
+
+
 def create_app(module_name='run_service'):
     import importlib
     sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
@@ -89,7 +154,8 @@ def create_app(module_name='run_service'):
             def test_client(self):
                 return None
         dummy = Dummy()
-        sys.modules['flask'] = SimpleNamespace(Flask=lambda name: dummy, request=None, jsonify=lambda d: d)
+        sys.modules['flask'] = SimpleNamespace(Flask=lambda name: dummy, Response=DummyResponse,
+                                               request=None, jsonify=lambda d: d)
     module = importlib.import_module(module_name)
     return module
 
@@ -124,6 +190,21 @@ def test_flask_endpoint_upload(tmp_path):
     assert resp['status'] == 'submitted'
 
 
+def test_flask_endpoint_rejects_bad_depth_model(tmp_path):
+    module = create_app()
+    payload = {'image_url': 'http://example.com/in.jpg', 'output_url': 'http://example.com/out.jpg',
+               'depth_model': 'DPT_Huge'}
+    req = SimpleNamespace(content_type='application/json', json=payload)
+    with (
+        patch.object(module, 'process_image', side_effect=ValueError('Unknown depth model')),
+        patch.object(module, 'request', req),
+        patch.object(module, 'jsonify', lambda d: d),
+    ):
+        resp, status = module.process()
+    assert status == 400
+    assert 'error' in resp
+
+
 def test_local_cli_invocation(tmp_path, monkeypatch):
     img_in = tmp_path / 'in.jpg'
     img_out = tmp_path / 'out.jpg'
@@ -145,3 +226,260 @@ def test_local_cli_invocation(tmp_path, monkeypatch):
     local_cli.main()
     assert called['image_path'] == str(img_in)
     assert called['output_path'] == str(img_out)
+
+
+def test_local_cli_leaves_histograms_out_of_the_summary(tmp_path, monkeypatch, capsys):
+    analysis = {'avg_r': 10.0, 'histograms': {'r': [0] * 256}}
+    monkeypatch.setattr('local_cli.process_image',
+                        lambda **kwargs: {'adjustments': {'analysis': analysis}})
+    monkeypatch.setattr('sys.argv', ['local_cli.py', str(tmp_path / 'in.jpg'), str(tmp_path / 'out.jpg')])
+    import local_cli
+    local_cli.main()
+    printed = capsys.readouterr().out
+    assert 'avg_r' in printed and 'histograms' not in printed
+
+    monkeypatch.setattr('sys.argv', ['local_cli.py', str(tmp_path / 'in.jpg'),
+                                     str(tmp_path / 'out.jpg'), '--histograms'])
+    local_cli.main()
+    assert 'histograms' in capsys.readouterr().out
+
+
+class FakeQueue:
+    def __init__(self, full=False):
+        self.full = full
+        self.submitted = []
+
+    def submit(self, fn, kwargs, then=None):
+        if self.full:
+            from job_queue import QueueFullError
+            raise QueueFullError('Job queue is full')
+        self.submitted.append(kwargs)
+        return 'job-1'
+
+    def status(self, job_id):
+        return {'id': job_id, 'status': 'running'} if job_id == 'job-1' else None
+
+
+def _json_request(payload):
+    return SimpleNamespace(content_type='application/json', json=payload)
+
+
+def test_jobs_endpoint_returns_job_id():
+    module = create_app()
+    queue = FakeQueue()
+    payload = {'image_url': 'http://example.com/in.jpg', 'output_url': 'http://example.com/out.jpg'}
+    with (
+        patch.object(module, 'get_job_queue', return_value=queue),
+        patch.object(module, 'request', _json_request(payload)),
+        patch.object(module, 'jsonify', lambda d: d),
+    ):
+        resp, status = module.submit_job()
+        assert (resp, status) == ({'id': 'job-1', 'status': 'queued'}, 202)
+        assert queue.submitted[0]['image_url'] == payload['image_url']
+        assert module.job_status('job-1')['status'] == 'running'
+        assert module.job_status('nope')[1] == 404
+
+
+def test_queued_job_frees_worker_at_submission_and_finishes_with_photoshop():
+    from concurrent.futures import Future
+
+    module = create_app()
+    submitted = {'_links': {'self': {'href': 'http://photoshop/status/1'}}}
+    main.submit_photoshop_job.side_effect = None
+    main.submit_photoshop_job.return_value = submitted
+    result = module.run_job({'image_bytes': b'data', 'output_url': 'http://example.com/out.jpg',
+                             'wait_for_photoshop': False})
+    assert main.submit_photoshop_job.call_args.kwargs == {'wait': False}
+    scratch = result['scratch_dir']
+    assert os.path.isdir(scratch)
+
+    tracked = Future()
+    with patch.object(module, 'track_photoshop_job', return_value=tracked) as track:
+        final = module.finish_job(result)
+    track.assert_called_once_with(submitted)
+    assert not final.done() and os.path.isdir(scratch)
+    tracked.set_result({'outputs': [{'status': 'succeeded'}]})
+    assert final.result(timeout=0)['status'] == 'completed'
+    assert final.result()['photoshop'] == {'outputs': [{'status': 'succeeded'}]}
+    assert not os.path.exists(scratch)
+
+
+def test_jobs_endpoint_rejects_when_queue_full():
+    module = create_app()
+    payload = {'image_url': 'http://example.com/in.jpg', 'output_url': 'http://example.com/out.jpg'}
+    with (
+        patch.object(module, 'get_job_queue', return_value=FakeQueue(full=True)),
+        patch.object(module, 'request', _json_request(payload)),
+        patch.object(module, 'jsonify', lambda d: d),
+    ):
+        resp, status = module.submit_job()
+    assert status == 429
+
+
+def test_local_cli_batch_mode(tmp_path, monkeypatch, capsys):
+    called = {}
+
+    def fake_run_batch(source, output_dir, **kwargs):
+        called.update(kwargs, source=source, output_dir=output_dir)
+        return {'processed': 2, 'skipped': 1, 'failed': [], 'wall': 1.0,
+                'images_per_second': 2.0, 'stages': dict.fromkeys(('decode', 'depth', 'correct', 'encode'), 0.0)}
+
+    import batch
+    monkeypatch.setattr(batch, 'run_batch', fake_run_batch)
+    monkeypatch.setattr('sys.argv', ['local_cli.py', str(tmp_path), str(tmp_path / 'out'), '--jobs', '3'])
+    import local_cli
+    local_cli.main()
+    assert called['source'] == str(tmp_path)
+    assert called['jobs'] == 3
+    assert '2.00 images/s' in capsys.readouterr().out
+
+
+def test_process_image_can_wait_for_photoshop():
+    main.submit_photoshop_job.return_value = {'outputs': [{'status': 'succeeded'}]}
+    result = main.process_image(image_path='in.jpg', output_url='http://example.com/out.jpg',
+                                wait_for_photoshop=True)
+    assert result['status'] == 'completed'
+    assert result['photoshop'] == {'outputs': [{'status': 'succeeded'}]}
+    assert main.submit_photoshop_job.call_args.kwargs == {'wait': True}
+
+
+def test_preview_returns_proxy_and_full_render_reuses_its_fit():
+    main.decode_image.return_value = SimpleNamespace(shape=(3000, 4000, 3))
+    with (
+        patch('main.resize_to', side_effect=lambda img, shape: img) as resize,
+        patch('main.working_shape', return_value=(768, 1024)),
+        patch('main.encode_image', return_value=b'jpeg'),
+    ):
+        result = main.preview_image(image_bytes=b'data')
+    assert result['image'] == b'jpeg'
+    assert resize.call_args.args[1] == (768, 1024)
+    assert main.estimate_depth_array.call_args.kwargs['working_size'] == 0
+    preview_id = result['preview_id']
+    assert main.apply_sea_thru_array.call_args.kwargs['session_id'] == preview_id
+
+    main.process_image(image_bytes=b'data', output_path='out.jpg', preview_id=preview_id)
+    options = main.apply_sea_thru_array.call_args.kwargs
+    assert (options['session_id'], options['reuse_coefs']) == (preview_id, True)
+
+
+def test_metrics_endpoint_exposes_stage_and_request_metrics():
+    module = create_app()
+    main.process_image(image_path='in.jpg', output_path='out.jpg')
+    with patch.object(module, 'request', _json_request({'image_url': 'http://example.com/in.jpg',
+                                                         'output_url': 'http://example.com/out.jpg'})):
+        module.process()
+    text = module.metrics_endpoint().get_data()
+    assert 'underwater_stage_seconds_count{stage="depth"}' in text
+    assert 'underwater_requests_total{endpoint="process",status="200"}' in text
+    assert 'process_max_resident_memory_bytes' in text
+
+
+def test_preview_endpoint_returns_jpeg():
+    module = create_app()
+    with (
+        patch.object(module, 'preview_image',
+                     return_value={'preview_id': 'abc', 'image': b'jpeg', 'adjustments': {}}),
+        patch.object(module, 'request', _json_request({'image_url': 'http://example.com/in.jpg'})),
+    ):
+        resp = module.preview()
+    assert resp.mimetype == 'image/jpeg'
+    assert resp.get_data() == b'jpeg'
+    assert resp.headers['X-Preview-Id'] == 'abc'
+
+
+def test_process_video_downloads_corrects_and_uploads():
+    report = {'frames': 3, 'fps': 1.5}
+    with (
+        patch('main.download_to_file') as download,
+        patch('main.correct_video', return_value=report) as correct,
+        patch('main.upload_file') as upload,
+    ):
+        result = main.process_video(video_url='http://example.com/dive.mov?sig=1',
+                                    output_url='http://example.com/out.mp4', keyframe_interval=6)
+    source = download.call_args.args[1]
+    assert source.endswith('input.mov')
+    assert correct.call_args.args[0] == source
+    assert correct.call_args.kwargs['keyframe_interval'] == 6
+    assert upload.call_args.args[0] == 'http://example.com/out.mp4'
+    assert result == {'status': 'completed', 'video': report}
+    assert not os.path.exists(os.path.dirname(source))
+
+
+def test_video_endpoint_spools_upload_and_queues_job():
+    module = create_app()
+    queue = FakeQueue()
+    saved = []
+
+    class Upload:
+        filename = 'dive.mov'
+
+        def save(self, path):
+            saved.append(path)
+            with open(path, 'wb') as f:
+                f.write(b'video')
+
+    req = SimpleNamespace(content_type='multipart/form-data', files={'video': Upload()},
+                          form={'output_url': 'http://example.com/out.mp4'})
+    with (
+        patch.object(module, 'get_job_queue', return_value=queue),
+        patch.object(module, 'request', req),
+    ):
+        resp, status = module.submit_video()
+    assert status == 202
+    kwargs = queue.submitted[0]
+    assert kwargs['video_path'] == saved[0] and saved[0].endswith('input.mov')
+
+    with patch.object(module, 'process_video', return_value={'status': 'completed'}) as run:
+        module.run_video_job(dict(kwargs))
+    assert run.call_args.kwargs['video_path'] == saved[0]
+    assert 'upload_dir' not in run.call_args.kwargs
+    assert not os.path.exists(kwargs['upload_dir'])
+
+
+def test_video_endpoint_requires_output_url():
+    module = create_app()
+    with patch.object(module, 'request', _json_request({'video_url': 'http://example.com/a.mp4'})):
+        resp, status = module.submit_video()
+    assert status == 400
+
+
+@pytest.mark.parametrize('interval', ['often', '0', '2.5'])
+def test_video_endpoint_rejects_invalid_keyframe_interval(interval):
+    module = create_app()
+    body = {'video_url': 'http://example.com/a.mp4', 'output_url': 'http://example.com/out.mp4',
+            'keyframe_interval': interval}
+    with patch.object(module, 'request', _json_request(body)), \
+            patch.object(module, 'get_job_queue') as queue:
+        resp, status = module.submit_video()
+    assert status == 400
+    assert 'keyframe_interval' in resp['error']
+    queue.assert_not_called()
+
+
+def test_local_cli_video_mode(tmp_path, monkeypatch, capsys):
+    called = {}
+
+    def fake_correct_video(source, destination, **kwargs):
+        called.update(kwargs, source=source, destination=destination)
+        return {'frames': 2, 'keyframes': 1, 'wall': 1.0, 'fps': 2.0,
+                'stages': dict.fromkeys(('decode', 'depth', 'flow', 'fit', 'correct', 'encode'), 0.0)}
+
+    monkeypatch.setattr('video.correct_video', fake_correct_video)
+    monkeypatch.setattr('sys.argv', ['local_cli.py', 'dive.MP4', 'out.mp4', '--keyframe-interval', '4'])
+    import local_cli
+    local_cli.main()
+    assert called['source'] == 'dive.MP4'
+    assert called['keyframe_interval'] == 4
+    assert '2.00 fps' in capsys.readouterr().out
+
+
+def test_preload_loads_the_model_before_starting_workers(monkeypatch):
+    module = create_app()
+    calls = []
+    queue = SimpleNamespace(start_workers=lambda: calls.append('workers'))
+    monkeypatch.setattr(module, 'load_model', lambda: calls.append('model'))
+    monkeypatch.setattr(module, 'get_transform', lambda: calls.append('transform'))
+    monkeypatch.setattr(module, 'get_job_queue', lambda: queue)
+    monkeypatch.setattr(module, 'warm_up', lambda: calls.append('inference'))
+    module.preload()
+    assert calls == ['model', 'transform', 'workers']
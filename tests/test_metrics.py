@@ -0,0 +1,93 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import config  # noqa: E402
+import metrics  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(monkeypatch):
+    monkeypatch.setattr(config, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(config, 'METRICS_TRACE_MEMORY', False)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_stage_records_histogram_and_cpu_counter():
+    with metrics.stage('decode', megapixels=2.0):
+        sum(range(1000))
+    text = metrics.render()
+    assert '# TYPE underwater_stage_seconds histogram' in text
+    assert 'underwater_stage_seconds_bucket{stage="decode",le="+Inf"} 1' in text
+    assert 'underwater_stage_seconds_count{stage="decode"} 1' in text
+    assert 'underwater_stage_megapixels_total{stage="decode"} 2.0' in text
+    assert 'underwater_stage_cpu_seconds_total{stage="decode"}' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    for value in (0.001, 0.2, 100.0):
+        metrics.observe('h', value)
+    text = metrics.render()
+    assert 'h_bucket{le="0.005"} 1' in text
+    assert 'h_bucket{le="0.25"} 2' in text
+    assert 'h_bucket{le="60.0"} 2' in text
+    assert 'h_bucket{le="+Inf"} 3' in text
+
+
+def test_trace_collects_repeated_stages_and_evaluations():
+    with metrics.trace() as trace:
+        for _ in range(2):
+            with metrics.stage('fit') as timer:
+                timer.megapixels = 1.5
+        metrics.count_evaluations('backscatter', 40)
+        metrics.count_evaluations('backscatter', 2)
+    with metrics.stage('outside'):
+        pass
+    timings = metrics.breakdown(trace)
+    assert set(timings['stages']) == {'fit'}
+    assert timings['stages']['fit']['megapixels'] == 3.0
+    assert timings['curve_fit_evaluations'] == {'backscatter': 42}
+
+
+def test_bind_carries_the_trace_into_worker_threads():
+    with metrics.trace() as trace:
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(metrics.bind(lambda _: metrics.count_evaluations('m', 1)), range(4)))
+        # Threads not bound to the trace only feed the global counters.
+        worker = threading.Thread(target=metrics.count_evaluations, args=('m', 10))
+        worker.start()
+        worker.join()
+    assert metrics.breakdown(trace)['curve_fit_evaluations'] == {'m': 4}
+    assert 'underwater_curve_fit_evaluations_total{model="m"} 14.0' in metrics.render()
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(config, 'METRICS_ENABLED', False)
+    with metrics.trace() as trace:
+        with metrics.stage('decode') as timer:
+            timer.megapixels = 1.0
+        metrics.count_evaluations('backscatter', 5)
+    assert metrics.breakdown(trace) == {'stages': {}, 'curve_fit_evaluations': {}}
+    assert 'underwater_' not in metrics.render()
+    assert metrics.stage('other').megapixels is None
+
+
+def test_memory_tracing_reports_stage_peak(monkeypatch):
+    import tracemalloc
+
+    monkeypatch.setattr(config, 'METRICS_TRACE_MEMORY', True)
+    tracemalloc.start()
+    try:
+        with metrics.trace() as trace:
+            with metrics.stage('alloc'):
+                block = bytearray(4 * 2 ** 20)
+                del block
+    finally:
+        tracemalloc.stop()
+    assert metrics.breakdown(trace)['stages']['alloc']['peak_mb'] >= 4
@@ -0,0 +1,205 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import photoshop_api  # type: ignore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_is_refreshed_before_expiry():
+    clock = FakeClock()
+    issued = iter(['t1', 't2'])
+    manager = photoshop_api.TokenManager(lambda: (next(issued), 1000), refresh_margin=100, clock=clock)
+    assert manager.get() == 't1'
+    clock.now = 899
+    assert manager.get() == 't1'
+    clock.now = 901
+    assert manager.get() == 't2'
+
+
+def test_concurrent_refreshes_are_coalesced():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return f't{len(calls)}', 3600
+
+    manager = photoshop_api.TokenManager(fetch, refresh_margin=0)
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [1]
+    assert tokens == ['t1'] * 8
+
+
+def test_callers_keep_valid_token_while_refresh_runs():
+    clock = FakeClock()
+    started = threading.Event()
+    release = threading.Event()
+    issued = []
+
+    def fetch():
+        issued.append(1)
+        if len(issued) == 2:
+            started.set()
+            release.wait(5)
+        return f't{len(issued)}', 1000
+
+    manager = photoshop_api.TokenManager(fetch, refresh_margin=100, clock=clock)
+    manager.get()
+    clock.now = 950
+    refresher = threading.Thread(target=manager.get)
+    refresher.start()
+    assert started.wait(5)
+    assert manager.get() == 't1'  # does not block on the refresh
+    release.set()
+    refresher.join()
+    assert manager.get() == 't2'
+
+
+def test_stale_invalidation_is_ignored():
+    issued = iter(['t1', 't2', 't3'])
+    manager = photoshop_api.TokenManager(lambda: (next(issued), 3600))
+    old = manager.get()
+    manager.invalidate(old)
+    assert manager.get() == 't2'
+    manager.invalidate(old)  # a second 401 for the same token
+    assert manager.get() == 't2'
+
+
+def test_job_is_retried_once_after_401(monkeypatch):
+    issued = iter(['expired', 'fresh'])
+    monkeypatch.setattr(photoshop_api, 'TOKENS', photoshop_api.TokenManager(lambda: (next(issued), 3600)))
+    sent = []
+
+    def request(method, url, headers, data, timeout):
+        sent.append(headers['Authorization'])
+        status = 401 if headers['Authorization'] == 'Bearer expired' else 200
+        return SimpleNamespace(status_code=status, raise_for_status=lambda: None,
+                               json=lambda: {'status': 'pending'})
+
+    monkeypatch.setattr(photoshop_api, 'get_session', lambda: SimpleNamespace(request=request))
+    result = photoshop_api.submit_photoshop_job('/tmp/x.jpg', 'http://out', {})
+    assert result == {'status': 'pending'}
+    assert sent == ['Bearer expired', 'Bearer fresh']
+
+
+class PhotoshopStub(BaseHTTPRequestHandler):
+    """Minimal Photoshop actions API: jobs finish after ``polls_needed`` status checks."""
+
+    protocol_version = 'HTTP/1.1'
+    polls_needed = 2
+    fail_jobs = set()
+    jobs = {}
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(0.05)
+        with cls.lock:
+            cls.active -= 1
+            job_id = str(len(cls.jobs))
+            cls.jobs[job_id] = {'polls': 0, 'output': payload['outputs'][0]['href']}
+        host, port = self.server.server_address
+        self._send({'_links': {'self': {'href': f'http://{host}:{port}/status/{job_id}'}}})
+
+    def do_GET(self):
+        job = self.jobs[self.path.rsplit('/', 1)[1]]
+        job['polls'] += 1
+        if job['output'] in self.fail_jobs:
+            state = 'failed'
+        elif job['polls'] >= self.polls_needed:
+            state = 'succeeded'
+        else:
+            state = 'running'
+        self._send({'outputs': [{'status': state, '_links': {'renditions': [{'href': job['output']}]}}]})
+
+
+@pytest.fixture
+def photoshop(monkeypatch):
+    PhotoshopStub.jobs = {}
+    PhotoshopStub.fail_jobs = set()
+    PhotoshopStub.active = PhotoshopStub.peak = 0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), PhotoshopStub)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address
+    monkeypatch.setattr(photoshop_api.config, 'PHOTOSHOP_ACTIONS_URL', f'http://{host}:{port}/actions')
+    monkeypatch.setattr(photoshop_api, 'TOKENS', photoshop_api.TokenManager(lambda: ('token', 3600)))
+    tracker = photoshop_api.PhotoshopJobTracker(max_concurrency=2, poll_interval=0.01,
+                                                max_poll_interval=0.05, timeout=5)
+    yield tracker
+    tracker.shutdown()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_tracker_resolves_futures_with_final_status(photoshop):
+    futures = photoshop.submit_many(
+        [(f'/tmp/{i}.jpg', f'http://out/{i}.jpg', {}) for i in range(6)]
+    )
+    results = [f.result(timeout=10) for f in futures]
+    assert [r['outputs'][0]['status'] for r in results] == ['succeeded'] * 6
+    assert {r['outputs'][0]['_links']['renditions'][0]['href'] for r in results} == {
+        f'http://out/{i}.jpg' for i in range(6)
+    }
+    assert all(job['polls'] == PhotoshopStub.polls_needed for job in PhotoshopStub.jobs.values())
+    assert PhotoshopStub.peak <= 2
+
+
+def test_tracker_reports_failed_jobs(photoshop):
+    PhotoshopStub.fail_jobs = {'http://out/bad.jpg'}
+    good = photoshop.submit('/tmp/a.jpg', 'http://out/good.jpg', {})
+    bad = photoshop.submit('/tmp/b.jpg', 'http://out/bad.jpg', {})
+    assert good.result(timeout=10)['outputs'][0]['status'] == 'succeeded'
+    with pytest.raises(photoshop_api.PhotoshopJobError):
+        bad.result(timeout=10)
+
+
+def test_tracker_follows_jobs_submitted_without_waiting(photoshop, monkeypatch):
+    monkeypatch.setattr(photoshop_api, '_tracker', photoshop)
+    response = photoshop_api.submit_photoshop_job('/tmp/a.jpg', 'http://out/a.jpg', {})
+    final = photoshop_api.track_photoshop_job(response).result(timeout=10)
+    assert final['outputs'][0]['status'] == 'succeeded'
+    assert photoshop_api.track_photoshop_job({'status': 'done'}).result(timeout=0) == {'status': 'done'}
+
+
+def test_job_state():
+    assert photoshop_api.job_state({'outputs': [{'status': 'succeeded'}, {'status': 'running'}]}) == 'pending'
+    assert photoshop_api.job_state({'outputs': [{'status': 'succeeded'}]}) == 'succeeded'
+    assert photoshop_api.job_state({'outputs': [{'status': 'failed'}]}) == 'failed'
+    assert photoshop_api.job_state({'status': 'pending'}) == 'pending'
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+import result_cache  # type: ignore
+
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path), max_bytes=1 << 20)
+    arr = np.arange(12, dtype=np.float32).reshape(3, 4)
+    assert cache.get('missing') is None
+    cache.put('k', arr)
+    hit = cache.get('k')
+    assert isinstance(hit, np.memmap)
+    np.testing.assert_array_equal(hit, arr)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    arr = np.zeros(1000, dtype=np.uint8)
+    cache = result_cache.ResultCache(str(tmp_path), max_bytes=2 * (arr.nbytes + 128))
+    cache.put('a', arr)
+    cache.put('b', arr)
+    os.utime(tmp_path / 'a.npy', (1, 1))
+    os.utime(tmp_path / 'b.npy', (2, 2))
+    cache.get('a')  # 'a' becomes most recently used
+    cache.put('c', arr)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+def test_keys_depend_on_content_and_parameters():
+    img = np.zeros((4, 4, 3), dtype=np.uint8)
+    other = img.copy()
+    other[0, 0, 0] = 1
+    assert result_cache.content_hash(img) == result_cache.content_hash(img.copy())
+    assert result_cache.content_hash(img) != result_cache.content_hash(other)
+    assert result_cache.content_hash(img) != result_cache.content_hash(img.astype(np.uint16))
+    h = result_cache.content_hash(img)
+    assert result_cache.make_key('depth', h, model='a') != result_cache.make_key('depth', h, model='b')
+    assert result_cache.make_key('depth', h, model='a') != result_cache.make_key('corrected', h, model='a')
+
+
+def test_cache_is_disabled_without_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache.config, 'RESULT_CACHE_DIR', '')
+    assert result_cache.get_result_cache() is None
+    monkeypatch.setattr(result_cache.config, 'RESULT_CACHE_DIR', str(tmp_path))
+    assert result_cache.get_result_cache().root == str(tmp_path)
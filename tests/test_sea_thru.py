@@ -0,0 +1,175 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('scipy')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+
+
+@pytest.fixture
+def sea_thru(monkeypatch):
+    """Import the real correction modules, bypassing stubs from other tests."""
+    for name in ('advanced_sea_thru', 'sea_thru'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import sea_thru as module
+    return module
+
+
+def _scene(h=48, w=64):
+    depth = np.tile(np.linspace(1.0, 5.0, w, dtype=np.float32), (h, 1))
+    ramp = np.linspace(40, 160, h, dtype=np.float32)[:, None, None]
+    img = (ramp * np.array([1.0, 0.8, 0.3], dtype=np.float32)).repeat(w, axis=1)
+    return img.astype(np.uint8), depth
+
+
+@pytest.mark.parametrize('advanced', [False, True])
+def test_array_api_returns_uint8_image(sea_thru, advanced):
+    img, depth = _scene()
+    out = sea_thru.apply_sea_thru_array(img, depth, advanced=advanced)
+    assert out.dtype == np.uint8
+    assert out.shape == img.shape
+
+
+def test_path_api_wraps_array_api(sea_thru, tmp_path):
+    img, depth = _scene()
+    src = str(tmp_path / 'in.png')
+    cv2.imwrite(src, img)
+    out_path = sea_thru.apply_sea_thru(src, depth)
+    assert out_path == str(tmp_path / 'in_seathru.jpg')
+    written = cv2.imread(out_path).astype(np.float32)
+    expected = sea_thru.apply_sea_thru_array(img, depth).astype(np.float32)
+    assert np.abs(written - expected).mean() < 4.0
+
+
+@pytest.mark.parametrize('advanced', [False, True])
+def test_reduced_resolution_depth_matches_full_resolution(sea_thru, advanced):
+    img, depth = _scene(h=240, w=320)
+    low = cv2.resize(depth, (80, 60), interpolation=cv2.INTER_AREA)
+    full = sea_thru.apply_sea_thru_array(img, depth, advanced=advanced).astype(np.float32)
+    reduced = sea_thru.apply_sea_thru_array(img, low, advanced=advanced).astype(np.float32)
+    assert reduced.shape == img.shape
+    assert np.abs(full - reduced).mean() < 2.0
+
+
+def test_basic_fit_is_reused_for_session(sea_thru, monkeypatch):
+    img, depth = _scene()
+    first = sea_thru.apply_sea_thru_array(img, depth, session_id='preview-1')
+    calls = []
+    monkeypatch.setattr(sea_thru, 'estimate_beta', lambda *a: calls.append(1))
+    again = sea_thru.apply_sea_thru_array(img, depth, session_id='preview-1', reuse_coefs=True)
+    assert calls == []
+    np.testing.assert_array_equal(again, first)
+
+
+def test_path_api_stores_and_reuses_session_fit(sea_thru, tmp_path, monkeypatch):
+    img, depth = _scene()
+    src = str(tmp_path / 'in.png')
+    cv2.imwrite(src, img)
+    sea_thru.apply_sea_thru(src, depth, session_id='dive-1')
+    assert sea_thru.COEF_CACHE.lookup(('basic', 'dive-1')) is not None
+    calls = []
+    monkeypatch.setattr(sea_thru, 'estimate_beta', lambda *a: calls.append(1))
+    sea_thru.apply_sea_thru(src, depth, session_id='dive-1', reuse_coefs=True)
+    assert calls == []
+
+
+def test_closed_form_beta_matches_polyfit(sea_thru):
+    rng = np.random.default_rng(3)
+    depth = rng.uniform(1, 6, size=(200, 300)).astype(np.float32)
+    img = np.clip(220 * np.exp(-np.array([0.05, 0.15, 0.4]) * depth[..., None])
+                  + rng.normal(0, 4, size=(200, 300, 3)), 0, 255).astype(np.uint8)
+    expected = []
+    for c in range(3):
+        slope, _ = np.polyfit(depth.ravel(), np.log(img[..., c].ravel() + 1e-6), 1)
+        expected.append(max(-slope, 0.0))
+    full = sea_thru.estimate_beta(depth, img, max_samples=None)
+    np.testing.assert_allclose(full, expected, rtol=1e-4, atol=1e-5)
+    sampled = sea_thru.estimate_beta(depth, img, max_samples=5000)
+    np.testing.assert_allclose(sampled, expected, rtol=0.05, atol=0.005)
+    assert full.dtype == np.float32
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numexpr'])
+def test_basic_correction_backends_agree(sea_thru, monkeypatch, backend):
+    if backend == 'numexpr':
+        pytest.importorskip('numexpr')
+    import numeric
+    img, depth = _scene()
+    beta = sea_thru.estimate_beta(depth, img)
+    expected = np.clip(img.astype(np.float32) * np.exp(depth[..., None] * beta), 0, 255).astype(np.uint8)
+    monkeypatch.setattr(numeric.config, 'ELEMENTWISE_BACKEND', backend)
+    out = sea_thru.apply_sea_thru_array(img, depth)
+    assert np.abs(out.astype(int) - expected.astype(int)).max() <= 1
+
+
+@pytest.mark.parametrize('advanced', [False, True])
+def test_sixteen_bit_images_keep_their_depth(sea_thru, advanced):
+    img, depth = _scene()
+    wide = img.astype(np.uint16) * 257
+    out8 = sea_thru.apply_sea_thru_array(img, depth, advanced=advanced).astype(np.float32)
+    out16 = sea_thru.apply_sea_thru_array(wide, depth, advanced=advanced)
+    assert out16.dtype == np.uint16
+    assert np.abs(out16 / np.float32(257) - out8).mean() < 1.0
+
+
+def test_correction_writes_into_out(sea_thru):
+    img, depth = _scene()
+    out = np.zeros_like(img)
+    assert sea_thru.apply_sea_thru_array(img, depth, out=out) is out
+    np.testing.assert_array_equal(out, sea_thru.apply_sea_thru_array(img, depth))
+
+
+def test_channel_reversed_views_are_corrected_like_copies(sea_thru):
+    img, depth = _scene()
+    rgb = np.ascontiguousarray(img[..., ::-1])
+    np.testing.assert_array_equal(sea_thru.apply_sea_thru_array(rgb[..., ::-1], depth),
+                                  sea_thru.apply_sea_thru_array(img, depth))
+
+
+@pytest.mark.parametrize('advanced', [False, True])
+def test_cached_result_restores_session_parameters(sea_thru, tmp_path, monkeypatch, advanced):
+    import config
+
+    monkeypatch.setattr(config, 'RESULT_CACHE_DIR', str(tmp_path))
+    img, depth = _scene()
+    first = sea_thru.apply_sea_thru_array(img, depth, advanced=advanced, session_id='fit-1')
+    fitted = sea_thru.COEF_CACHE.lookup(sea_thru._coef_key('fit-1', advanced))
+    hit = sea_thru.apply_sea_thru_array(img, depth, advanced=advanced, session_id='fit-2')
+    np.testing.assert_array_equal(hit, first)
+    restored = sea_thru.COEF_CACHE.lookup(sea_thru._coef_key('fit-2', advanced))
+    assert restored is not None
+    for name, value in fitted.items():
+        np.testing.assert_array_equal(restored[name], value)
+
+
+def test_warm_started_results_are_not_cached(sea_thru, tmp_path, monkeypatch):
+    import config
+    import result_cache
+
+    monkeypatch.setattr(config, 'RESULT_CACHE_DIR', str(tmp_path))
+    sea_thru.COEF_CACHE.clear()
+    img, depth = _scene()
+    cold = sea_thru.apply_sea_thru_array(img, depth, advanced=True, session_id='dive-1')
+    puts = []
+    monkeypatch.setattr(result_cache.ResultCache, 'put', lambda self, key, arr: puts.append(key))
+    sea_thru.apply_sea_thru_array(img[::-1].copy(), depth, advanced=True, session_id='dive-1')
+    assert puts == []
+    np.testing.assert_array_equal(sea_thru.apply_sea_thru_array(img, depth, advanced=True), cold)
+
+
+def test_memory_mapped_results_are_not_cached(sea_thru, tmp_path, monkeypatch):
+    import config
+    import result_cache
+
+    monkeypatch.setattr(config, 'RESULT_CACHE_DIR', str(tmp_path / 'cache'))
+    img, depth = _scene()
+    out = np.lib.format.open_memmap(str(tmp_path / 'out.npy'), mode='w+',
+                                    dtype=img.dtype, shape=img.shape)
+    puts = []
+    monkeypatch.setattr(result_cache.ResultCache, 'put', lambda self, key, arr: puts.append(key))
+    assert sea_thru.apply_sea_thru_array(img, depth, out=out) is out
+    assert puts == []
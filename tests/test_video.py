@@ -0,0 +1,123 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('scipy')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+
+
+@pytest.fixture
+def video(monkeypatch):
+    """Import the real modules with depth estimation replaced by a ramp."""
+    monkeypatch.delitem(sys.modules, 'advanced_sea_thru', raising=False)
+    monkeypatch.delitem(sys.modules, 'sea_thru', raising=False)
+    monkeypatch.delitem(sys.modules, 'video', raising=False)
+    import video as module
+
+    calls = []
+
+    def fake_depth(frame, model_type=None, working_size=None):
+        calls.append(working_size)
+        h, w = frame.shape[:2]
+        scale = 2.0 if len(calls) % 2 == 0 else 1.0  # MiDaS scale drifts
+        depth = np.tile(np.linspace(1, 8, h, dtype=np.float32)[:, None], (1, w)) * scale
+        return {'average_depth': float(depth.mean()), 'depth_map': depth}
+
+    monkeypatch.setattr(module, 'estimate_depth_array', fake_depth)
+    module.depth_calls = calls
+    return module
+
+
+def _scene(rng, h=96, w=128):
+    base = rng.integers(40, 200, size=(h // 8, w // 8, 3)).astype(np.uint8)
+    return cv2.resize(base, (w + 40, h), interpolation=cv2.INTER_CUBIC)
+
+
+def _write_clip(path, frames=20, cut=None, h=96, w=128):
+    rng = np.random.default_rng(0)
+    first, second = _scene(rng, h, w), _scene(rng, h, w)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 10, (w, h))
+    for i in range(frames):
+        scene = second if cut is not None and i >= cut else first
+        writer.write(np.ascontiguousarray(scene[:, i:i + w]))
+    writer.release()
+
+
+def test_video_is_streamed_with_keyframe_depth(video, tmp_path):
+    src, dst = tmp_path / 'dive.avi', tmp_path / 'out' / 'dive.avi'
+    _write_clip(src)
+    seen = []
+    report = video.correct_video(str(src), str(dst), keyframe_interval=8, codec='MJPG',
+                                 depth_working_size=64, progress=seen.append)
+    assert report['frames'] == 20
+    assert report['keyframes'] == 3
+    assert video.depth_calls == [64, 64, 64]
+    assert report['fps'] > 0 and set(report['stages']) == set(video.STAGES)
+    assert seen == list(range(1, 21))
+
+    capture = cv2.VideoCapture(str(dst))
+    assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 20
+    ok, frame = capture.read()
+    assert ok and frame.shape == (96, 128, 3)
+    capture.release()
+
+
+def test_scene_cut_starts_a_keyframe(video, tmp_path):
+    src, dst = tmp_path / 'dive.avi', tmp_path / 'out.avi'
+    _write_clip(src, frames=10, cut=5)
+    report = video.correct_video(str(src), str(dst), keyframe_interval=100, codec='MJPG')
+    assert report['keyframes'] == 2
+
+
+def test_max_frames_stops_early(video, tmp_path):
+    src, dst = tmp_path / 'dive.avi', tmp_path / 'out.avi'
+    _write_clip(src)
+    report = video.correct_video(str(src), str(dst), max_frames=4, codec='MJPG')
+    assert report['frames'] == 4
+
+
+def test_propagated_depth_follows_motion(video):
+    rng = np.random.default_rng(1)
+    key_grey = cv2.GaussianBlur(rng.integers(0, 255, (64, 96), dtype=np.uint8), (5, 5), 0)
+    grey = np.roll(key_grey, 3, axis=1)
+    key_depth = np.tile(np.arange(96, dtype=np.float32), (64, 1))
+    depth, difference = video.propagate_depth(key_depth, key_grey, grey)
+    inner = (slice(8, -8), slice(16, -16))
+    assert np.abs(depth[inner] - (key_depth[inner] - 3)).mean() < 0.5
+    assert difference < 0.2
+
+
+def test_parameters_are_smoothed_between_keyframes(video):
+    previous = {'beta': np.array([0.1, 0.2, 0.3])}
+    current = {'beta': np.array([0.3, 0.4, 0.5])}
+    blended = video.blend_parameters(previous, current, 0.25)
+    np.testing.assert_allclose(blended['beta'], [0.15, 0.25, 0.35])
+    assert video.blend_parameters(None, current, 0.25) is current
+
+
+def test_unreadable_video_is_rejected(video, tmp_path):
+    with pytest.raises(ValueError):
+        video.correct_video(str(tmp_path / 'missing.mp4'), str(tmp_path / 'out.mp4'))
+
+
+def test_frames_are_corrected_with_local_parameters(video, tmp_path, monkeypatch):
+    from coef_cache import COEF_CACHE
+
+    src, dst = tmp_path / 'dive.avi', tmp_path / 'out.avi'
+    _write_clip(src, frames=6)
+    correct = video.apply_sea_thru_array
+    used = []
+
+    def spy(frame, depth, **kwargs):
+        used.append(kwargs.get('params'))
+        COEF_CACHE.clear()  # evicted by other requests mid-video
+        return correct(frame, depth, **kwargs)
+
+    monkeypatch.setattr(video, 'apply_sea_thru_array', spy)
+    video.correct_video(str(src), str(dst), advanced=True, keyframe_interval=4, codec='MJPG')
+    assert len(used) == 6 and all(params is not None for params in used)
+    assert not [key for key in COEF_CACHE._entries if str(key).startswith('video-')]
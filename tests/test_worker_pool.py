@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('scipy')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'photoshop_underwater_plugin_bundle', 'flask_api')))
+
+
+@pytest.fixture
+def worker_pool(monkeypatch):
+    """Real correction modules with a stub depth model, inherited by forked workers."""
+    for name in ('advanced_sea_thru', 'sea_thru', 'worker_pool'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import worker_pool as module
+
+    def fake_depth(img, model_type=None, working_size=None):
+        if model_type == 'DPT_Huge':
+            raise ValueError('Unknown depth model')
+        depth = np.tile(np.linspace(1, 3, img.shape[1], dtype=np.float32), (img.shape[0], 1))
+        return {'average_depth': float(depth.mean()), 'depth_map': depth}
+
+    monkeypatch.setattr(module, 'estimate_depth_array', fake_depth)
+    return module, fake_depth
+
+
+def test_workers_correct_shared_images(worker_pool):
+    module, fake_depth = worker_pool
+    rng = np.random.default_rng(8)
+    images = [rng.integers(20, 200, size=(40 + i, 50, 3), dtype=np.uint8) for i in range(3)]
+    import sea_thru
+
+    with module.ModelWorkerPool(workers=2, warm=False, mp_context='fork') as pool:
+        futures = [pool.submit(img) for img in images]
+        results = [f.result(timeout=60) for f in futures]
+
+    for img, (corrected, adjustments) in zip(images, results):
+        expected = sea_thru.apply_sea_thru_array(img, fake_depth(img)['depth_map'])
+        np.testing.assert_array_equal(corrected, expected)
+        assert set(adjustments) == {'depth', 'analysis', 'timings'}
+
+
+def test_worker_errors_propagate(worker_pool):
+    module, _ = worker_pool
+    with module.ModelWorkerPool(workers=1, warm=False, mp_context='fork') as pool:
+        with pytest.raises(ValueError):
+            pool.correct(np.zeros((4, 4, 3), dtype=np.uint8), depth_model='DPT_Huge')
+
+
+def test_precomputed_depth_is_shared_with_workers(worker_pool, monkeypatch):
+    module, fake_depth = worker_pool
+    img = np.random.default_rng(9).integers(20, 200, size=(30, 40, 3), dtype=np.uint8)
+    depth = fake_depth(img)['depth_map']
+
+    def no_depth(*args, **kwargs):
+        raise AssertionError('depth should come from the parent')
+
+    monkeypatch.setattr(module, 'estimate_depth_array', no_depth)
+    import sea_thru
+
+    with module.ModelWorkerPool(workers=1, warm=False, mp_context='fork') as pool:
+        corrected, adjustments = pool.correct(img, depth_map=depth)
+    np.testing.assert_array_equal(corrected, sea_thru.apply_sea_thru_array(img, depth))
+    assert adjustments['depth']['average_depth'] == pytest.approx(depth.mean())